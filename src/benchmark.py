@@ -0,0 +1,501 @@
+"""Benchmark the pipeline functions on synthetic data, without network access.
+
+Usage (from the src folder):
+    python benchmark.py --sizes 1000 10000 100000 --output benchmark_results.json
+    python benchmark.py --sizes 1000 --compare benchmark_results.json
+
+Every size generates findthemasks requests, ideo survey rows, donors,
+hospitals and NYTimes rows of that many rows each, plus a county geojson
+with one square per county. The smallest size is also run on fixtures
+in which a few counties repeat their fips, as in the real sources. The files are served to the pipeline through
+an offline download cache, and each public function of data_download,
+data_process, geocode, math_custom and mapping is timed and memory
+profiled on them. Results are written as json, one record per function and
+size, so runs from different commits can be compared with --compare.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+import addfips
+import numpy as np
+import pandas as pd
+
+import download_cache
+
+# Urls the synthetic files are served under
+FIXTURE_URLS = {
+    'findthemasks': 'http://benchmark.local/findthemasks.json',
+    'ideo': 'http://benchmark.local/ideo.csv',
+    'ppe_donors': 'http://benchmark.local/ppe_donors.csv',
+    'zip_to_fips': 'http://benchmark.local/zip_to_fips.csv',
+    'zip_lat_lon': 'http://benchmark.local/US.txt',
+    'nytimes': 'http://benchmark.local/us-counties.csv',
+    'hospital': 'http://benchmark.local/hospitals.csv',
+    'county_geojson': 'http://benchmark.local/counties.json',
+    'county_fips': 'http://benchmark.local/county_Fips.txt',
+}
+
+DROP_OFF_COLUMN = ('Drop off instructions, eg curbside procedure or mailing address. '
+    'If you want donors to email or call you, please include contact info that can be made '
+    'public in this field:')
+
+FINDTHEMASKS_HEADERS = ['Timestamp', 'What is the name of the hospital or clinic?',
+    'Street address for dropoffs?', 'City', 'State?', 'Zip', 'What do you need?',
+    DROP_OFF_COLUMN, 'Lat', 'Lng']
+
+# Continental US, for the request and donor coordinates
+LAT_RANGE = (25.0, 49.0)
+LNG_RANGE = (-124.0, -67.0)
+
+
+# Counties that come more than once in the real sources: 29095 in the NYTimes data
+# (Kansas City is added to Jackson County) and the county geojson, and counties with
+# former or alternative names in the county fips list
+REPEATED_FIPS = ['29095', '02158', '11001']
+
+
+def county_list(aliases=False):
+    """Every county in the addfips data, with fips, name and state postal code.
+
+    addfips also lists former and alternative names of some counties, which
+    are left out unless aliases is set, so each fips comes once.
+    """
+    data_dir = os.path.join(os.path.dirname(addfips.__file__), 'data')
+    counties = pd.read_csv(os.path.join(data_dir, 'counties_2015.csv'), dtype=str)
+    states = pd.read_csv(os.path.join(data_dir, 'states.csv'), dtype=str)
+    counties = counties.merge(states.rename(columns={'name': 'state', 'fips': 'statefp'}),
+        on='statefp')
+    counties['fips'] = counties['statefp'] + counties['countyfp']
+    if not aliases:
+        counties = counties.drop_duplicates(subset='fips')
+    return counties[['fips', 'name', 'state', 'postal']].reset_index(drop=True)
+
+
+def synthetic_county_geojson(counties, points_per_side=8):
+    # One square per county on a grid, with points along every side like real borders
+    n = len(counties)
+    columns = int(np.ceil(np.sqrt(n)))
+    size = 0.25
+    t = np.linspace(0, 1, points_per_side, endpoint=False)
+    features = []
+    for i, row in enumerate(counties.itertuples()):
+        x0 = LNG_RANGE[0] + (i % columns) * size
+        y0 = LAT_RANGE[0] + (i // columns) * size
+        corners = np.array([[x0, y0], [x0 + size, y0], [x0 + size, y0 + size], [x0, y0 + size]])
+        ring = np.vstack([a + np.outer(t, b - a) for a, b in zip(corners, np.roll(corners, -1, axis=0))])
+        ring = np.vstack([ring, ring[:1]]).round(6).tolist()
+        features.append({
+            'type': 'Feature',
+            'properties': {'GEO_ID': '0500000US' + row.fips, 'STATE': row.fips[:2],
+                'COUNTY': row.fips[2:], 'NAME': row.name.replace(' County', ''),
+                'LSAD': 'County', 'CENSUSAREA': 100.0},
+            'geometry': {'type': 'Polygon', 'coordinates': [ring]},
+            'id': row.fips,
+        })
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def synthetic_fixtures(n_rows, seed=0, repeated_fips=False):
+    """Deterministic synthetic payloads of n_rows rows each, as {source: bytes}.
+
+    Every fips is one county. With repeated_fips, the counties of REPEATED_FIPS
+    come twice in the NYTimes data and the county geojson, and the county fips
+    list has the alias names of addfips, as in the real sources.
+    """
+    rng = np.random.RandomState(seed)
+    counties = county_list()
+    n_counties = len(counties)
+    repeated = counties[counties['fips'].isin(REPEATED_FIPS if repeated_fips else [])]
+    fixtures = {}
+
+    # findthemasks: a json sheet, header row and an instructions row before the requests
+    lats = rng.uniform(*LAT_RANGE, size=n_rows).round(6)
+    lngs = rng.uniform(*LNG_RANGE, size=n_rows).round(6)
+    county_of_row = rng.randint(0, n_counties, size=n_rows)
+    needs = np.array(['N95 masks', 'Surgical masks', 'Gowns', 'Face shields', 'Gloves'])
+    postal = counties['postal'].values[county_of_row]
+    values = [FINDTHEMASKS_HEADERS, ['instructions'] * len(FINDTHEMASKS_HEADERS)]
+    values.extend(['2020-04-%02d' % (1 + i % 28), 'Hospital %d' % i, '%d Main St' % i,
+            'City %d' % (i % 977), postal[i], '%05d' % (i % 99999),
+            needs[i % len(needs)], 'Curbside pickup at door %d' % (i % 7),
+            str(lats[i]), str(lngs[i])] for i in range(n_rows))
+    fixtures['findthemasks'] = json.dumps({'values': values}).encode()
+
+    # zip to fips: a zip code per county and then some
+    n_zips = max(n_counties, min(n_rows, 40000))
+    zip_county = np.concatenate([np.arange(n_counties), rng.randint(0, n_counties, n_zips - n_counties)])
+    zips = pd.DataFrame({
+        'zip': np.arange(n_zips) * (99999 // n_zips) + 501,
+        'fips': counties['fips'].values[zip_county].astype(int),
+        'county': counties['name'].values[zip_county],
+        'state': counties['postal'].values[zip_county],
+        'classfp': 'H1',
+    })
+    fixtures['zip_to_fips'] = zips.to_csv(index=False).encode()
+    # GeoNames style coordinates of the zip codes, tab separated without a header
+    fixtures['zip_lat_lon'] = pd.DataFrame({
+        'country': 'US', 'zip': zips['zip'].map('{:05d}'.format), 'place': 'Place', 'state_name': 'State',
+        'state': zips['state'], 'county_name': zips['county'], 'county_code': '001',
+        'community_name': '', 'community_code': '',
+        'lat': rng.uniform(*LAT_RANGE, size=n_zips).round(4),
+        'lon': rng.uniform(*LNG_RANGE, size=n_zips).round(4), 'accuracy': 4,
+    }).to_csv(sep='\t', header=False, index=False).encode()
+
+    # ideo survey and donors, by zip code
+    row_zips = zips['zip'].values[rng.randint(0, n_zips, size=n_rows)]
+    fixtures['ideo'] = pd.DataFrame({
+        'zip': row_zips,
+        'state': zips.set_index('zip').loc[row_zips, 'state'].values,
+        'institution': ['Institution %d' % i for i in range(n_rows)],
+        'need': needs[np.arange(n_rows) % len(needs)],
+        'quantity': rng.randint(1, 10000, size=n_rows),
+    }).to_csv(index=False).encode()
+    fixtures['ppe_donors'] = pd.DataFrame({
+        'Name': ['Donor %d' % i for i in range(n_rows)],
+        'Institution or Affiliation': ['Affiliation %d' % (i % 500) for i in range(n_rows)],
+        'Zip Code': rng.choice(zips['zip'].values, size=n_rows),
+        'State': 'XX',
+    }).to_csv(index=False).encode()
+
+    # hospitals, with upper case county names as in the source and a few negative bed counts
+    hospital_county = rng.randint(0, n_counties, size=n_rows)
+    fixtures['hospital'] = pd.DataFrame({
+        'NAME': ['Hospital %d' % i for i in range(n_rows)],
+        'COUNTY': counties['name'].str.replace(' County', '').str.upper().values[hospital_county],
+        'STATE': counties['postal'].values[hospital_county],
+        'BEDS': np.where(rng.rand(n_rows) < 0.01, -999, rng.randint(0, 500, size=n_rows)),
+    }).to_csv(index=False).encode()
+
+    # NYTimes history: one row per county and day, sorted by date, cumulative counts
+    # the repeated counties last, so the latest day holds both of their rows
+    reported = pd.concat([counties[~counties.index.isin(repeated.index)], repeated, repeated],
+        ignore_index=True)
+    n_days = int(np.ceil(n_rows / len(reported)))
+    dates = pd.date_range(end='2020-04-22', periods=n_days).strftime('%Y-%m-%d')
+    cases = np.cumsum(rng.poisson(3, size=(n_days, len(reported))), axis=0)
+    nytimes = pd.DataFrame({
+        'date': np.repeat(dates, len(reported)),
+        'county': np.tile(reported['name'].str.replace(' County', '').values, n_days),
+        'state': np.tile(reported['state'].values, n_days),
+        'fips': np.tile(reported['fips'].astype(int).values, n_days),
+        'cases': cases.ravel(),
+        'deaths': cases.ravel() // 20,
+    }).iloc[-n_rows:]
+    fixtures['nytimes'] = nytimes.to_csv(index=False).encode()
+    fixtures['nytimes_date'] = dates[-1]
+
+    # a repeated county is a second square with the same id
+    fixtures['county_geojson'] = json.dumps(synthetic_county_geojson(reported)).encode()
+    county_fips = county_list(aliases=True) if repeated_fips else counties
+    fixtures['county_fips'] = county_fips[['fips', 'name', 'state']].to_csv(index=False).encode()
+    return fixtures
+
+
+def serve_fixtures(fixtures, cache_dir):
+    """Offline download cache holding the fixtures under FIXTURE_URLS"""
+    cache = download_cache.configure(cache_dir=cache_dir, max_mb=1e6, offline=True)
+    for source, url in FIXTURE_URLS.items():
+        cache.put(url, fixtures[source])
+    return cache
+
+
+def _rows(value):
+    if isinstance(value, (pd.DataFrame, pd.Series, list, np.ndarray)):
+        return len(value)
+    if isinstance(value, tuple):
+        return sum(_rows(v) for v in value)
+    return None
+
+
+def _copy(value):
+    # Most functions modify the frames they are given, so every run gets its own copy
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy()
+    return value
+
+
+def _fresh(args, kwargs):
+    return [_copy(a) for a in args], {k: _copy(v) for k, v in kwargs.items()}
+
+
+def measure(func, args, kwargs, repeat=3, memory=True):
+    """Best wall and cpu time of repeat runs, plus the tracemalloc peak of one more run"""
+    result = None
+    wall, cpu = [], []
+    for _ in range(repeat):
+        run_args, run_kwargs = _fresh(args, kwargs)
+        start_wall, start_cpu = time.perf_counter(), time.process_time()
+        result = func(*run_args, **run_kwargs)
+        wall.append(time.perf_counter() - start_wall)
+        cpu.append(time.process_time() - start_cpu)
+
+    peak_mb = None
+    if memory:
+        run_args, run_kwargs = _fresh(args, kwargs)
+        tracemalloc.start()
+        try:
+            func(*run_args, **run_kwargs)
+            peak_mb = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+        finally:
+            tracemalloc.stop()
+
+    rows_in = sum(r for r in (_rows(a) for a in list(args) + list(kwargs.values())) if r is not None)
+    return result, {'seconds': min(wall), 'cpu_seconds': min(cpu), 'peak_mb': peak_mb,
+        'rows_in': rows_in, 'rows_out': _rows(result)}
+
+
+def benchmark_cases(fixtures, out_dir):
+    """(module, function name, callable, args(state) -> (args, kwargs), state key) in run order.
+
+    state holds the results of earlier cases, so each stage runs on the
+    output of the stage before it, as in create_figures.
+    """
+    import data_download as dd
+    import data_process as dp
+    import geocode
+    import math_custom as mc
+    import mapping
+    import matching
+    import zip_lookup
+
+    def html(name):
+        return os.path.join(out_dir, name + '.html')
+
+    def donor_args(s):
+        df = s['requestor_df']
+        donors = df.sample(frac=0.5, random_state=0)
+        return (df['lat'].values, df['lon'].values, donors['lat'].values, donors['lon'].values)
+
+    def layer(s, label):
+        df = s['merged_covid_ppe_hosp_df']
+        return dict(label=label, locations=df.fips, z=df.cases, text=df.county,
+            colorscale='Viridis', zmin=0, zmax=500, title=label, colorbar_title=label)
+
+    u = FIXTURE_URLS
+    date = fixtures['nytimes_date']
+    return [
+        # data_download
+        ('data_download', 'download_findthemasks_data', dd.download_findthemasks_data,
+            lambda s: ((u['findthemasks'], {}), {}), 'findthemasks_df'),
+        ('data_download', 'download_zip_to_fips_data', dd.download_zip_to_fips_data,
+            lambda s: ((u['zip_to_fips'],), {}), 'zip_fips_df'),
+        ('zip_lookup', 'build_zip_lookup_table', zip_lookup.build_zip_lookup_table,
+            lambda s: ((s['zip_fips_df'], u['zip_lat_lon']), {}), 'zip_table'),
+        ('zip_lookup', 'zip_lookup_table.lookup', lambda table, zips: table.lookup(zips),
+            lambda s: ((s['zip_table'], s['zip_fips_df']['zip']), {}), None),
+        ('data_download', 'download_ideo_merged_data', dd.download_ideo_merged_data,
+            lambda s: ((u['ideo'], s['zip_table']), {'write_out_checkpoint': False}), 'mask_df'),
+        ('data_download', 'download_PPE_donors', dd.download_PPE_donors,
+            lambda s: ((u['ppe_donors'],), {}), 'ppe_donors_df'),
+        ('data_download', 'read_nytimes_county_data', dd.read_nytimes_county_data,
+            lambda s: ((download_cache.cached_path(u['nytimes']), date), {}), None),
+        ('data_download', 'download_nytimes_data', dd.download_nytimes_data,
+            lambda s: ((u['nytimes'], date), {'write_out_checkpoint': False}), 'covid_df'),
+        ('data_download', 'download_hospital_data', dd.download_hospital_data,
+            lambda s: ((u['hospital'],), {'write_out_checkpoint': False}), 'hospital_df'),
+
+        # geocode
+        ('geocode', 'geocoder', geocode.geocoder,
+            lambda s: ((u['county_fips'],), {'cache_path': None}), 'geocoder'),
+        ('geocode', 'geocoder.get_geocoder_info_from_rg_vector',
+            lambda g, lats, lngs: g.get_geocoder_info_from_rg_vector(lats, lngs),
+            lambda s: ((geocode.geocoder(u['county_fips'], cache_path=None),
+                s['findthemasks_df']['Lat'], s['findthemasks_df']['Lng']), {}), None),
+
+        # data_process
+        ('data_process', 'add_fips_county_info_v2', dp.add_fips_county_info_v2,
+            lambda s: ((s['findthemasks_df'], geocode.geocoder(u['county_fips'], cache_path=None)), {}),
+            'findthemasks_fips_df'),
+        ('data_process', 'requests_per_county', dp.requests_per_county,
+            lambda s: ((s['mask_df'],), {'write_out_checkpoint': False}), 'mask_df_counties'),
+        ('data_process', 'download_county_geojson', dp.download_county_geojson,
+            lambda s: ((u['county_geojson'],), {}), 'counties'),
+        ('geocode', 'geocoder.get_geocoder_info_from_polygons_vector',
+            lambda g, lats, lngs: g.get_geocoder_info_from_polygons_vector(lats, lngs),
+            lambda s: ((geocode.geocoder(u['county_fips'], cache_path=None, engine='polygon',
+                counties=s['counties']), s['findthemasks_df']['Lat'], s['findthemasks_df']['Lng']), {}), None),
+        ('data_process', 'merge_county_geojson_df', dp.merge_county_geojson_df,
+            lambda s: ((s['counties'], s['mask_df_counties']), {}), 'merged_df'),
+        ('data_process', 'add_all_ppe_requests_to_merged_df', dp.add_all_ppe_requests_to_merged_df,
+            lambda s: ((s['mask_df'], s['merged_df']), {}), None),
+        ('data_process', 'merge_covid_ppe_df', dp.merge_covid_ppe_df,
+            lambda s: ((s['covid_df'], s['merged_df']), {}), 'merged_covid_ppe_df'),
+        ('data_process', 'process_hospital_data', dp.process_hospital_data,
+            lambda s: ((s['hospital_df'],), {'write_out_checkpoint': False}), 'hospital_df_counties'),
+        ('data_process', 'merge_covid_ppe_hosp_df', dp.merge_covid_ppe_hosp_df,
+            lambda s: ((s['hospital_df_counties'], s['merged_covid_ppe_df']), {}),
+            'merged_covid_ppe_hosp_df'),
+        ('data_process', 'calculate_covid_per_bed_available', dp.calculate_covid_per_bed_available,
+            lambda s: ((s['merged_covid_ppe_hosp_df'],), {}), 'merged_covid_ppe_hosp_df'),
+        ('data_process', 'calculate_covid_cases_per_ppe_request', dp.calculate_covid_cases_per_ppe_request,
+            lambda s: ((s['merged_covid_ppe_hosp_df'],), {}), 'merged_covid_ppe_hosp_df'),
+        ('data_process', 'find_counties_with_covid19_and_no_ppe_request',
+            dp.find_counties_with_covid19_and_no_ppe_request,
+            lambda s: ((s['covid_df'], s['mask_df_counties']), {}), None),
+        ('data_process', 'add_fips_ppe_donors', dp.add_fips_ppe_donors,
+            lambda s: ((s['ppe_donors_df'], s['zip_table']), {}), 'ppe_donors_with_zip_df'),
+        ('data_process', 'donors_per_county', dp.donors_per_county,
+            lambda s: ((s['ppe_donors_with_zip_df'], s['merged_covid_ppe_hosp_df']), {}),
+            'merged_covid_ppe_hosp_donors_df'),
+        ('data_process', 'calculate_donor_per_requester', dp.calculate_donor_per_requester,
+            lambda s: ((s['merged_covid_ppe_hosp_donors_df'],), {}), None),
+        ('data_process', 'create_requestor_df_for_querying_requesters',
+            dp.create_requestor_df_for_querying_requesters,
+            lambda s: ((s['findthemasks_fips_df'], s['merged_covid_ppe_hosp_df']), {}), 'requestor_df'),
+
+        # math_custom
+        ('math_custom', 'haversine', mc.haversine,
+            lambda s: ((s['requestor_df']['lat'].values, s['requestor_df']['lon'].values,
+                s['requestor_df']['lat'].values[::-1], s['requestor_df']['lon'].values[::-1]), {}), None),
+        ('math_custom', 'spatial_index', mc.spatial_index,
+            lambda s: ((s['requestor_df']['lat'].values, s['requestor_df']['lon'].values), {}),
+            'spatial_index'),
+        ('math_custom', 'spatial_index.k_nearest', lambda index, q: index.k_nearest(q, 5),
+            lambda s: ((s['spatial_index'], s['requestor_df'][['lat', 'lon']].values), {}), None),
+        ('math_custom', 'k5_closest', mc.k5_closest,
+            lambda s: ((s['requestor_df'][['lat', 'lon']].to_dict('records'),
+                {'lat': 39.0, 'lon': -98.0}), {}), None),
+
+        # matching, with half as many donors as requesters at the requesters' positions
+        ('matching', 'match_requesters', matching.match_requesters,
+            lambda s: (donor_args(s), {'capacity': 2}), None),
+        ('matching', 'match_requesters greedy', matching.match_requesters,
+            lambda s: (donor_args(s), {'capacity': 2, 'method': 'greedy'}), None),
+
+        # mapping
+        ('mapping', 'choropleth_mapbox_usa_plot', mapping.choropleth_mapbox_usa_plot,
+            lambda s: ((s['counties'], s['merged_covid_ppe_hosp_df'].fips,
+                s['merged_covid_ppe_hosp_df'].cases, s['merged_covid_ppe_hosp_df'].county),
+                {'html_filename': html('usa_plot'), 'show_fig': False}), None),
+        ('mapping', 'choropleth_mapbox_layers_plot', mapping.choropleth_mapbox_layers_plot,
+            lambda s: ((s['counties'], [layer(s, 'Cases'), layer(s, 'Cases again')],
+                html('layers_plot')), {}), None),
+        ('mapping', 'choropleth_mapbox_animated_plot', mapping.choropleth_mapbox_animated_plot,
+            lambda s: ((s['counties'], s['merged_covid_ppe_hosp_df'].fips, list(range(7)),
+                np.repeat(s['merged_covid_ppe_hosp_df'].cases.to_numpy(np.int64, na_value=0)[:, None], 7, axis=1),
+                html('animated_plot')), {}), None),
+        # viz_correlation_ppe_request_covid19_cases is left out, it opens the figure in a browser
+    ]
+
+
+def run_benchmarks(sizes, repeat=3, memory=True, seed=0, only=None, repeated_fips=True):
+    results = []
+    cases = [(size, False) for size in sizes]
+    if repeated_fips:
+        cases.append((min(sizes), True))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for size, repeated in cases:
+            case = 'repeated fips' if repeated else None
+            label = '%d%s' % (size, ' rep' if repeated else '')
+            print('Generating {} row fixtures{}'.format(size, ', repeating fips' if repeated else ''))
+            fixtures = synthetic_fixtures(size, seed, repeated_fips=repeated)
+            size_dir = os.path.join(tmp_dir, label.replace(' ', '_'))
+            os.makedirs(size_dir)
+            serve_fixtures(fixtures, os.path.join(size_dir, 'cache'))
+
+            # functions that write files work in the temporary folder
+            cwd = os.getcwd()
+            os.chdir(size_dir)
+            try:
+                state = {}
+                for module, name, func, build_args, key in benchmark_cases(fixtures, size_dir):
+                    record = {'module': module, 'function': name, 'size': size}
+                    if case:
+                        record['case'] = case
+                    result = None
+                    try:
+                        args, kwargs = build_args(state)
+                    except KeyError as e:
+                        record['skipped'] = 'needs the result of %s' % e
+                        print('{:<14} {:<48} {:>9} skipped, {}'.format(module, name, label, record['skipped']))
+                        results.append(record)
+                        continue
+                    try:
+                        if only and not any(o in '%s.%s' % (module, name) for o in only):
+                            # not timed, but later functions may need its result
+                            run_args, run_kwargs = _fresh(args, kwargs)
+                            result = func(*run_args, **run_kwargs) if key else None
+                        else:
+                            result, stats = measure(func, args, kwargs, repeat, memory)
+                            record.update(stats)
+                            print('{:<14} {:<48} {:>9} {:>9.3f}s {:>9}'.format(module, name, label,
+                                stats['seconds'], '%.1fMB' % stats['peak_mb'] if memory else ''))
+                    except Exception as e:
+                        record['error'] = '%s: %s' % (type(e).__name__, e)
+                        print('{:<14} {:<48} {:>9} failed, {}'.format(module, name, label, record['error']))
+                    if key and result is not None:
+                        state[key] = result
+                    if not only or 'seconds' in record or 'error' in record:
+                        results.append(record)
+            finally:
+                os.chdir(cwd)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(results, output, sizes, repeat):
+    report = {
+        'commit': git_commit(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'sizes': sizes,
+        'repeat': repeat,
+        'results': results,
+    }
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=1)
+    return report
+
+
+def compare(results, baseline_path):
+    """Print the time of each function and size relative to a baseline results file"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    before = {(r['module'], r['function'], r['size'], r.get('case')): r for r in baseline['results']}
+    print('\nCompared to {} ({})'.format(baseline_path, baseline.get('commit')))
+    print('{:<14} {:<48} {:>9} {:>10} {:>10} {:>7}'.format(
+        'module', 'function', 'size', 'before', 'now', 'ratio'))
+    for r in results:
+        b = before.get((r['module'], r['function'], r['size'], r.get('case')))
+        if b is None or 'seconds' not in b or 'seconds' not in r:
+            continue
+        size = '%d%s' % (r['size'], ' rep' if r.get('case') else '')
+        print('{:<14} {:<48} {:>9} {:>9.3f}s {:>9.3f}s {:>6.2f}x'.format(r['module'], r['function'],
+            size, b['seconds'], r['seconds'], r['seconds'] / max(b['seconds'], 1e-9)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+        help='rows per synthetic dataset, 1000 to 1000000')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per function, the best is kept')
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc run')
+    parser.add_argument('--only', nargs='+', help='only time functions whose module.name contains one of these')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    parser.add_argument('--no-repeated-fips', action='store_true',
+        help='skip the run on fixtures whose counties repeat a fips')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.sizes, args.repeat, not args.no_memory, args.seed, args.only,
+        not args.no_repeated_fips)
+    write_results(results, args.output, args.sizes, args.repeat)
+    print('Results written to {}'.format(args.output))
+    if args.compare:
+        compare(results, args.compare)
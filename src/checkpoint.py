@@ -0,0 +1,162 @@
+import functools
+import glob
+import json
+import os
+import tempfile
+import time
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+# Written into the schema metadata of every checkpoint
+METADATA_KEY = b'getusppe_checkpoint'
+
+
+def _serialized(df):
+    # dicts and lists (e.g. the county geojson geometry) are stored as their json text
+    nested = [c for c in df.columns[df.dtypes == object]
+        if df[c].map(lambda v: isinstance(v, (dict, list))).any()]
+    if not nested:
+        return df
+    return df.assign(**{c: df[c].map(lambda v: json.dumps(v) if isinstance(v, (dict, list)) else v)
+        for c in nested})
+
+
+def frame_hash(df):
+    # Content hash of the values and column names of a frame, ignoring its index
+    df = _serialized(df)
+    values = pd.util.hash_pandas_object(df, index=False).sum() if len(df.columns) else 0
+    names = pd.util.hash_array(df.columns.astype(str).to_numpy(dtype=object)).sum()
+    return '%016x' % ((int(values) + int(names)) % 2 ** 64)
+
+
+def _to_table(df):
+    # only store the categories in use, filtering and joins can leave unused ones
+    categorical = [c for c in df.columns if df[c].dtype.name == 'category']
+    if categorical:
+        df = df.assign(**{c: df[c].cat.remove_unused_categories() for c in categorical})
+    try:
+        return pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowTypeError, pa.ArrowInvalid):
+        # columns mixing strings and numbers are stored as text, as to_csv would have
+        df = df.copy()
+        for column in df.columns[df.dtypes == object]:
+            df[column] = df[column].where(df[column].isna(), df[column].astype(str))
+        return pa.Table.from_pandas(df, preserve_index=False)
+
+
+class checkpoint_store:
+    """Typed, memory mapped snapshots of intermediate data frames.
+
+    Each checkpoint is an Arrow IPC (Feather v2) file named <name>_<YYYYmmdd>.feather,
+    so fips and zip codes keep their leading zeros and every column its dtype.
+    Columns of dicts or lists, such as the geojson geometry, are read back as json text.
+    The schema metadata records the row count and a content hash, which
+    latest() checks so a stage only resumes from a complete, valid checkpoint.
+    """
+    def __init__(self, checkpoint_dir='checkpoints', compression='lz4', keep=7,
+                 resume=False, max_age_hours=24):
+        self.checkpoint_dir = checkpoint_dir
+        # uncompressed files can be memory mapped without copying the numeric columns
+        self.compression = compression
+        self.keep = keep
+        self.resume = resume
+        self.max_age_hours = max_age_hours
+
+    def path(self, name, day=None):
+        return os.path.join(self.checkpoint_dir,
+            '%s_%s.feather' % (name, day or time.strftime('%Y%m%d')))
+
+    def write(self, name, df):
+        """Write df as today's checkpoint of name and return its path"""
+        df = _serialized(df)
+        table = _to_table(df)
+        info = {'name': name, 'rows': len(df), 'hash': frame_hash(df), 'created': time.time()}
+        metadata = dict(table.schema.metadata or {})
+        metadata[METADATA_KEY] = json.dumps(info).encode()
+        table = table.replace_schema_metadata(metadata)
+
+        path = self.path(name)
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.checkpoint_dir, suffix='.tmp')
+        os.close(fd)
+        try:
+            feather.write_feather(table, tmp_path, compression=self.compression)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._prune(name)
+        return path
+
+    def info(self, path):
+        """The metadata recorded with a checkpoint, without reading its columns"""
+        schema = feather.read_table(path, memory_map=True).schema
+        return json.loads((schema.metadata or {})[METADATA_KEY])
+
+    def read(self, path, verify=False):
+        """Load a checkpoint as a data frame, checking its content hash if verify is set"""
+        table = feather.read_table(path, memory_map=True)
+        info = json.loads((table.schema.metadata or {})[METADATA_KEY])
+        # split_blocks avoids consolidating the columns into one copied block
+        df = table.to_pandas(split_blocks=True)
+        if len(df) != info['rows'] or (verify and frame_hash(df) != info['hash']):
+            raise ValueError('Checkpoint %s does not match its recorded content' % path)
+        return df
+
+    def checkpoints(self, name):
+        # newest first; the date suffix sorts lexically
+        paths = glob.glob(os.path.join(glob.escape(self.checkpoint_dir), glob.escape(name) + '_*.feather'))
+        return sorted((p for p in paths
+            if os.path.basename(p)[len(name) + 1:-len('.feather')].isdigit()), reverse=True)
+
+    def latest(self, name, verify=True):
+        """The newest valid checkpoint of name younger than max_age_hours, or None"""
+        for path in self.checkpoints(name):
+            try:
+                if self.max_age_hours is not None and \
+                        time.time() - self.info(path)['created'] > self.max_age_hours * 3600:
+                    return None
+                return self.read(path, verify=verify)
+            except (IOError, ValueError, KeyError, pa.ArrowInvalid) as e:
+                print('Skipping checkpoint {}: {}'.format(path, e))
+        return None
+
+    def _prune(self, name):
+        if self.keep:
+            for path in self.checkpoints(name)[self.keep:]:
+                os.remove(path)
+
+
+default_store = checkpoint_store()
+
+def configure(checkpoint_dir='checkpoints', compression='lz4', keep=7,
+              resume=False, max_age_hours=24):
+    global default_store
+    default_store = checkpoint_store(checkpoint_dir, compression, keep, resume, max_age_hours)
+    return default_store
+
+def configure_from_config(checkpoint_config):
+    """Configure the shared store from the [checkpoint] section of config.ini"""
+    return configure(
+        checkpoint_dir=checkpoint_config.get('checkpoint_dir', 'checkpoints'),
+        compression=checkpoint_config.get('compression', 'lz4'),
+        keep=checkpoint_config.getint('keep', 7),
+        resume=checkpoint_config.getboolean('resume', False),
+        max_age_hours=checkpoint_config.getfloat('max_age_hours', 24))
+
+def write_checkpoint(name, df):
+    return default_store.write(name, df)
+
+def latest_checkpoint(name, verify=True):
+    return default_store.latest(name, verify=verify)
+
+def accepts_write_out_csv(func):
+    """Decorator accepting write_out_csv, the former name of the write_out_checkpoint keyword of func"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if 'write_out_csv' in kwargs:
+            kwargs['write_out_checkpoint'] = kwargs.pop('write_out_csv')
+        return func(*args, **kwargs)
+    return wrapper
@@ -12,10 +12,23 @@ pd.options.display.max_columns = 200
 import numpy as np
 
 # Import local libraries
+import download_cache
+import checkpoint
+import instrument
+from pipeline import pipeline
+from timeseries import update_county_cube
+from incremental import county_state_store, compute_county_frames, update_county_frames
+from hover_text import hover_text
+from geometry import simplify_county_geojson, state_of
+from metrics import compute_metrics
 from geocode import geocoder
+from zip_lookup import load_zip_lookup_table
 from mapping import choropleth_mapbox_usa_plot, \
     viz_correlation_ppe_request_covid19_cases, \
-    choropleth_mapbox_layered_plot
+    choropleth_mapbox_layers_plot, \
+    choropleth_mapbox_animated_plot
+from map_shards import choropleth_mapbox_sharded_plot
+from static_maps import render_static_maps
 from data_download import download_findthemasks_data, \
     download_nytimes_data, \
     download_hospital_data, \
@@ -25,6 +38,8 @@ from data_download import download_findthemasks_data, \
 from data_process import add_fips_county_info_v2, \
     requests_per_county, \
     download_county_geojson_and_merge_df, \
+    download_county_geojson, \
+    merge_county_geojson_df, \
     merge_covid_ppe_df, \
     process_hospital_data, \
     merge_covid_ppe_hosp_df, \
@@ -44,52 +59,56 @@ def create_configs(file_location):
     return config
 
 
-if __name__ == '__main__':
-    # Pull configs from src folder (i.e. current folder)
-    config = create_configs(
-        path.abspath(path.join('config.ini')))
+def load_zip_table(zip_table_path, zip_lat_lon_url):
+    # The compiled zip lookup table, built from the zip to fips sheet the first time
+    return load_zip_lookup_table(zip_table_path, download_zip_to_fips_data, zip_lat_lon_url)
 
-    # Which dataset to download
-    if str(config['viz']['find_the_masks_data_download_flag']) == True:
-        print ('Find The Masks Dataset downloading')
-        #Download find the mask data and convert to pandas
-        mask_df = download_findthemasks_data(
-            url = str(config['viz']['findthemasks_url']),
-            request_headers = eval(config['viz']['request_headers']), 
-            write_out_csv = False)
-            
-        # Create geocoder class to find fips and county information by lat/long
-        geocoder = geocoder(str(config['viz']['county_fips_download_url']))
-        
-        #Search and add the FIPS code to each row - Will take a minute
-        mask_df = add_fips_county_info_v2(mask_df, geocoder)
+
+def download_findthemasks_mask_df(counties, findthemasks_url, request_headers, county_fips_download_url,
+                                  geocoder_engine):
+    print ('Find The Masks Dataset downloading')
+    #Download find the mask data and convert to pandas
+    mask_df = download_findthemasks_data(
+        url = findthemasks_url,
+        request_headers = request_headers,
+        write_out_checkpoint = False)
+
+    # Create geocoder class to find fips and county information by lat/long
+    # ('polygon' finds the county containing each point in the county geojson)
+    county_geocoder = geocoder(county_fips_download_url, engine = geocoder_engine, counties = counties)
+
+    #Search and add the FIPS code to each row
+    return add_fips_county_info_v2(mask_df, county_geocoder)
+
+
+def merge_county_ppe_requests(counties, mask_df, mask_df_counties):
+    # Merge the county geo information with the requests per county
+    merged_df = merge_county_geojson_df(counties, mask_df_counties)
+    return add_all_ppe_requests_to_merged_df(mask_df, merged_df)
+
+
+def merge_county_hospital_data(merged_df, covid_df, hospital_df_counties, county_state_path):
+    if county_state_path:
+        # Only recompute the counties whose inputs changed since the last run
+        merged_covid_ppe_hosp_df = update_county_frames(
+            merged_df, covid_df, hospital_df_counties, county_state_store(county_state_path))
     else:
-        # TODO: This will be the pull from the main GetUsPPE database in the future 
-        print ('Ideo Merged Dataset downloading')
-        # download zip to fips
-        zip_fips_df=download_zip_to_fips_data()
-        
-        # Pull the ideo merged dataset
-        mask_df = download_ideo_merged_data(
-            url = str(config['viz']['ideo_url']), 
-            zip_fips_df = zip_fips_df, 
-            write_out_csv = False)
-
-    # Sum amount of requests per county
-    mask_df_counties = requests_per_county(mask_df, write_out_csv = False)
-
-    # Download county geo information and merge
-    counties, merged_df = download_county_geojson_and_merge_df(
-        str(config['viz']['geojson_url']), mask_df_counties)
-    merged_df = add_all_ppe_requests_to_merged_df(mask_df,merged_df)
+        # Merge the covid and NYTimes data, then the hospital data, and calculate the
+        # covid cases per bed available and per ppe request
+        merged_covid_ppe_hosp_df = compute_county_frames(merged_df, covid_df, hospital_df_counties)
+
+    # the final frame is saved as a checkpoint by the pipeline (see build_pipeline)
+    return merged_covid_ppe_hosp_df
+
 
+def map_ppe_requests(counties, merged_df):
     # Map the county level demand for PPE
     print ('Creating and saving map of ppe demand per county')
     choropleth_mapbox_usa_plot(
         counties = counties,
         locations = merged_df.fips,
         z = merged_df.PPE_requests,
-        text = merged_df.ppe_text,
+        text = hover_text(merged_df, 'ppe_text'),
         #colorscale = ["#fdfcef", "#c7e9b4", "#6ab7a6","#41b6c4","#2c7fb8","#253494"],
         colorscale = ["#fdfcef","#c7e9b4","#D2FBFF","#36A2B9","#004469"],
         zmin = 0,
@@ -99,24 +118,15 @@ if __name__ == '__main__':
         html_filename = '../img/PPE_Requests_By_County.html',
         show_fig=False)
 
-    # Donwload COVID19 Data from NYTimes and covert to Pandas
-    print ('Downloading NYtimes dataset')
-    ny_times_covid_date=str(config['viz']['ny_times_covid_date'])
-    covid_df = download_nytimes_data(
-        url = str(config['viz']['ny_times_county_data_url']),
-        date = ny_times_covid_date,
-        write_out_csv = False)
-
-    # Merge the covid and NYTimes data
-    merged_covid_ppe_df=merge_covid_ppe_df(covid_df,merged_df) 
 
+def map_covid_cases(counties, merged_covid_ppe_df, ny_times_covid_date):
     # Map Covid cases and
     print ('Creating and saving map of Covid Cases and Deaths per county')
     choropleth_mapbox_usa_plot(
         counties = counties,
         locations = merged_covid_ppe_df.fips,
         z = merged_covid_ppe_df.cases,
-        text = merged_covid_ppe_df.covid_text,
+        text = hover_text(merged_covid_ppe_df, 'covid_text'),
         colorscale = ["#fdfcef","#ffda55","#FFC831","#fc7555","#e96e81",],
         zmin = 0,
         zmax=500,
@@ -126,36 +136,55 @@ if __name__ == '__main__':
         show_fig=False
     )
 
-    # Download Hospital dataset
-    print ('Downloading Hopsital Dataset')
-    hospital_df = download_hospital_data(
-        str(config['viz']['hospital_download_url']),
-        write_out_csv = False)
 
-    # Add county level infromation to hosptial beds
-    hospital_df_counties = process_hospital_data(hospital_df, write_out_csv = False)
+def download_covid_cube(url, cube_path):
+    # Append the days since the last run to the saved county x date cube
+    return update_county_cube(download_cache.cached_path(url, source='nytimes'), cube_path or None)
 
-    # Merge in hospital data to covid and ppe data
-    merged_covid_ppe_hosp_df=merge_covid_ppe_hosp_df(hospital_df_counties,merged_covid_ppe_df) 
 
-    # Calculate covid cases per bed available
-    merged_covid_ppe_hosp_df = calculate_covid_per_bed_available(merged_covid_ppe_hosp_df)
+def animation_window(covid_cube, fips, ny_times_covid_date, animation_days, average_days=7):
+    """The cube of the animated days for fips, and the average new cases of each of those days.
 
-    # Calculate covid cases per ppe request
-    merged_covid_ppe_hosp_df = calculate_covid_cases_per_ppe_request(merged_covid_ppe_hosp_df) 
+    The average is taken over the days before the window too, so its first
+    days are not the cumulative counts.
+    """
+    end = pd.Timestamp(ny_times_covid_date)
+    start = end - pd.Timedelta(days=animation_days - 1)
+    history = covid_cube.window(start - pd.Timedelta(days=average_days), end).reindex(fips)
+    in_window = np.asarray(history.dates >= start)
+    return history.window(start, end), history.rolling_mean('cases', average_days)[:, in_window]
 
-    # write out final csv
-    merged_covid_ppe_hosp_df[['fips', 'GEO_ID', 'STATE', 'county', 
-     'CENSUSAREA', 'PPE_requests', 'cases', 'deaths', 'BEDS', 
-     'Covid_cases_per_bed', 'Covid_cases_per_PPE_requests']].to_csv(
-        'merged_df_%s.csv' % str(date.today()), index=False) 
-    
+
+def map_covid_cases_animated(counties, merged_df, covid_cube, ny_times_covid_date, animation_days):
+    # Animate the cases per county over the days up to the NYTimes date
+    print ('Creating and saving animated map of Covid Cases per county')
+    cube, new_cases = animation_window(covid_cube, merged_df['fips'], ny_times_covid_date, animation_days)
+    choropleth_mapbox_animated_plot(
+        counties = counties,
+        locations = merged_df.fips,
+        frame_labels = cube.dates.strftime('%Y-%m-%d'),
+        z = cube.cases,
+        text = merged_df['county'].astype(str) + ', ' + merged_df['STATE'].astype(str),
+        customdata = np.stack([cube.cases, cube.deaths, new_cases], axis=-1),
+        hovertemplate = ('%{text}<br><br>Covid19: <br>Cases: %{customdata[0]}<br>'
+            'Deaths: %{customdata[1]}<br>New cases (7 day average): %{customdata[2]:.1f}'
+            '<extra></extra>'),
+        colorscale = ["#fdfcef","#ffda55","#FFC831","#fc7555","#e96e81",],
+        zmin = 0,
+        zmax = 500,
+        title = ('COVID19 Cases Per County - %d days to %s' % (animation_days, ny_times_covid_date)),
+        html_filename = ('../img/COVID19_Cases_Per_County_Animated_%s.html' % ny_times_covid_date),
+        colorbar_title = '> COVID19 Cases',
+    )
+
+
+def map_hazard_index(counties, merged_covid_ppe_hosp_df, ny_times_covid_date):
     print ('Mapping covid19 hazard index by cases and bed availability')
     choropleth_mapbox_usa_plot(
         counties = counties,
         locations = merged_covid_ppe_hosp_df.fips,
         z = merged_covid_ppe_hosp_df.Covid_cases_per_bed,
-        text = merged_covid_ppe_hosp_df.hosp_text,
+        text = hover_text(merged_covid_ppe_hosp_df, 'hosp_text', stored=True),
         colorscale = ["#fdfcef","#ffda55","#FFC831","#fc7555","#e96e81",],
         zmin = 0,
         zmax=1,
@@ -165,52 +194,230 @@ if __name__ == '__main__':
         show_fig=False
         )
 
+
+def index_layers(merged_df, merged_covid_ppe_df, merged_covid_ppe_hosp_df, ny_times_covid_date):
+    # The choropleth layers of the main page
+    return [
+        dict(label = 'PPE Requests',
+            locations = merged_df.fips,
+            z = merged_df.PPE_requests,
+            text = hover_text(merged_df, 'ppe_text'),
+            colorscale = ["#fdfcef","#c7e9b4","#D2FBFF","#36A2B9","#004469"],
+            zmin = 0,
+            zmax = 10,
+            title = ('PPE Requests By County - %s - (Hover for breakdown)' % time.strftime("%Y%m%d")),
+            colorbar_title = '> PPE Requests'),
+
+        dict(label = 'COVID19 Cases',
+            locations = merged_covid_ppe_df.fips,
+            z = merged_covid_ppe_df.cases,
+            text = hover_text(merged_covid_ppe_df, 'covid_text'),
+            colorscale = ["#fdfcef","#ffda55","#FFC831","#fc7555","#e96e81",],
+            zmin = 0,
+            zmax = 500,
+            title = ('COVID19 Cases Per County - %s - (Hover for breakdown)' % ny_times_covid_date),
+            colorbar_title = '> COVID19 Cases'),
+
+        dict(label = 'COVID19 Cases Per PPE Request',
+            locations = merged_covid_ppe_hosp_df.fips,
+            z = merged_covid_ppe_hosp_df.Covid_cases_per_PPE_requests,
+            text = hover_text(merged_covid_ppe_hosp_df, 'covid_ppe_text', stored=True),
+            colorscale = ["#b5b5b5","#fae1ac","#ffcf69","#fab92f","#ffad00","#ff7700"],
+            zmin = 0,
+            zmax = 500,
+            title = ('Covid19 Cases, Per PPE Request, Per County - Counties with no PPE Requests are Default Gray - %s - (Hover for breakdown)' % ny_times_covid_date),
+            colorbar_title = '> Covid19 Cases Per Bed)'),
+
+        dict(label = 'COVID19 Cases Per Hospital Bed',
+            locations = merged_covid_ppe_hosp_df.fips,
+            z = merged_covid_ppe_hosp_df.Covid_cases_per_bed,
+            text = hover_text(merged_covid_ppe_hosp_df, 'hosp_text', stored=True),
+            colorscale = 'Viridis',
+            zmin = 0,
+            zmax = 1,
+            title = ('Covid19 Cases, Per Hospital Bed, Per County (i.e. Potential PPE Need Hazard Index) - %s - (Hover for breakdown)' % ny_times_covid_date),
+            colorbar_title = '> Covid19 Cases Per Bed)'),
+        ]
+
+
+def map_index_html(counties, merged_df, merged_covid_ppe_df, merged_covid_ppe_hosp_df, ny_times_covid_date):
     print ('Creating Main Index.html with each choropleth map as a layer')
-    choropleth_mapbox_layered_plot(counties = counties, html_filename = '../index.html',
-        locations_0 = merged_df.fips,
-        z_0 = merged_df.PPE_requests,
-        text_0 = merged_df.ppe_text,
-        colorscale_0 = ["#fdfcef","#c7e9b4","#D2FBFF","#36A2B9","#004469"],
-        zmin_0 = 0,
-        zmax_0 = 10,
-        title_0 = ('PPE Requests By County - %s - (Hover for breakdown)' % time.strftime("%Y%m%d")),
-        colorbar_title_0 = '> PPE Requests',
-                                   
-        locations_1 = merged_covid_ppe_df.fips,
-        z_1 = merged_covid_ppe_df.cases,
-        text_1 = merged_covid_ppe_df.covid_text,
-        colorscale_1 = ["#fdfcef","#ffda55","#FFC831","#fc7555","#e96e81",],
-        zmin_1 = 0,
-        zmax_1=500,
-        title_1 = ('COVID19 Cases Per County - %s - (Hover for breakdown)' % ny_times_covid_date),
-        colorbar_title_1 = '> COVID19 Cases',
-                                                 
-        locations_2 = merged_covid_ppe_hosp_df.fips,
-        z_2 = merged_covid_ppe_hosp_df.Covid_cases_per_PPE_requests,
-        text_2 = merged_covid_ppe_hosp_df.covid_ppe_text,
-        colorscale_2 =  ["#b5b5b5","#fae1ac","#ffcf69","#fab92f","#ffad00","#ff7700"],
-        zmin_2 = 0,
-        zmax_2 = 500,
-        title_2 = ('Covid19 Cases, Per PPE Request, Per County - Counties with no PPE Requests are Default Gray - %s - (Hover for breakdown)' % ny_times_covid_date),
-        colorbar_title_2 = '> Covid19 Cases Per Bed)',
-                                   
-        locations_3 = merged_covid_ppe_hosp_df.fips,
-        z_3 = merged_covid_ppe_hosp_df.Covid_cases_per_bed,
-        text_3 = merged_covid_ppe_hosp_df.hosp_text,
-        colorscale_3 =  'Viridis',
-        zmin_3 = 0,
-        zmax_3 = 1,
-        title_3 = ('Covid19 Cases, Per Hospital Bed, Per County (i.e. Potential PPE Need Hazard Index) - %s - (Hover for breakdown)' % ny_times_covid_date),
-        colorbar_title_3 = '> Covid19 Cases Per Bed)',
-        )
+    choropleth_mapbox_layers_plot(counties = counties, html_filename = '../index.html',
+        layers = index_layers(merged_df, merged_covid_ppe_df, merged_covid_ppe_hosp_df, ny_times_covid_date))
 
 
+def render_static_index_maps(counties, merged_df, merged_covid_ppe_df, merged_covid_ppe_hosp_df, covid_cube,
+                             ny_times_covid_date, animation_days, output_dir, image_format, processes):
+    # Images of the main page's layers, and of the cases on each of the animated days
+    print ('Rendering static images of the maps')
+    frames = [dict(layer, filename = '%s_%s.%s' % (layer['label'].replace(' ', '_'), ny_times_covid_date,
+        image_format)) for layer in index_layers(merged_df, merged_covid_ppe_df, merged_covid_ppe_hosp_df,
+        ny_times_covid_date)]
+    end = pd.Timestamp(ny_times_covid_date)
+    cube = covid_cube.window(end - pd.Timedelta(days=animation_days - 1), end)
+    for day, date in enumerate(cube.dates.strftime('%Y-%m-%d')):
+        frames.append(dict(filename = 'COVID19_Cases_%s.%s' % (date, image_format),
+            locations = cube.fips, z = cube.cases[:, day],
+            colorscale = ["#fdfcef","#ffda55","#FFC831","#fc7555","#e96e81",],
+            zmin = 0, zmax = 500,
+            title = 'COVID19 Cases Per County - %s' % date,
+            colorbar_title = '> COVID19 Cases'))
+    render_static_maps(counties, frames, output_dir, processes = processes)
 
-    print ('create_figures.py <> Finished')
+
+def state_totals(merged_df, merged_covid_ppe_df, merged_covid_ppe_hosp_df):
+    # Requests, cases and beds summed per state fips, with the state level ratios
+    def per_state(df, column):
+        return df[column].groupby(df['fips'].astype(str).map(state_of)).sum()
+    totals = pd.DataFrame({
+        'PPE_requests': per_state(merged_df, 'PPE_requests'),
+        'cases': per_state(merged_covid_ppe_df, 'cases'),
+        'BEDS': per_state(merged_covid_ppe_hosp_df, 'BEDS')})
+    return compute_metrics(totals, ['Covid_cases_per_bed', 'Covid_cases_per_PPE_requests'])
 
 
+def map_index_shards(counties, covid_df, merged_df, merged_covid_ppe_df, merged_covid_ppe_hosp_df,
+                     ny_times_covid_date, output_dir):
+    print ('Creating the sharded map, loading the counties of a state when zoomed in')
+    totals = state_totals(merged_df, merged_covid_ppe_df, merged_covid_ppe_hosp_df)
+    layers = index_layers(merged_df, merged_covid_ppe_df, merged_covid_ppe_hosp_df, ny_times_covid_date)
+    for layer, column in zip(layers, ['PPE_requests', 'cases', 'Covid_cases_per_PPE_requests',
+                                      'Covid_cases_per_bed']):
+        layer['state_z'] = totals[column]
+    state_names = dict(zip(covid_df['fips'].astype(str).map(state_of), covid_df['state'].astype(str)))
+    choropleth_mapbox_sharded_plot(counties, layers, output_dir, state_names = state_names)
 
 
+def build_pipeline(config):
+    """Stages of create_figures, each with the stages it needs as inputs"""
+    viz = config['viz']
+    ny_times_covid_date = str(viz['ny_times_covid_date'])
+    # Frames of the stages with checkpoint = True are saved to the [checkpoint] store;
+    # traced runs go one stage at a time, so each stage's memory and drops are its own
+    pipe = pipeline(checkpoints = checkpoint.default_store, serial = instrument.is_enabled())
+
+    # zip -> fips, state, county, lat, lon of the survey and donor zip codes
+    pipe.add_stage('zip_table', load_zip_table,
+        zip_table_path = str(viz['zip_table_path']),
+        zip_lat_lon_url = str(viz['zip_lat_lon_url']))
+
+    # Which dataset to download
+    if str(viz['find_the_masks_data_download_flag']) == True:
+        pipe.add_stage('mask_df', download_findthemasks_mask_df, checkpoint = True, schema = 'mask_df',
+            inputs = {'counties': 'county_geojson'},
+            findthemasks_url = str(viz['findthemasks_url']),
+            request_headers = eval(viz['request_headers']),
+            county_fips_download_url = str(viz['county_fips_download_url']),
+            geocoder_engine = viz.get('geocoder_engine', 'polygon'))
+    else:
+        # TODO: This will be the pull from the main GetUsPPE database in the future
+        pipe.add_stage('mask_df', download_ideo_merged_data, checkpoint = True, schema = 'mask_df',
+            inputs = {'zip_table': 'zip_table'},
+            url = str(viz['ideo_url']),
+            write_out_checkpoint = False)
+
+    # Downloads that do not depend on each other
+    pipe.add_stage('covid_df', download_nytimes_data, checkpoint = True, schema = 'covid_df',
+        url = str(viz['ny_times_county_data_url']),
+        date = ny_times_covid_date,
+        write_out_checkpoint = False)
+    pipe.add_stage('hospital_df', download_hospital_data, checkpoint = True, schema = 'hospital_df',
+        url = str(viz['hospital_download_url']),
+        write_out_checkpoint = False)
+    pipe.add_stage('covid_cube', download_covid_cube,
+        url = str(viz['ny_times_county_data_url']),
+        cube_path = str(viz['covid_cube_path']))
+    pipe.add_stage('county_geojson', download_county_geojson,
+        geojson_url = str(viz['geojson_url']))
+
+    # Simplify the shared county borders and round coordinates to shrink the maps
+    pipe.add_stage('counties', simplify_county_geojson, inputs = ['county_geojson'], kind = 'process',
+        tolerance = float(viz['geojson_simplify_tolerance']),
+        precision = int(viz['geojson_coordinate_precision']))
 
+    # Sum amount of requests per county, and merge with the county geo information
+    pipe.add_stage('mask_df_counties', requests_per_county, inputs = ['mask_df'], checkpoint = True,
+        schema = 'mask_df_counties',
+        write_out_checkpoint = False)
+    pipe.add_stage('merged_df', merge_county_ppe_requests, schema = 'merged_df',
+        inputs = ['county_geojson', 'mask_df', 'mask_df_counties'])
 
+    # Merge the covid and NYTimes data, then the hospital data
+    pipe.add_stage('merged_covid_ppe_df', merge_covid_ppe_df, schema = 'merged_covid_ppe_df',
+        inputs = ['covid_df', 'merged_df'])
+    pipe.add_stage('hospital_df_counties', process_hospital_data, inputs = ['hospital_df'], checkpoint = True,
+        schema = 'hospital_df_counties',
+        write_out_checkpoint = False)
+    pipe.add_stage('merged_covid_ppe_hosp_df', merge_county_hospital_data, schema = 'merged_covid_ppe_hosp_df',
+        inputs = ['merged_df', 'covid_df', 'hospital_df_counties'], checkpoint = True,
+        county_state_path = str(viz['county_state_path']))
 
+    # Requesters with their hazard index, and the donors, for query_service.py
+    pipe.add_stage('requestor_df', create_requestor_df_for_querying_requesters, checkpoint = True,
+        inputs = ['mask_df', 'merged_covid_ppe_hosp_df'])
+    if viz.get('ppe_donors_url'):
+        pipe.add_stage('ppe_donors_df', download_PPE_donors,
+            url = str(viz['ppe_donors_url']))
+        pipe.add_stage('ppe_donors_with_zip_df', add_fips_ppe_donors, checkpoint = True,
+            inputs = ['ppe_donors_df', 'zip_table'])
+
+    # Maps
+    pipe.add_stage('map_ppe_requests', map_ppe_requests,
+        inputs = ['counties', 'merged_df'])
+    pipe.add_stage('map_covid_cases', map_covid_cases,
+        inputs = ['counties', 'merged_covid_ppe_df'],
+        ny_times_covid_date = ny_times_covid_date)
+    pipe.add_stage('map_covid_cases_animated', map_covid_cases_animated,
+        inputs = ['counties', 'merged_df', 'covid_cube'],
+        ny_times_covid_date = ny_times_covid_date,
+        animation_days = int(viz['animation_days']))
+    pipe.add_stage('map_hazard_index', map_hazard_index,
+        inputs = ['counties', 'merged_covid_ppe_hosp_df'],
+        ny_times_covid_date = ny_times_covid_date)
+    pipe.add_stage('map_index_html', map_index_html,
+        inputs = ['counties', 'merged_df', 'merged_covid_ppe_df', 'merged_covid_ppe_hosp_df'],
+        ny_times_covid_date = ny_times_covid_date)
+    if viz.get('static_map_dir'):
+        pipe.add_stage('static_maps', render_static_index_maps,
+            inputs = ['counties', 'merged_df', 'merged_covid_ppe_df', 'merged_covid_ppe_hosp_df', 'covid_cube'],
+            ny_times_covid_date = ny_times_covid_date,
+            animation_days = int(viz['animation_days']),
+            output_dir = str(viz['static_map_dir']),
+            image_format = viz.get('static_map_format', 'png'),
+            processes = int(viz['static_map_processes']) if viz.get('static_map_processes') else None)
+    if viz.get('sharded_map_dir'):
+        pipe.add_stage('map_index_shards', map_index_shards,
+            inputs = ['counties', 'covid_df', 'merged_df', 'merged_covid_ppe_df', 'merged_covid_ppe_hosp_df'],
+            ny_times_covid_date = ny_times_covid_date,
+            output_dir = str(viz['sharded_map_dir']))
+    return pipe
+
+
+if __name__ == '__main__':
+    # Pull configs from src folder (i.e. current folder)
+    config = create_configs(
+        path.abspath(path.join('config.ini')))
+
+    # Reuse downloads cached by earlier runs (see [cache] in config.ini)
+    download_cache.configure_from_config(config['cache'])
+
+    # Typed checkpoints of the intermediate frames (see [checkpoint] in config.ini)
+    checkpoint.configure_from_config(config['checkpoint'])
+
+    # Optionally trace time, memory and rows of every stage (see [instrument] in config.ini)
+    tracing = instrument.enable_from_config(config['instrument'])
+
+    # Run the downloads, processing and maps, with independent stages at the same time
+    # (one at a time when tracing)
+    pipe = build_pipeline(config)
+    try:
+        pipe.run()
+    finally:
+        if tracing:
+            trace_path = time.strftime(config['instrument'].get('trace_path', 'trace_%Y%m%d.json'))
+            instrument.write_trace(trace_path)
+            print (instrument.summary_table())
+            print ('Trace written to {}'.format(trace_path))
+    print (pipe.timing_report())
+
+    print ('create_figures.py <> Finished')
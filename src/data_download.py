@@ -1,19 +1,33 @@
-import requests
 import pandas as pd
-import json
-import time
-import addfips
-
-def download_findthemasks_data(url,request_headers, write_out_csv=False):
-    # Download the data
-    s=requests.get(url, headers= request_headers).text
-
-    # Extract the json format, and find column headers
-    json_data = json.loads(s)
-    HEADERS = json_data['values'][0]
+from fips_lookup import get_fips_lookup_table
+from io import BytesIO
+from download_cache import cached_get, cached_path
+from checkpoint import write_checkpoint, accepts_write_out_csv
+from instrument import traced
+from json_stream import iter_items
+from schema import normalize, to_fips, to_zip
+from zip_lookup import load_zip_lookup_table, zip_lookup_table, ZIP_TABLE_PATH, ZIP_LAT_LON_URL
+
+@traced
+@accepts_write_out_csv
+def download_findthemasks_data(url,request_headers, write_out_checkpoint=False):
+    # Stream the rows of the cached download: the first holds the column headers,
+    # the second is skipped, and the rest fill one list per column
+    with open(cached_path(url, source='findthemasks', headers=request_headers), 'rb') as f:
+        rows = iter_items(f, 'values')
+        HEADERS = next(rows)
+        next(rows, None)
+        columns = [[] for _ in HEADERS]
+        appends = [column.append for column in columns]
+        for row in rows:
+            for append, value in zip(appends, row):
+                append(value)
+            # short rows are missing their trailing values
+            for append in appends[len(row):]:
+                append(None)
 
     # create the data frame
-    mask_df = pd.DataFrame.from_dict(json_data['values'][2:])
+    mask_df = pd.DataFrame(dict(enumerate(columns)))
     mask_df.columns=HEADERS
     
     # Using DataFrame.drop
@@ -28,77 +42,91 @@ def download_findthemasks_data(url,request_headers, write_out_csv=False):
     # Rename long column header: drop off instructions
     mask_df.rename(columns={'Drop off instructions, eg curbside procedure or mailing address. If you want donors to email or call you, please include contact info that can be made public in this field:': 'Drop_Off_Instructions'}, inplace=True)
 
-    # Download a local copy of the find the masks json object
-    if write_out_csv == True:
-        timestr = time.strftime("%Y%m%d")
-        path = 'find_the_mask_json_' + timestr + '.csv'
-        mask_df.to_csv (path, index = False, header=True)
+    # Save a local copy of the find the masks json object
+    if write_out_checkpoint:
+        write_checkpoint('findthemasks_json', mask_df)
     
     return mask_df
 
 
-def download_nytimes_data(url, date, write_out_csv = True):
-    covid_df = pd.read_csv(url)
-    covid_df = covid_df.loc[covid_df['date'] == date]
+# Columns and compact dtypes needed from the NYTimes us-counties.csv history
+NYTIMES_DTYPES = {
+    'date': str,
+    'county': str,
+    'state': str,
+    'fips': 'float64',
+    'cases': 'float32',
+    'deaths': 'float32',
+}
 
+def fix_nytimes_fips(chunk):
+    """Fill in the fips the NYTimes data leaves out, and convert them to fips codes"""
     # NYC data is missing county, so make them all New York County.
-    covid_df.loc[covid_df['county'] == 'New York City', 'fips'] = '36061'
+    chunk.loc[chunk['county'] == 'New York City', 'fips'] = 36061
     # Kansas City data is missing the specific county so make them all Cook County
-    covid_df.loc[(covid_df['county'] == 'Kansas City') & 
-              (covid_df['state'] == 'Missouri'), 'fips'] = '29095'
-    
-    # drop the rows without a fips value
-    covid_df = covid_df.dropna(how='any', subset=['fips'])
+    chunk.loc[(chunk['county'] == 'Kansas City') &
+              (chunk['state'] == 'Missouri'), 'fips'] = 29095
 
-    # convert to int to remove the decimal values
-    covid_df['fips'] = covid_df['fips'].apply(int)
-    
-    # Zfill all countyFIPS to be 5 characters
-    width=5
-    covid_df["fips"]= covid_df["fips"].astype(str)
-    covid_df["fips"]= covid_df["fips"].str.zfill(width) 
-        
-    # write out this data file to csv
-    if write_out_csv:
-        timestr = time.strftime("%Y%m%d")
-        path = 'COVID19_nytimes_' + date + ' data_processed_on_' + timestr + '.csv'
-        covid_df.to_csv (path, index = False, header=True)
+    # drop the rows without a fips value
+    chunk['fips'] = to_fips(chunk['fips'])
+    return chunk.dropna(how='any', subset=['fips']).copy()
+
+@traced
+def read_nytimes_county_data(filepath_or_buffer, date, chunksize=200000):
+    """Stream the NYTimes county history in chunks, keeping only the rows for date"""
+    chunks = []
+    for chunk in pd.read_csv(filepath_or_buffer, usecols=list(NYTIMES_DTYPES),
+                             dtype=NYTIMES_DTYPES, chunksize=chunksize):
+        # The history is sorted by date, so stop once we have read past it
+        if chunk['date'].iloc[0] > date:
+            break
+        chunk = chunk.loc[chunk['date'].values == date].copy()
+        if len(chunk) == 0:
+            continue
+        chunks.append(fix_nytimes_fips(chunk))
+
+    if not chunks:
+        return normalize(pd.DataFrame(columns=list(NYTIMES_DTYPES)), 'covid_df')
+    return normalize(pd.concat(chunks, ignore_index=True), 'covid_df')
+
+
+@traced
+@accepts_write_out_csv
+def download_nytimes_data(url, date, write_out_checkpoint = True):
+    # Read the cached file from disk chunk by chunk instead of loading the full history
+    covid_df = read_nytimes_county_data(cached_path(url, source='nytimes'), date)
+
+    # write out a typed checkpoint of this data file
+    if write_out_checkpoint:
+        write_checkpoint('nytimes_covid_' + date.replace('-', ''), covid_df)
 
     return covid_df
 
-def remove_negative_values_replace_with_zero(n):
-    if n < 0:
-        return 0
-    return n
-
-def download_hospital_data(url, write_out_csv = True):
-    hospital_df = pd.read_csv(url)
+@traced
+@accepts_write_out_csv
+def download_hospital_data(url, write_out_checkpoint = True):
+    hospital_df = pd.read_csv(BytesIO(cached_get(url, source='hospital')))
 
     # TODO: Move this processing code probably into data processing class
-    
-    # TODO: Leverage geocoder class instead of this code
-    af = addfips.AddFIPS()
 
-    # Reverse geocoder used to get geocoded fips and county information
-    # Note: Progress_apply is used for the timer functionality
-    hospital_df['fips'] = hospital_df.apply(
-        lambda x: (af.get_county_fips(x['COUNTY'], x['STATE'])), axis=1)
-    
+    # Resolve the county fips for all hospitals with one join against the addfips names
+    hospital_df['fips'] = get_fips_lookup_table().resolve(
+        hospital_df['COUNTY'], hospital_df['STATE'])
+
     # clean the BEDS column to make sure all are positive in value, by converting negative beds to 0
-    hospital_df['BEDS'] = hospital_df.apply(
-        lambda x: (remove_negative_values_replace_with_zero(x['BEDS'])), axis=1 )
+    hospital_df['BEDS'] = hospital_df['BEDS'].clip(lower=0)
+    normalize(hospital_df, 'hospital_df')
 
-    # write out this data file to csv
-    if write_out_csv:
-        timestr = time.strftime("%Y%m%d")
-        path = 'hospital_data_processed_' + timestr + '.csv'
-        hospital_df.to_csv (path, index = False, header=True)
+    # write out a typed checkpoint of this data file
+    if write_out_checkpoint:
+        write_checkpoint('hospital_data_processed', hospital_df)
 
     return hospital_df
 
 
+@traced
 def download_PPE_donors(url='https://docs.google.com/spreadsheet/ccc?key=1sW5jAik3olWGWtIC_i3khBEO6Hltj5SfzyM9mDoTeUc&output=csv'):
-    ppe_donors_df = pd.read_csv(url)
+    ppe_donors_df = pd.read_csv(BytesIO(cached_get(url, source='ppe_donors')))
     
     # Rename the column
     ppe_donors_df.rename(inplace=True, columns={
@@ -106,64 +134,60 @@ def download_PPE_donors(url='https://docs.google.com/spreadsheet/ccc?key=1sW5jAi
         'Zip Code':'zip'
     })
     
-    # Zfill all countyFIPS to be 5 characters
-    width=5
-    ppe_donors_df["zip"]= ppe_donors_df["zip"].astype(str)
-    ppe_donors_df["zip"]= ppe_donors_df["zip"].str.zfill(width) 
+    # Zip codes as codes, missing where they are not a zip code
+    normalize(ppe_donors_df, 'ppe_donors_df')
     
     # Clean the data by dropping rows that are missing name, instituion, zip code
     ppe_donors_df = ppe_donors_df.dropna(how='any', subset=['zip', 'Name'])
     
-    # Make the zip column a string
-    ppe_donors_df['zip']=ppe_donors_df['zip'].astype(str)
-    
     # Clean the data by dropping columns that are not needed
     ppe_donors_df.drop(['State'],axis=1, inplace=True)
     
     return ppe_donors_df
 
 
+@traced
 def download_zip_to_fips_data(url='https://docs.google.com/spreadsheet/ccc?key=1XivjeJ-NaTiVJYhEXYoCONI_6aZHlKAp5v3qUb6gZd4&output=csv'):
-    zip_fips_df = pd.read_csv(url)
+    zip_fips_df = pd.read_csv(BytesIO(cached_get(url, source='zip_to_fips')))
     
     # remove the word county from all counties
     zip_fips_df["county"] = zip_fips_df["county"].str.replace(" County", "")
     
-    # map the zip to a string to join later
-    zip_fips_df['zip']=zip_fips_df['zip'].astype(str)
-    
     # Clean the data by dropping columns that are not needed
     zip_fips_df.drop(['classfp'],axis=1, inplace=True)
     
-    return zip_fips_df
+    # zip and fips as 5 digit codes to join on later
+    return normalize(zip_fips_df, 'zip_fips_df')
 
-def download_ideo_merged_data(url, zip_fips_df, write_out_csv = True):
-    ideo_df = pd.read_csv(url)
-    
-    # zfill the fips to make sure they are right
-    width=5
-    zip_fips_df["fips"]= zip_fips_df["fips"].astype(str)
-    zip_fips_df["fips"]= zip_fips_df["fips"].str.zfill(width) 
-    zip_fips_df["zip"]= zip_fips_df["zip"].astype(str)
-    zip_fips_df["zip"]= zip_fips_df["zip"].str.zfill(width) 
-    ideo_df["zip"]= ideo_df["zip"].astype(str)
-    ideo_df["zip"]= ideo_df["zip"].str.zfill(width) 
+@traced
+@accepts_write_out_csv
+def download_ideo_merged_data(url, zip_table=None, write_out_checkpoint = True):
+    # the zip lookup table saved next to this file (built the first time) unless one
+    # is given; a zip to fips data frame, as passed before the table, is compiled to one
+    if zip_table is None:
+        zip_table = load_zip_lookup_table(ZIP_TABLE_PATH, download_zip_to_fips_data, ZIP_LAT_LON_URL)
+    elif isinstance(zip_table, pd.DataFrame):
+        zip_table = zip_lookup_table.from_frames(zip_table)
+
+    ideo_df = pd.read_csv(BytesIO(cached_get(url, source='ideo')))
     
-    # join the ppe_donors with the zip code to add fips, state, county info
-    ideo_df = ideo_df.join(zip_fips_df.set_index('zip'),
-             how='left',on='zip', lsuffix='donors', rsuffix='zip')
+    # add fips, state, county info of the zip codes from the zip lookup table, and
+    # the zip code's location as the requester's where the survey has none
+    zip_info = zip_table.lookup(ideo_df['zip'])
+    ideo_df['zip'] = to_zip(ideo_df['zip'])
+    columns = ['fips', 'county', 'state'] + [c for c in ['lat', 'lon'] if c not in ideo_df.columns]
+    ideo_df = ideo_df.join(zip_info[columns], lsuffix='donors', rsuffix='zip')
     
     # Clean the data by dropping rows that are missing fips
     ideo_df = ideo_df.dropna(how='any', subset=['fips'])  
     
     ideo_df.rename(inplace=True, columns={
         'statezip': 'State', })
+    normalize(ideo_df, 'mask_df')
     
-    # write out this data file to csv
-    if write_out_csv:
-        timestr = time.strftime("%Y%m%d")
-        path = 'ideo_data_processed_' + timestr + '.csv'
-        ideo_df.to_csv (path, index = False, header=True)
+    # write out a typed checkpoint of this data file
+    if write_out_checkpoint:
+        write_checkpoint('ideo_data_processed', ideo_df)
 
     return ideo_df
 
@@ -1,23 +1,26 @@
 from geocode import geocoder
+import numpy as np
 import pandas as pd
-import time
-import requests
 import json
 import us
-
-def requests_per_county(mask_df, write_out_csv = True):
+from metrics import compute_metrics
+from download_cache import cached_path
+from checkpoint import write_checkpoint, accepts_write_out_csv
+from instrument import traced
+from json_stream import iter_items
+from schema import normalize, to_fips
+from matching import match_requesters
+
+@traced
+@accepts_write_out_csv
+def requests_per_county(mask_df, write_out_checkpoint = True):
     # Count the amount of requests per county
-    mask_df_counties=mask_df.groupby(['fips','county','State']).size().reset_index(name='counts')
+    mask_df_counties=mask_df.groupby(['fips','county','State'], observed=True).size().reset_index(name='counts')
+    normalize(mask_df_counties, 'mask_df_counties')
     
-    # write out this data file to csv
-    if write_out_csv:
-        timestr = time.strftime("%Y%m%d")
-        path = 'findthemasks_data_processed_' + timestr + '.csv'
-        mask_df_counties.to_csv (path, index = False, header=True)
-
-        ##### TODO
-        # Some of the data written out is corrupted and misaligned by row
-        # Not sure what the bug is right now
+    # write out a typed checkpoint of this data file
+    if write_out_checkpoint:
+        write_checkpoint('findthemasks_data_processed', mask_df_counties)
     
     return mask_df_counties
 
@@ -32,6 +35,7 @@ def is_coordinates(lat, lng):
         return False
 
 
+@traced
 def add_fips_county_info_v2(mask_df, geocoder):
     """add FIPS based on Lat and Lng, and remove rows that could not be mapped"""
 
@@ -44,15 +48,16 @@ def add_fips_county_info_v2(mask_df, geocoder):
 
     # get nearest county and fips on entire vectors
     print ('Pulling geocodes from Lat+Lng.')
-    mask_df.loc[:,'geocoder'] = geocoder.get_geocoder_info_from_rg_vector(
-    mask_df['Lat'], mask_df['Lng'])
+    geocodes = geocoder.get_geocoder_info_vector(mask_df['Lat'], mask_df['Lng'])
+
+    # Map the geocoder dicts to individual columns
+    mask_df.loc[:, 'fips'] = [info['fips'] for info in geocodes]
+    mask_df.loc[:, 'county'] = [info['county'] for info in geocodes]
+    mask_df.drop(columns=['is_coordinates'], inplace=True)
 
-    # Map the geocoder dict column to individual columns
-    mask_df.loc[:, 'fips'] = mask_df.apply(
-        lambda x: x['geocoder']['fips'], axis=1)
-    mask_df.loc[:, 'county'] = mask_df.apply(
-        lambda x: x['geocoder']['county'], axis=1)
-    mask_df.drop(columns=['geocoder', 'is_coordinates'], inplace=True)
+    # fips the geocoder could not find ('NA' or None) become missing here
+    mask_df['fips'] = to_fips(mask_df['fips'])
+    normalize(mask_df, 'mask_df')
 
     # Using DataFrame.drop to remove any fips code that could not be mapped
     # (no longer necessary due to earlier filter)
@@ -61,25 +66,38 @@ def add_fips_county_info_v2(mask_df, geocoder):
     return mask_df
 
 
+@traced
+def download_county_geojson(geojson_url):
+    # Stream the features of the cached download
+    with open(cached_path(geojson_url, source='county_geojson'), 'rb') as f:
+        return {'type': 'FeatureCollection', 'features': list(iter_items(f, 'features'))}
+
+
+@traced
 def download_county_geojson_and_merge_df(geojson_url, mask_df_counties):
-    # Download the data
-    s=requests.get(geojson_url).text
+    counties = download_county_geojson(geojson_url)
+    merged_df = merge_county_geojson_df(counties, mask_df_counties)
 
-    # Extract the json format, and find column headers
-    counties = json.loads(s)
-    
-    # Create counties_df from geojson counties object
-    counties_df = pd.DataFrame.from_dict(counties['features'])
-    counties_df['properties'][0]
+    # return a json object called counties for plotting, and a counties_df for joins+manipulation of other data
+    return counties, merged_df
 
-    # extract properties dict, then concatenate new clumsn and remove old properties column
-    counties_df = pd.concat(
-        [counties_df, pd.json_normalize(counties_df['properties'])], axis=1).drop(['properties'], axis=1)
+
+@traced
+def merge_county_geojson_df(counties, mask_df_counties):
+    # Create counties_df from geojson counties object: one column per feature member,
+    # then one per property, filled straight from the features
+    features = counties['features']
+    members = [k for k in dict.fromkeys(k for f in features for k in f) if k != 'properties']
+    properties = [f.get('properties') or {} for f in features]
+    columns = {k: [f.get(k) for f in features] for k in members}
+    columns.update({k: [p.get(k) for p in properties]
+        for k in dict.fromkeys(k for p in properties for k in p)})
+    counties_df = pd.DataFrame(columns)
 
     # clean up the dataframe                                                                               
     counties_df.drop(['type','COUNTY','LSAD'], axis=1, inplace=True)
     counties_df.rename(columns={'id':'fips','NAME':'county'}, inplace=True)
-    counties_df.head()
+    counties_df['fips'] = to_fips(counties_df['fips'])
     
     # join with the dataframe that has ppe requests: mask_df
     merged_df = counties_df.join(
@@ -92,21 +110,19 @@ def download_county_geojson_and_merge_df(geojson_url, mask_df_counties):
     # change name of column 'counts' to 'PPE_requests' 
     merged_df.rename(inplace=True,
         columns={'counts':'PPE_requests'})
+    normalize(merged_df, 'merged_df')
     
     # Map fips state code to state name
     merged_df['STATE'] = merged_df.apply(
         lambda x: us.states.lookup(x['STATE']), axis=1)
-    merged_df['county_info_for_map'] = merged_df.apply(
-        lambda x: ('PPE Requests: %s, %s'%(x['county'],x['STATE'])), axis=1)
-    
-    # Create text column for use in mapping
-    merged_df['ppe_text'] = 'PPE Requests: ' + merged_df['PPE_requests'].astype(int).astype(str) + '<br>'+ \
-        merged_df['county'].astype(str) + ', ' + merged_df['STATE'].astype(str)
-    
-    # return a json object called counties for plotting, and a counties_df for joins+manipulation of other data
-    return counties, merged_df
+
+    # Hover text for the maps is rendered on demand, see hover_text.py
+
+    # return a counties_df for joins+manipulation of other data
+    return merged_df
 
 
+@traced
 def merge_covid_ppe_df(covid_df,merged_df): 
     merged_covid_ppe_df = merged_df.join(
         covid_df[['fips','cases','deaths']].set_index('fips'),
@@ -115,14 +131,8 @@ def merge_covid_ppe_df(covid_df,merged_df):
     # fill the NA in counts with 0s
     merged_covid_ppe_df['cases'].fillna(0, inplace=True)
     merged_covid_ppe_df['deaths'].fillna(0, inplace=True)
-    
-    # Create text column for use in mapping
-    merged_covid_ppe_df['covid_text'] = merged_covid_ppe_df['county'].astype(str) + ', ' + \
-        merged_covid_ppe_df['STATE'].astype(str) + '<br><br>'+\
-        'Covid19: ' + '<br>'+ \
-        'Cases: ' + merged_covid_ppe_df['cases'].astype(int).astype(str) + '<br>'+ \
-        'Deaths: ' + merged_covid_ppe_df['deaths'].astype(int).astype(str) + '<br><br>'+ \
-        'PPE Requests: ' + merged_covid_ppe_df['PPE_requests'].astype(int).astype(str)
+    # a join on fips categoricals with other categories gives plain strings
+    normalize(merged_covid_ppe_df, 'merged_covid_ppe_df')
 
     # TODO: Merge the counties geojson for all of new york
     '''
@@ -139,19 +149,21 @@ def merge_covid_ppe_df(covid_df,merged_df):
     return merged_covid_ppe_df
 
 
-def process_hospital_data(hospital_df, write_out_csv = True):
+@traced
+@accepts_write_out_csv
+def process_hospital_data(hospital_df, write_out_checkpoint = True):
     # Sum the amount of beds per county
-    hospital_df_counties = hospital_df.groupby(['fips','COUNTY'])['BEDS'].sum().reset_index()
+    hospital_df_counties = hospital_df.groupby(['fips','COUNTY'], observed=True)['BEDS'].sum().reset_index()
+    normalize(hospital_df_counties, 'hospital_df_counties')
 
-    # write out this data file to csv
-    if write_out_csv:
-        timestr = time.strftime("%Y%m%d")
-        path = 'hospital_data_county_data_' + timestr + '.csv'
-        hospital_df_counties.to_csv (path, index = False, header=True)
+    # write out a typed checkpoint of this data file
+    if write_out_checkpoint:
+        write_checkpoint('hospital_data_county_data', hospital_df_counties)
         
     return hospital_df_counties
 
 
+@traced
 def merge_covid_ppe_hosp_df(hospital_df_counties,merged_covid_ppe_df): 
     merged_covid_ppe_hosp_df = merged_covid_ppe_df.join(
         hospital_df_counties[['fips','BEDS']].set_index('fips'),
@@ -159,56 +171,27 @@ def merge_covid_ppe_hosp_df(hospital_df_counties,merged_covid_ppe_df):
     
     # fill the NA in counts with 0s
     merged_covid_ppe_hosp_df['BEDS'].fillna(0, inplace=True)
-    
-    # Create text column for use in mapping
-    merged_covid_ppe_hosp_df['hosp_text'] = merged_covid_ppe_hosp_df['county'].astype(str) + ', ' + \
-        merged_covid_ppe_hosp_df['STATE'].astype(str) + '<br><br>'+\
-        'Hospital Beds: ' + merged_covid_ppe_hosp_df['BEDS'].astype(int).astype(str) + '<br>'+ \
-        '<br>'+ \
-        'Covid19: ' + '<br>'+ \
-        'Cases: ' + merged_covid_ppe_hosp_df['cases'].astype(int).astype(str) + '<br>'+ \
-        'Deaths: ' + merged_covid_ppe_hosp_df['deaths'].astype(int).astype(str) + '<br><br>'+ \
-        'PPE Requests: ' + merged_covid_ppe_hosp_df['PPE_requests'].astype(int).astype(str)
+    normalize(merged_covid_ppe_hosp_df, 'merged_covid_ppe_hosp_df')
         
     return merged_covid_ppe_hosp_df
 
 
-# In order to avoid divide by zero problem in lambda function within calculate_covid_per_bed_available
-def weird_division(n, d):
-    return n / d if d else 0
-
-def weird_division_for_covid_cases_per_ppe(n, d):
-    if d ==0:
-        return 'NA'
-    return n / d if d else 0
-
+@traced
 def calculate_covid_per_bed_available(merged_covid_ppe_hosp_df):
     # calculate the covid patients per bed, adding the column that saves this info
-    merged_covid_ppe_hosp_df['Covid_cases_per_bed'] = merged_covid_ppe_hosp_df.apply(
-            lambda x: (weird_division(x['cases'], x['BEDS'])), axis=1)
+    compute_metrics(merged_covid_ppe_hosp_df, ['Covid_cases_per_bed'])
     
     # sort by highest normalized_covid_patients_per_bed
     merged_covid_ppe_hosp_df.sort_values(by='Covid_cases_per_bed', ascending=False, inplace=True)
     
-    # Create text column for use in mapping
-    merged_covid_ppe_hosp_df['hosp_text'] = merged_covid_ppe_hosp_df['county'].astype(str) + ', ' + \
-        merged_covid_ppe_hosp_df['STATE'].astype(str) + '<br><br>'+ \
-        'COVID19 Cases Per Hospital Bed): ' + merged_covid_ppe_hosp_df['Covid_cases_per_bed'].astype(float).astype(str) + '<br><br>'+ \
-        'Hospital Beds: ' + merged_covid_ppe_hosp_df['BEDS'].astype(int).astype(str) + '<br>'+ \
-        '<br>'+ \
-        'COVID19: ' + '<br>'+ \
-        'Cases: ' + merged_covid_ppe_hosp_df['cases'].astype(int).astype(str) + '<br>'+ \
-        'Deaths: ' + merged_covid_ppe_hosp_df['deaths'].astype(int).astype(str) + '<br><br>'+ \
-        'PPE Requests: ' + merged_covid_ppe_hosp_df['PPE_requests'].astype(int).astype(str)
-    
     return merged_covid_ppe_hosp_df
 
 
+@traced
 def calculate_covid_cases_per_ppe_request(merged_covid_ppe_hosp_df):
     # calculate the covid patients per bed, adding the column that saves this info
     # Only keeping counties with any requests
-    merged_covid_ppe_hosp_df['Covid_cases_per_PPE_requests'] = merged_covid_ppe_hosp_df.apply(
-            lambda x: (weird_division(x['cases'], x['PPE_requests'])), axis=1)
+    compute_metrics(merged_covid_ppe_hosp_df, ['Covid_cases_per_PPE_requests'])
 
     # Drop the counties with no ppe requests
     merged_covid_ppe_hosp_df.dropna(
@@ -217,21 +200,12 @@ def calculate_covid_cases_per_ppe_request(merged_covid_ppe_hosp_df):
     # fill the NA in normalized_covid_patients_per_bedwith 0s
     merged_covid_ppe_hosp_df['PPE_requests'].fillna(0, inplace=True)
     merged_covid_ppe_hosp_df['Covid_cases_per_PPE_requests'].fillna(0, inplace=True)
-
-    # Create text column for use in mapping
-    merged_covid_ppe_hosp_df['covid_ppe_text'] = merged_covid_ppe_hosp_df['county'].astype(str) + ', ' + \
-        merged_covid_ppe_hosp_df['STATE'].astype(str) + '<br><br>'+ \
-        'COVID19 Cases Per PPE Request ' + merged_covid_ppe_hosp_df['Covid_cases_per_PPE_requests'].astype(float).astype(str) + '<br><br>'+ \
-        '<br>'+ \
-        'Covid19: ' + '<br>'+ \
-        'Cases: ' + merged_covid_ppe_hosp_df['cases'].astype(int).astype(str) + '<br>'+ \
-        'Deaths: ' + merged_covid_ppe_hosp_df['deaths'].astype(int).astype(str) + '<br><br>'+ \
-        'PPE Requests: ' + merged_covid_ppe_hosp_df['PPE_requests'].astype(int).astype(str)
     
     return merged_covid_ppe_hosp_df
 
 
 
+@traced
 def find_counties_with_covid19_and_no_ppe_request(covid_df, mask_df_counties):
     # join the covid patients dataframe with the beds per county dataframe, on the fips index
     covid_ppe_df = covid_df.join(
@@ -253,57 +227,62 @@ def find_counties_with_covid19_and_no_ppe_request(covid_df, mask_df_counties):
     
     return covid_ppe_df
 
-def add_all_ppe_requests_to_merged_df(mask_df,merged_df):
-    # get all fips code in the mask_df frame
-    unique_fips=mask_df.fips.unique()
-
-    for fip in unique_fips:
-        # get all entries that have the same fip code and convert to dict, then string
-        value = json.dumps(mask_df[mask_df['fips']==fip].to_dict())
-
-        # select rows where the fips code equals fip
-        merged_df.loc[merged_df['fips'] == str(fip),'all_ppe_requests']=value
+@traced
+def add_all_ppe_requests_to_merged_df(mask_df, merged_df, compact=False, side_file=None):
+    """Attach every county's ppe requests to merged_df as a json string in 'all_ppe_requests'.
+
+    compact=True serializes each county as {"columns": [...], "index": [...], "data": [[...]]}
+    instead of the default {column: {index: value}}. With side_file, the payloads are
+    written to that json file keyed by fips instead of being added to merged_df.
+    """
+    # serialize the requests of each county once, in a single pass over mask_df;
+    # per county slices of plain object columns serialize faster than categoricals
+    mask_df = mask_df.astype({c: object for c in mask_df.columns if mask_df[c].dtype.name == 'category'})
+    payloads = {}
+    for fip, county_requests in mask_df.groupby('fips', sort=False):
+        if compact:
+            payloads[str(fip)] = county_requests.to_json(orient='split')
+        else:
+            payloads[str(fip)] = json.dumps(county_requests.to_dict())
+
+    if side_file is not None:
+        with open(side_file, 'w') as f:
+            f.write('{' + ','.join(
+                '%s:%s' % (json.dumps(fip), value) for fip, value in payloads.items()) + '}')
+        return merged_df
+
+    # attach with one keyed lookup on fips, counties without requests get 0
+    merged_df['all_ppe_requests'] = merged_df['fips'].astype(str).map(payloads).fillna(0)
+
+    # How to pull array of dicts from 'all_ppe_requests' category
+    '''
+    all_ppe_locations_array= json.loads(merged_df.loc[
+        merged_df['fips'] == '01073', 'all_ppe_requests'].values[0])
+    '''
 
-        # fill the NA in normalized_covid_patients_per_bedwith 0s
-        merged_df['all_ppe_requests'].fillna(0, inplace=True)
-        
-        # How to pull array of dicts from 'all_ppe_requests' category
-        ''' 
-        all_ppe_locations_array= eval(str(merged_df.loc[
-            merged_df['fips'] == '01073', 'all_ppe_requests'].values))
-        '''
-        
     return merged_df
 
 
-def add_fips_ppe_donors(ppe_donors_df, zip_fips_df):
-    # zfill the fips to make sure they are right
-    width=5
-    zip_fips_df["fips"]= zip_fips_df["fips"].astype(str)
-    zip_fips_df["fips"]= zip_fips_df["fips"].str.zfill(width) 
-    zip_fips_df["zip"]= zip_fips_df["zip"].astype(str)
-    zip_fips_df["zip"]= zip_fips_df["zip"].str.zfill(width) 
-    
-    # join the ppe_donors with the zip code to add fips, state, county info
-    ppe_donors_with_zip_df = ppe_donors_df.join(zip_fips_df.set_index('zip'),
-                                         how='left',on='zip', lsuffix='donors', rsuffix='zip')
+@traced
+def add_fips_ppe_donors(ppe_donors_df, zip_table):
+    # add fips, state, county, lat and lon info of the donors' zip codes from the zip lookup table
+    ppe_donors_with_zip_df = ppe_donors_df.join(zip_table.lookup(ppe_donors_df['zip']),
+                                         lsuffix='donors', rsuffix='zip')
     
     # Clean the data by dropping rows that are missing fips
     ppe_donors_with_zip_df = ppe_donors_with_zip_df.dropna(how='any', subset=['fips'])  
     
-    # join the ppe_donors with the zip code to add fips, state, county info
-    ppe_donors_with_zip_df = ppe_donors_with_zip_df.join(zip_lat_long_df.set_index('zip'),
-                                         how='left',on='zip', lsuffix='donors', rsuffix='lat_lon')
-    
     # Clean the data by dropping rows that are missing lat lon
     ppe_donors_with_zip_df = ppe_donors_with_zip_df.dropna(how='any', subset=['lat'])  
     
     return ppe_donors_with_zip_df
 
+@traced
+@accepts_write_out_csv
 def donors_per_county(ppe_donors_with_zip_df, 
-    merged_covid_ppe_hosp_df, write_out_csv = True):
+    merged_covid_ppe_hosp_df, write_out_checkpoint = True):
     # Count the amount of requests per county
-    donors_df_counties=ppe_donors_with_zip_df.groupby(['fips']).size().reset_index(name='ppe_donors')
+    donors_df_counties=ppe_donors_with_zip_df.groupby(['fips'], observed=True).size().reset_index(name='ppe_donors')
     
     # merge the donors with the larger dataframe
     merged_covid_ppe_hosp_donors_df = merged_covid_ppe_hosp_df.join(
@@ -312,48 +291,19 @@ def donors_per_county(ppe_donors_with_zip_df,
     
     # fill the NA in counts with 0s
     merged_covid_ppe_hosp_donors_df['ppe_donors'].fillna(0, inplace=True)
-    
-    # Create text column for use in mapping
-    merged_covid_ppe_hosp_donors_df['ppe_donors_requests_text'] = merged_covid_ppe_hosp_donors_df['county'].astype(str) + ', ' + \
-        merged_covid_ppe_hosp_donors_df['STATE'].astype(str) + '<br><br>'+\
-        'PPE Donors:' + merged_covid_ppe_hosp_donors_df['ppe_donors'].astype(int).astype(str) + '<br>'+ \
-        'PPE Requests:' + merged_covid_ppe_hosp_donors_df['PPE_requests'].astype(int).astype(str) + '<br><br>'+ \
-        'Covid19: ' + '<br>'+ \
-        'Cases: ' + merged_covid_ppe_hosp_donors_df['cases'].astype(int).astype(str) + '<br>'+ \
-        'Deaths: ' + merged_covid_ppe_hosp_donors_df['deaths'].astype(int).astype(str) + '<br><br>' + \
-        'HAZARD RATIO (Cases/Bed): ' + merged_covid_ppe_hosp_donors_df['Covid_cases_per_bed'].astype(float).astype(str) 
 
     return merged_covid_ppe_hosp_donors_df
 
-# In order to avoid divide by zero problem in lambda function within calculate_donor_per_requester
-def weird_division_for_donor_per_requester(n, d):
-    if n ==0:
-        return 'NA'
-    return n / d if d else 0
-
+@traced
 def calculate_donor_per_requester(merged_covid_ppe_hosp_donors_df):
-    # calculate the covid patients per bed, adding the column that saves this info
-    merged_covid_ppe_hosp_donors_df['PPE_Donor_Per_Requester'] = merged_covid_ppe_hosp_donors_df.apply(
-            lambda x: (weird_division_for_donor_per_requester(x['ppe_donors'], x['PPE_requests'])), axis=1)
-    
-    # Create text column for use in mapping
-    merged_covid_ppe_hosp_donors_df['ppe_donors_requests_ratio_text'] = merged_covid_ppe_hosp_donors_df['county'].astype(str) + ', ' + \
-        merged_covid_ppe_hosp_donors_df['STATE'].astype(str) + '<br><br>'+\
-        'GetUsPPE Donors per Requester: ' + merged_covid_ppe_hosp_donors_df['PPE_Donor_Per_Requester'].astype(str) + '<br>'+\
-        'PPE Donors: ' + merged_covid_ppe_hosp_donors_df['ppe_donors'].astype(int).astype(str) + '<br>'+ \
-        'PPE Requests: ' + merged_covid_ppe_hosp_donors_df['PPE_requests'].astype(int).astype(str) + '<br><br>'+ \
-        'Covid19: ' + '<br>'+ \
-        'Cases: ' + merged_covid_ppe_hosp_donors_df['cases'].astype(int).astype(str) + '<br>'+ \
-        'Deaths: ' + merged_covid_ppe_hosp_donors_df['deaths'].astype(int).astype(str) + '<br><br>' + \
-        'HAZARD RATIO (Cases/Bed): ' + merged_covid_ppe_hosp_donors_df['Covid_cases_per_bed'].astype(float).astype(str) 
-    
-    # TODO
-    # Make idempotent, can't be run twice currently
+    # calculate the donors per requester (NaN for counties without donors), adding the column that saves this info
+    compute_metrics(merged_covid_ppe_hosp_donors_df, ['PPE_Donor_Per_Requester'])
     
     return merged_covid_ppe_hosp_donors_df
 
 
 # Taking original mask_df from the findthemasks website, rename to current convention
+@traced
 def create_requestor_df_for_querying_requesters(mask_df, merged_covid_ppe_hosp_df):
     requestor_info_df = mask_df.rename(columns={
         'Lat':'lat',
@@ -394,4 +344,35 @@ def create_requestor_df_for_querying_requesters(mask_df, merged_covid_ppe_hosp_d
         v)
     '''
     
-    return requestor_info_df
\ No newline at end of file
+    return requestor_info_df
+
+
+@traced
+def match_requesters_to_donors(requestor_info_df, ppe_donors_with_zip_df, capacity=1,
+    method='auction', k=10, max_km=250, hazard_weight=1.0):
+    """Assign every requester at most one donor, at most capacity requesters per donor.
+
+    capacity is a number or the name of a donor column. Requesters with a higher
+    Hazard_Index_Covid_Cases_Per_Hosp_Bed win donors in short supply, and closer
+    donors win otherwise (see matching.py). Adds the donor's index, Name and the
+    distance to it as 'donor', 'donor_name' and 'donor_km', missing for requesters
+    without a donor within max_km.
+    """
+    if isinstance(capacity, str):
+        capacity = ppe_donors_with_zip_df[capacity].fillna(0).to_numpy()
+    hazard = requestor_info_df.get('Hazard_Index_Covid_Cases_Per_Hosp_Bed')
+
+    donor, km = match_requesters(
+        requestor_info_df['lat'].values, requestor_info_df['lon'].values,
+        ppe_donors_with_zip_df['lat'].values, ppe_donors_with_zip_df['lon'].values,
+        capacity=capacity, hazard=None if hazard is None else hazard.to_numpy(dtype=float, na_value=0),
+        k=k, max_km=max_km, hazard_weight=hazard_weight, method=method)
+
+    matched = donor >= 0
+    requestor_info_df = requestor_info_df.copy()
+    requestor_info_df['donor'] = pd.Series(ppe_donors_with_zip_df.index[donor[matched]],
+        index=requestor_info_df.index[matched])
+    requestor_info_df['donor_name'] = pd.Series(ppe_donors_with_zip_df['Name'].values[donor[matched]],
+        index=requestor_info_df.index[matched])
+    requestor_info_df['donor_km'] = np.where(matched, km, np.nan)
+    return requestor_info_df
@@ -0,0 +1,214 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import requests
+
+# Default time to live per data source, in hours
+SOURCE_TTLS = {
+    'findthemasks': 1,
+    'ideo': 1,
+    'ppe_donors': 1,
+    'nytimes': 6,
+    'hospital': 24 * 7,
+    'zip_to_fips': 24 * 30,
+    'county_geojson': 24 * 30,
+    'county_fips': 24 * 30,
+}
+
+
+class download_cache:
+    """Persistent on-disk cache for downloaded files.
+
+    Payloads are stored once per content hash under blobs/, and index.json maps
+    each url to its blob plus the ETag/Last-Modified headers used to revalidate
+    it once its ttl has expired. In offline mode only cached payloads are used.
+    """
+    def __init__(self, cache_dir='.download_cache', max_mb=512, offline=False, ttls=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.offline = offline
+        self.ttls = dict(SOURCE_TTLS)
+        self.ttls.update(ttls or {})
+        # lock guards the index, url_locks stop two threads downloading the same url
+        self.lock = threading.Lock()
+        self.url_locks = {}
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        self.index = self._read_index()
+
+    def _read_index(self):
+        try:
+            with open(self.index_path) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    def _atomic_write(self, path, data):
+        # Write to a temporary file in the same folder, then rename over the target
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _blob_path(self, sha):
+        return os.path.join(self.cache_dir, 'blobs', sha[:2], sha)
+
+    def _read_blob(self, entry):
+        with open(self._blob_path(entry['sha256']), 'rb') as f:
+            return f.read()
+
+    def _save_index(self):
+        self._atomic_write(self.index_path, json.dumps(self.index, indent=1).encode())
+
+    def _store(self, url, chunks, headers):
+        # Stream the body to a temporary file while hashing it, then move it into place
+        blob_dir = os.path.join(self.cache_dir, 'blobs')
+        os.makedirs(blob_dir, exist_ok=True)
+        sha = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=blob_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    sha.update(chunk)
+                    size += len(chunk)
+                    f.write(chunk)
+            sha = sha.hexdigest()
+            os.makedirs(os.path.dirname(self._blob_path(sha)), exist_ok=True)
+            os.replace(tmp_path, self._blob_path(sha))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        now = time.time()
+        with self.lock:
+            self.index[url] = {
+                'sha256': sha,
+                'size': size,
+                'etag': headers.get('ETag'),
+                'last_modified': headers.get('Last-Modified'),
+                'fetched_at': now,
+                'last_access': now,
+            }
+            self._evict(keep=url)
+            self._save_index()
+            return self.index[url]
+
+    def _evict(self, keep=None):
+        # Drop the least recently used urls until the blobs fit in max_bytes
+        blob_sizes = {e['sha256']: e['size'] for e in self.index.values()}
+        total = sum(blob_sizes.values())
+        for url, entry in sorted(self.index.items(), key=lambda x: x[1]['last_access']):
+            if total <= self.max_bytes:
+                break
+            if url == keep:
+                continue
+            del self.index[url]
+            if entry['sha256'] not in [e['sha256'] for e in self.index.values()]:
+                total -= entry['size']
+                if os.path.exists(self._blob_path(entry['sha256'])):
+                    os.remove(self._blob_path(entry['sha256']))
+
+    def _touch(self, entry, fetched=False):
+        with self.lock:
+            entry['last_access'] = time.time()
+            if fetched:
+                entry['fetched_at'] = entry['last_access']
+            self._save_index()
+        return entry
+
+    def _url_lock(self, url):
+        with self.lock:
+            return self.url_locks.setdefault(url, threading.Lock())
+
+    def _fetch(self, url, source, headers):
+        # Return the index entry for url, downloading or revalidating it if needed
+        with self.lock:
+            entry = self.index.get(url)
+        if entry is not None and not os.path.exists(self._blob_path(entry['sha256'])):
+            entry = None
+
+        if self.offline:
+            if entry is None:
+                raise IOError('Offline mode and no cached copy of %s' % url)
+            return self._touch(entry)
+
+        ttl_hours = self.ttls.get(source, 0)
+        if entry is not None and time.time() - entry['fetched_at'] < ttl_hours * 3600:
+            return self._touch(entry)
+
+        # Revalidate an expired entry with a conditional request
+        request_headers = dict(headers or {})
+        if entry is not None:
+            if entry['etag']:
+                request_headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                request_headers['If-Modified-Since'] = entry['last_modified']
+
+        try:
+            response = requests.get(url, headers=request_headers, stream=True)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            if entry is None:
+                raise
+            print('Download of {} failed ({}), using cached copy.'.format(url, e))
+            return entry
+
+        with response:
+            if response.status_code == 304 and entry is not None:
+                return self._touch(entry, fetched=True)
+            return self._store(url, response.iter_content(chunk_size=1024 * 1024), response.headers)
+
+    def get(self, url, source=None, headers=None):
+        """Return the payload for url as bytes, downloading it only when needed"""
+        with self._url_lock(url):
+            entry = self._fetch(url, source, headers)
+            return self._read_blob(entry)
+
+    def put(self, url, data):
+        """Store data as the payload of url, e.g. to seed an offline cache with local files"""
+        with self._url_lock(url):
+            self._store(url, [data], {})
+
+    def path(self, url, source=None, headers=None):
+        """Return the path of the cached file for url, so it can be read incrementally"""
+        with self._url_lock(url):
+            entry = self._fetch(url, source, headers)
+            return self._blob_path(entry['sha256'])
+
+
+# Shared cache used by data_download and geocode
+default_cache = download_cache()
+
+def configure(cache_dir='.download_cache', max_mb=512, offline=False, ttls=None):
+    global default_cache
+    default_cache = download_cache(cache_dir, max_mb, offline, ttls)
+    return default_cache
+
+def configure_from_config(cache_config):
+    """Configure the shared cache from the [cache] section of config.ini"""
+    ttls = {key[len('ttl_'):]: float(value)
+        for key, value in cache_config.items() if key.startswith('ttl_')}
+    return configure(
+        cache_dir=cache_config.get('cache_dir', '.download_cache'),
+        max_mb=float(cache_config.get('max_mb', 512)),
+        offline=cache_config.getboolean('offline', False),
+        ttls=ttls)
+
+def cached_get(url, source=None, headers=None):
+    return default_cache.get(url, source=source, headers=headers)
+
+def cached_path(url, source=None, headers=None):
+    return default_cache.path(url, source=source, headers=headers)
+
+def cached_text(url, source=None, headers=None, encoding='utf-8'):
+    return cached_get(url, source=source, headers=headers).decode(encoding)
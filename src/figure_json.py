@@ -0,0 +1,145 @@
+import base64
+import hashlib
+import json
+import threading
+import uuid
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Same plotly.js as the pages written with include_plotlyjs='cdn'
+PLOTLYJS_URL = 'https://cdn.plot.ly/plotly-latest.min.js'
+
+# 1d numeric arrays at least this long are written as base64 typed arrays
+TYPED_ARRAY_MIN_SIZE = 64
+
+# JavaScript typed array of each numpy dtype written as one; others become float64
+TYPED_ARRAYS = {np.dtype('<f4'): 'Float32Array', np.dtype('<f8'): 'Float64Array',
+    np.dtype('<i4'): 'Int32Array', np.dtype('<u4'): 'Uint32Array', np.dtype('<i2'): 'Int16Array',
+    np.dtype('<u2'): 'Uint16Array', np.dtype('i1'): 'Int8Array', np.dtype('u1'): 'Uint8Array'}
+
+
+def _default(obj):
+    # numpy and pandas values the json module does not know
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if hasattr(obj, 'isoformat'):
+        return obj.isoformat()
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    raise TypeError('%r is not JSON serializable' % type(obj))
+
+
+def dumps(obj):
+    """Compact JSON text of obj, numpy arrays included, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(obj, separators=(',', ':'), default=_default)
+
+
+# Encoded objects by id (holding the object, so the id is not reused) and texts by content hash
+_encoded = {}
+_texts = {}
+_lock = threading.Lock()
+
+
+def encoded(obj):
+    """(content hash, JSON text) of obj, encoded once per object and shared by equal contents.
+
+    Meant for large objects that are not modified once built, such as the
+    county geojson every map shares.
+    """
+    with _lock:
+        hit = _encoded.get(id(obj))
+        if hit is not None and hit[0] is obj:
+            return hit[1], _texts[hit[1]]
+    text = dumps(obj)
+    digest = hashlib.blake2b(text.encode(), digest_size=8).hexdigest()
+    with _lock:
+        text = _texts.setdefault(digest, text)
+        _encoded[id(obj)] = (obj, digest)
+    return digest, text
+
+
+def geojson_loader_script(counties, geojson_key):
+    """Script that puts the geojson in plotly.js's geo asset store under geojson_key.
+
+    Traces whose geojson is the string geojson_key then share this one copy
+    instead of each embedding (or fetching) their own.
+    """
+    return ('<script type="text/javascript">'
+        'window.PlotlyGeoAssets = window.PlotlyGeoAssets || {};'
+        'window.PlotlyGeoAssets[%s] = %s;'
+        '</script>' % (json.dumps(geojson_key), encoded(counties)[1].replace('</', '<\\/')))
+
+
+def _extract_arrays(obj, arrays, token):
+    # obj with its long 1d numeric arrays replaced by placeholders, appended to arrays
+    if isinstance(obj, dict):
+        return {k: _extract_arrays(v, arrays, token) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_extract_arrays(v, arrays, token) for v in obj]
+    if isinstance(obj, np.ndarray) and obj.ndim == 1 and obj.dtype.kind in 'fiub' \
+            and len(obj) >= TYPED_ARRAY_MIN_SIZE:
+        dtype = obj.dtype.newbyteorder('<') if obj.dtype.byteorder == '>' else obj.dtype
+        dtype = dtype if dtype in TYPED_ARRAYS else np.dtype('<f8')
+        arrays.append(np.ascontiguousarray(obj, dtype=dtype))
+        return '%s%d' % (token, len(arrays) - 1)
+    return obj
+
+
+def figure_html(fig, head='', config=None, plotlyjs_url=PLOTLYJS_URL):
+    """Standalone html page of a plotly figure, like fig.to_html(include_plotlyjs='cdn').
+
+    The figure is encoded with dumps, its long numeric arrays (z values,
+    animation frames) as base64 typed arrays, and head (e.g. a
+    geojson_loader_script) is written before the plot is drawn.
+    """
+    div_id = str(uuid.uuid4())
+    token = '__typed_array_%s_' % uuid.uuid4().hex
+    arrays = []
+    figure = _extract_arrays(fig.to_plotly_json(), arrays, token)
+    text = dumps({'data': figure.get('data', []), 'layout': figure.get('layout', {}),
+        'frames': figure.get('frames', [])}).replace('</', '<\\/')
+    for i in range(len(arrays) - 1, -1, -1):
+        text = text.replace('"%s%d"' % (token, i), 'T[%d]' % i)
+    typed = ','.join('typed("%s",%s)' % (base64.b64encode(a.tobytes()).decode(), TYPED_ARRAYS[a.dtype])
+        for a in arrays)
+    config = dict({'responsive': True}, **(config or {}))
+    return '''<html>
+<head><meta charset="utf-8" /></head>
+<body>
+<script type="text/javascript">window.PlotlyConfig = {MathJaxConfig: 'local'};</script>
+<script src="%(plotlyjs_url)s"></script>
+%(head)s
+<div id="%(id)s" class="plotly-graph-div" style="height:100%%; width:100%%;"></div>
+<script type="text/javascript">
+(function () {
+  function typed(data, type) {
+    var text = atob(data), bytes = new Uint8Array(text.length);
+    for (var i = 0; i < text.length; i++) { bytes[i] = text.charCodeAt(i); }
+    return new type(bytes.buffer);
+  }
+  var T = [%(typed)s];
+  var figure = %(figure)s;
+  Plotly.newPlot("%(id)s", figure.data, figure.layout, %(config)s).then(function () {
+    if (figure.frames.length) { return Plotly.addFrames("%(id)s", figure.frames); }
+  });
+})();
+</script>
+</body>
+</html>''' % dict(plotlyjs_url=plotlyjs_url, head=head, id=div_id, typed=typed, figure=text,
+        config=json.dumps(config))
+
+
+def write_figure_html(fig, html_filename, counties=None, geojson_key='counties', config=None):
+    """Write figure_html(fig) to html_filename, with the counties geojson under geojson_key if given"""
+    head = geojson_loader_script(counties, geojson_key) if counties is not None else ''
+    with open(html_filename, 'w') as f:
+        f.write(figure_html(fig, head, config))
@@ -0,0 +1,83 @@
+import re
+import addfips
+import pandas as pd
+
+class fips_lookup_table:
+    """Precompiled (state, county name) -> county FIPS table built from the addfips data.
+
+    Names are normalized the same way addfips does (lower case, no diacritics),
+    so resolve() gives the same codes as AddFIPS.get_county_fips, but joins a
+    whole column at once instead of calling it row by row.
+    """
+    def __init__(self, af=None):
+        # reads the state and county dicts AddFIPS builds internally, which is why
+        # requirements.txt pins addfips
+        self.af = af or addfips.AddFIPS()
+        self.unresolved = pd.DataFrame(columns=['county', 'state', 'rows'])
+
+        # state name, postal code or fips -> state fips
+        self.state_map = dict(self.af._states)
+        self.state_map.update({fips: fips for fips in self.af._state_fips})
+
+        # one row per known spelling of every county
+        rows = [(state_fips, name, state_fips + county_fips)
+            for state_fips, counties in self.af._counties.items()
+            for name, county_fips in counties.items()]
+        self.table = pd.DataFrame(rows, columns=['state_fips', 'county_key', 'fips'])
+        self.lookup_dict = {(s, c): f for s, c, f in rows}
+
+    def normalize_counties(self, counties):
+        counties = pd.Series(counties, dtype=object)
+        return counties.str.lower().str.replace(
+            self.af.diacretic_pattern, self.af.delete_diacretics, regex=True)
+
+    def normalize_states(self, states):
+        states = pd.Series(states, dtype=object)
+        state_fips = states.map(self.state_map)
+        return state_fips.fillna(states.str.lower().map(self.state_map))
+
+    def lookup(self, county, state):
+        """Scalar lookup, equivalent to AddFIPS.get_county_fips"""
+        if not isinstance(county, str) or not isinstance(state, str):
+            return None
+        state_fips = self.state_map.get(state, self.state_map.get(state.lower()))
+        county_key = self.af._delete_diacretics(county.lower())
+        return self.lookup_dict.get((state_fips, county_key))
+
+    def resolve(self, counties, states):
+        """Return a Series of county fips (NaN where unresolved) for aligned county/state columns.
+
+        Unresolved (county, state) names and their row counts are kept in self.unresolved.
+        """
+        index = counties.index if isinstance(counties, pd.Series) else None
+        names = pd.DataFrame({
+            'county': pd.Series(counties, dtype=object).values,
+            'state': pd.Series(states, dtype=object).values})
+
+        # normalize each distinct name once, then join against the table
+        distinct = names.drop_duplicates().reset_index(drop=True)
+        distinct['state_fips'] = self.normalize_states(distinct['state']).values
+        distinct['county_key'] = self.normalize_counties(distinct['county']).values
+        distinct = distinct.merge(self.table, how='left', on=['state_fips', 'county_key'])
+
+        fips = names.merge(distinct[['county', 'state', 'fips']], how='left',
+            on=['county', 'state'])['fips']
+
+        # report the names that did not resolve
+        missing = names[fips.isna().values].fillna('')
+        self.unresolved = missing.groupby(['county', 'state']).size().reset_index(name='rows')
+        if len(missing):
+            print('{} rows ({} names) could not be resolved to a fips.'.format(
+                len(missing), len(self.unresolved)))
+
+        return pd.Series(fips.values, index=index, name='fips')
+
+
+_default_table = None
+
+def get_fips_lookup_table():
+    """Shared lookup table, built the first time it is needed"""
+    global _default_table
+    if _default_table is None:
+        _default_table = fips_lookup_table()
+    return _default_table
@@ -1,59 +1,142 @@
 import geopandas as gpd
 import reverse_geocoder as rg
 import addfips
-import requests
+import os
+import numpy as np
 import pandas as pd
+from fips_lookup import fips_lookup_table
+from geometry import county_polygon_index_cached
+from download_cache import cached_text
 
 class geocoder:
-    def __init__(self, county_fips_download_url):
+    """Fips and county of coordinates.
+
+    engine 'reverse_geocoder' names the county of the nearest populated place.
+    engine 'polygon' finds the county polygon of counties (the county geojson)
+    containing each point, and only falls back to the reverse geocoder for
+    points outside every county (e.g. just off the coast).
+    """
+    def __init__(self, county_fips_download_url, cache_path='geocoder_cache.csv',
+                 cache_decimals=4, engine='reverse_geocoder', counties=None):
+        if engine not in ('reverse_geocoder', 'polygon'):
+            raise ValueError('Unknown geocoder engine %s' % engine)
+        if engine == 'polygon' and counties is None:
+            raise ValueError('The polygon geocoder needs the county geojson')
+        self.engine = engine
         self.af = addfips.AddFIPS()
+        self.fips_table = fips_lookup_table(self.af)
         self.download_county_fips_info(county_fips_download_url)
-        
+
+        # Prebuilt point in polygon index of the counties, cached on disk per geojson
+        self.polygon_index = county_polygon_index_cached(counties) if engine == 'polygon' else None
+
+        # Load the reverse geocoder tree once (when first needed by the polygon engine),
+        # single process (mode 1) so no workers are started
+        self._rg = None if engine == 'polygon' else rg.RGeocoder(mode=1, verbose=False)
+
+        # (county, state) -> fips memo, and quantized (lat, lng) -> geocoder info cache
+        self.fips_memo = {}
+        self.cache_path = cache_path
+        self.cache_decimals = cache_decimals
+        self.coordinate_cache = self.load_coordinate_cache()
+
+    @property
+    def rg(self):
+        if self._rg is None:
+            self._rg = rg.RGeocoder(mode=1, verbose=False)
+        return self._rg
+
     def download_county_fips_info(self, url):
-        contents=requests.get(url).text
+        contents=cached_text(url, source='county_fips')
         with open('county_Fips.txt', 'w') as f:
-            f.write(contents)    
-        
+            f.write(contents)
+
     def fips_code_lookup(self, county, state):
-        # Lookup of fips code (https://github.com/fitnr/addfips)
-        fips = self.af.get_county_fips(county, state)
-        return fips
+        # Lookup of fips code (https://github.com/fitnr/addfips names, precompiled in fips_table)
+        key = (county, state)
+        if key not in self.fips_memo:
+            self.fips_memo[key] = self.fips_table.lookup(county, state)
+        return self.fips_memo[key]
 
-    def get_geocoder_info_from_rg(self, Lat, Lng):
-        try:
-            # Reverse geocoder api call to get county name
-            coordinates = (Lat, Lng)
-            results = rg.search(coordinates) # default mode = 2
-            county = results[0]['admin2']
-            state = results[0]['admin1']
+    def quantize(self, Lats, Lngs):
+        """Integer keys for coordinates rounded to cache_decimals (4 decimals is ~11 m)"""
+        scale = 10 ** self.cache_decimals
+        return (np.round(np.asarray(Lats, dtype=float) * scale).astype(np.int64),
+            np.round(np.asarray(Lngs, dtype=float) * scale).astype(np.int64))
+
+    def load_coordinate_cache(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return {}
+        cache_df = pd.read_csv(self.cache_path, dtype=str, keep_default_na=False)
+        # addfips returns None for unknown counties, which is written out as ''
+        return {(int(lat), int(lng)): {'fips': fips or None, 'county': county}
+            for lat, lng, fips, county in zip(
+                cache_df['lat_key'], cache_df['lng_key'], cache_df['fips'], cache_df['county'])}
 
-            # Lookup of fips code (https://github.com/fitnr/addfips)
-            fips = self.fips_code_lookup(county,state)
+    def save_coordinate_cache(self):
+        if not self.cache_path:
+            return
+        keys = list(self.coordinate_cache)
+        cache_df = pd.DataFrame({
+            'lat_key': [k[0] for k in keys],
+            'lng_key': [k[1] for k in keys],
+            'fips': [self.coordinate_cache[k]['fips'] for k in keys],
+            'county': [self.coordinate_cache[k]['county'] for k in keys],
+        })
+        tmp_path = self.cache_path + '.tmp'
+        cache_df.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, self.cache_path)
 
-            # return the fip and county
-            return {'fips':fips, 'county':county}
+    def get_geocoder_info_vector(self, Lats, Lngs):
+        """Returns a column of the form [{'fips': fips, 'county': county}] from the engine"""
+        if self.engine == 'polygon':
+            return self.get_geocoder_info_from_polygons_vector(Lats, Lngs)
+        return self.get_geocoder_info_from_rg_vector(Lats, Lngs)
+
+    def get_geocoder_info_from_polygons_vector(self, Lats, Lngs):
+        """Returns a column of the form [{'fips': fips, 'county': county}]"""
+        Lats = np.asarray(Lats, dtype=float)
+        Lngs = np.asarray(Lngs, dtype=float)
+        county = self.polygon_index.locate(Lats, Lngs)
+        ids, names = self.polygon_index.ids, self.polygon_index.names
+        fips_info_list = [{'fips': ids[c], 'county': names[c]} if c >= 0 else None for c in county.tolist()]
+
+        outside = np.nonzero(county < 0)[0]
+        if len(outside):
+            print('{} coordinates are outside every county, reverse geocoding them.'.format(len(outside)))
+            for i, info in zip(outside, self.get_geocoder_info_from_rg_vector(Lats[outside], Lngs[outside])):
+                fips_info_list[i] = info
+        return fips_info_list
+
+    def get_geocoder_info_from_rg(self, Lat, Lng):
+        try:
+            return self.get_geocoder_info_from_rg_vector([float(Lat)], [float(Lng)])[0]
         except ValueError:
             return {'fips':'NA', 'county':'NA'}  # dropna() may not drop 'NA'
 
     def get_geocoder_info_from_rg_vector(self, Lats, Lngs):
         """Returns a column of the form [{'fips': fips, 'county': county}]"""
-        # Reverse geocoder api call to get county names
-        results = rg.search(list(zip(Lats, Lngs))) # default mode = 2
-        fips_not_found_count = 0
-        fips_info_list = []
-        for res in results:
-            county = res['admin2']
-            state = res['admin1']
-
-            try:
-                # Lookup of fips code (https://github.com/fitnr/addfips)
-                current_fips = self.fips_code_lookup(county, state)
-
-                # add the fip and county
-                fips_info_list.append({'fips':current_fips, 'county':county})
-            except ValueError:
-                fips_not_found_count += 1
-                fips_info_list.append({'fips':'NA', 'county':'NA'})
+        lat_keys, lng_keys = self.quantize(Lats, Lngs)
+        keys = list(zip(lat_keys.tolist(), lng_keys.tolist()))
+
+        # Reverse geocode only the coordinates not seen in earlier runs
+        missing = list(dict.fromkeys(k for k in keys if k not in self.coordinate_cache))
+        if missing:
+            scale = 10 ** self.cache_decimals
+            results = self.rg.query(np.asarray(missing, dtype=float) / scale)
+            for key, res in zip(missing, results):
+                county = res['admin2']
+                state = res['admin1']
+                try:
+                    # Lookup of fips code (https://github.com/fitnr/addfips)
+                    current_fips = self.fips_code_lookup(county, state)
+                    self.coordinate_cache[key] = {'fips':current_fips, 'county':county}
+                except ValueError:
+                    self.coordinate_cache[key] = {'fips':'NA', 'county':'NA'}
+            self.save_coordinate_cache()
+
+        fips_info_list = [dict(self.coordinate_cache[k]) for k in keys]
+        fips_not_found_count = sum(1 for info in fips_info_list if info['fips'] == 'NA')
         if fips_not_found_count:
             print('{} fips were not found.'.format(fips_not_found_count))
         return fips_info_list
@@ -0,0 +1,458 @@
+import hashlib
+import json
+import os
+from collections import defaultdict
+import numpy as np
+
+
+def douglas_peucker(points, tolerance):
+    """Boolean mask of the points of an (n, 2) line kept by Douglas-Peucker, endpoints always kept"""
+    n = len(points)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    if n < 3 or tolerance <= 0:
+        keep[:] = True
+        return keep
+
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        inner = points[start + 1:end]
+        a, b = points[start], points[end]
+        ab = b - a
+        length = np.hypot(ab[0], ab[1])
+        if length == 0:
+            # closed line, measure from the shared endpoint
+            dist = np.hypot(inner[:, 0] - a[0], inner[:, 1] - a[1])
+        else:
+            dist = np.abs(ab[0] * (inner[:, 1] - a[1]) - ab[1] * (inner[:, 0] - a[0])) / length
+        i = int(np.argmax(dist))
+        if dist[i] > tolerance:
+            split = start + 1 + i
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return keep
+
+
+def _feature_polygons(geometry):
+    if geometry['type'] == 'Polygon':
+        return [geometry['coordinates']]
+    return geometry['coordinates']
+
+
+def _signed_area(points):
+    # Shoelace area of a ring of (n, 2) points, positive when counter clockwise
+    x, y = points[:, 0].astype(float), points[:, 1].astype(float)
+    return 0.5 * (np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1)))
+
+
+def _contains(ring, point):
+    # Even-odd test of a point against a closed ring
+    x, y = ring[:, 0], ring[:, 1]
+    x2, y2 = np.roll(x, -1), np.roll(y, -1)
+    straddles = (y > point[1]) != (y2 > point[1])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        crossing = x + (point[1] - y) * (x2 - x) / (y2 - y)
+    return bool(np.count_nonzero(straddles & (point[0] < crossing)) % 2)
+
+
+def _chain_rings(arcs):
+    # Closed rings of directed arcs joined end to start; chains that never close are dropped
+    starts = defaultdict(list)
+    for i, arc in enumerate(arcs):
+        starts[tuple(arc[0])].append(i)
+    used = np.zeros(len(arcs), dtype=bool)
+    rings = []
+    for i in range(len(arcs)):
+        if used[i]:
+            continue
+        used[i] = True
+        chain = [arcs[i]]
+        first, end = tuple(arcs[i][0]), tuple(arcs[i][-1])
+        while end != first:
+            following = [j for j in starts[end] if not used[j]]
+            if not following:
+                break
+            used[following[0]] = True
+            chain.append(arcs[following[0]][1:])
+            end = tuple(arcs[following[0]][-1])
+        if end == first:
+            rings.append(np.vstack(chain))
+    return rings
+
+
+class county_topology:
+    """County polygons broken into shared arcs on an integer grid (TopoJSON style).
+
+    Coordinates are quantized to 10**-precision degrees, and every border
+    between two counties is stored once as an arc referenced by both
+    counties, so simplifying an arc moves both neighbors the same way and
+    no gaps or overlaps open up between counties.
+    """
+    def __init__(self, counties, precision=4):
+        self.precision = precision
+        self.scale = 10 ** precision
+        self.arcs = []
+        self._arc_ids = {}
+
+        # quantize every ring, dropping repeated points and the closing point
+        rings = []
+        self.features = []
+        for feature in counties['features']:
+            polygons = []
+            for polygon in _feature_polygons(feature['geometry']):
+                ring_ids = []
+                for ring in polygon:
+                    quantized = np.round(np.asarray(ring, dtype=float)[:, :2] * self.scale).astype(np.int64)
+                    points = [tuple(p) for p in quantized.tolist()]
+                    points = [p for i, p in enumerate(points) if i == 0 or p != points[i - 1]]
+                    if len(points) > 1 and points[0] == points[-1]:
+                        points.pop()
+                    ring_ids.append(len(rings))
+                    rings.append(points)
+                polygons.append(ring_ids)
+            self.features.append((feature, polygons))
+
+        # which rings use each (undirected) edge
+        edge_rings = defaultdict(set)
+        for ring_id, points in enumerate(rings):
+            for a, b in zip(points, points[1:] + points[:1]):
+                edge_rings[(a, b) if a < b else (b, a)].add(ring_id)
+
+        self.ring_arcs = [self._split_ring(points, edge_rings) for points in rings]
+
+    def _arc_ref(self, points):
+        # index of an arc, ~index when the stored arc runs the other way
+        key = tuple(points)
+        if key in self._arc_ids:
+            return self._arc_ids[key]
+        reverse_key = key[::-1]
+        if reverse_key in self._arc_ids:
+            return ~self._arc_ids[reverse_key]
+        self._arc_ids[key] = len(self.arcs)
+        self.arcs.append(np.asarray(points, dtype=np.int64))
+        return self._arc_ids[key]
+
+    def _split_ring(self, points, edge_rings):
+        n = len(points)
+        if n < 3:
+            return [self._arc_ref(points + points[:1])] if points else []
+        owners = [frozenset(edge_rings[(a, b) if a < b else (b, a)])
+            for a, b in zip(points, points[1:] + points[:1])]
+
+        # a ring with the same neighbors all the way round is one closed arc,
+        # started at its smallest point and oriented canonically so enclaves match
+        starts = [i for i in range(n) if owners[i] != owners[i - 1]]
+        if not starts:
+            first = points.index(min(points))
+            rotated = points[first:] + points[:first]
+            if rotated[1] > rotated[-1]:
+                return [~self._arc_ref(rotated[:1] + rotated[:0:-1] + rotated[:1])]
+            return [self._arc_ref(rotated + rotated[:1])]
+
+        # otherwise split wherever the set of rings sharing the edge changes
+        refs = []
+        for start, end in zip(starts, starts[1:] + [starts[0] + n]):
+            refs.append(self._arc_ref([points[i % n] for i in range(start, end + 1)]))
+        return refs
+
+    def simplified_arcs(self, tolerance):
+        """Arcs simplified with tolerance in degrees; rings that would collapse keep their arcs"""
+        tolerance = tolerance * self.scale
+        arcs = [arc[douglas_peucker(arc.astype(float), tolerance)] for arc in self.arcs]
+        for refs in self.ring_arcs:
+            if sum(len(arcs[r if r >= 0 else ~r]) - 1 for r in refs) < 3:
+                for r in refs:
+                    arcs[r if r >= 0 else ~r] = self.arcs[r if r >= 0 else ~r]
+        return arcs
+
+    def _ring_points(self, refs, arcs):
+        points = []
+        for r in refs:
+            arc = arcs[r] if r >= 0 else arcs[~r][::-1]
+            points.extend(arc.tolist() if not points else arc[1:].tolist())
+        return points
+
+    def dissolve(self, groups, tolerance=0, precision=None):
+        """Geojson with one MultiPolygon feature per group, the union of its counties.
+
+        groups holds the group id of each county feature (None leaves it out),
+        e.g. its state fips. Arcs between two counties of a group are walked
+        once each way and cancel out; the rest are chained into the group's
+        outer rings (counter clockwise) and holes (clockwise).
+        """
+        arcs = self.simplified_arcs(tolerance)
+        precision = self.precision if precision is None else precision
+        net = defaultdict(lambda: defaultdict(int))
+        for (feature, polygons), group in zip(self.features, groups):
+            if group is None:
+                continue
+            for ring_ids in polygons:
+                for hole, ring_id in enumerate(ring_ids):
+                    refs = self.ring_arcs[ring_id]
+                    counter_clockwise = _signed_area(np.asarray(self._ring_points(refs, self.arcs))) > 0
+                    if counter_clockwise == bool(hole):
+                        refs = [~r for r in reversed(refs)]
+                    for r in refs:
+                        net[group][r if r >= 0 else ~r] += 1 if r >= 0 else -1
+
+        features = []
+        for group, uses in net.items():
+            rings = _chain_rings([arcs[a] if n > 0 else arcs[a][::-1] for a, n in uses.items() if n != 0])
+            rings = [np.round(ring / self.scale, precision) for ring in rings]
+            rings = [ring[np.r_[True, (np.diff(ring, axis=0) != 0).any(axis=1)]] for ring in rings]
+            rings = [ring for ring in rings if len(ring) >= 4]
+            areas = [_signed_area(ring) for ring in rings]
+            outer = [i for i, area in enumerate(areas) if area > 0]
+            polygons = {i: [rings[i].tolist()] for i in outer}
+            for i, area in enumerate(areas):
+                # a hole belongs to the smallest outer ring around it
+                around = [j for j in outer if area < 0 and _contains(rings[j], rings[i][0])]
+                if around:
+                    polygons[min(around, key=lambda j: areas[j])].append(rings[i].tolist())
+            features.append({'type': 'Feature', 'id': group, 'properties': {},
+                'geometry': {'type': 'MultiPolygon', 'coordinates': list(polygons.values())}})
+        return {'type': 'FeatureCollection', 'features': features}
+
+    def to_geojson(self, tolerance=0):
+        arcs = self.simplified_arcs(tolerance)
+        features = []
+        for feature, polygons in self.features:
+            coordinates = []
+            for ring_ids in polygons:
+                rings = [np.round(np.asarray(self._ring_points(self.ring_arcs[i], arcs)) / self.scale,
+                    self.precision).tolist() for i in ring_ids]
+                coordinates.append([ring for ring in rings if len(ring) >= 4])
+            geometry_type = feature['geometry']['type']
+            new_feature = dict(feature)
+            new_feature['geometry'] = {'type': geometry_type,
+                'coordinates': coordinates[0] if geometry_type == 'Polygon' else coordinates}
+            features.append(new_feature)
+        return {'type': 'FeatureCollection', 'features': features}
+
+    def to_topojson(self, tolerance=0, object_name='counties'):
+        arcs = self.simplified_arcs(tolerance)
+        geometries = []
+        for feature, polygons in self.features:
+            arc_polygons = [[self.ring_arcs[i] for i in ring_ids] for ring_ids in polygons]
+            geometry = {'type': feature['geometry']['type'],
+                'arcs': arc_polygons[0] if feature['geometry']['type'] == 'Polygon' else arc_polygons,
+                'properties': feature.get('properties', {})}
+            if 'id' in feature:
+                geometry['id'] = feature['id']
+            geometries.append(geometry)
+        return {
+            'type': 'Topology',
+            'transform': {'scale': [1.0 / self.scale, 1.0 / self.scale], 'translate': [0, 0]},
+            # delta encoded, as in the TopoJSON spec
+            'arcs': [np.vstack([arc[:1], np.diff(arc, axis=0)]).tolist() for arc in arcs],
+            'objects': {object_name: {'type': 'GeometryCollection', 'geometries': geometries}},
+        }
+
+
+def _cached_json(cache_dir, name, counties, build):
+    # build() cached on disk per source geometry under name, computed when missing
+    cache_path = None
+    if cache_dir:
+        source_hash = hashlib.sha256(json.dumps(counties, sort_keys=True).encode()).hexdigest()[:16]
+        cache_path = os.path.join(cache_dir, name % source_hash)
+        if os.path.exists(cache_path):
+            with open(cache_path) as f:
+                return json.load(f)
+
+    result = build()
+
+    if cache_path:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = cache_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(result, f, separators=(',', ':'))
+        os.replace(tmp_path, cache_path)
+    return result
+
+
+def simplify_county_geojson(counties, tolerance=0.005, precision=4, topojson=False,
+                            cache_dir='.geometry_cache'):
+    """Simplify the county geojson with shared borders, rounding coordinates to precision decimals.
+
+    Results are cached on disk per source geometry, tolerance and precision.
+    Returns geojson, or TopoJSON with topojson=True.
+    """
+    def build():
+        topology = county_topology(counties, precision)
+        return topology.to_topojson(tolerance) if topojson else topology.to_geojson(tolerance)
+    return _cached_json(cache_dir, 'counties_%%s_tol%s_p%d.%s' % (
+        tolerance, precision, 'topojson' if topojson else 'geojson'), counties, build)
+
+
+def state_of(fips):
+    # state fips of a county fips
+    return str(fips)[:2]
+
+
+def state_geojson(counties, tolerance=0.02, precision=3, cache_dir='.geometry_cache'):
+    """Outlines of the states of the county geojson, one feature per state fips.
+
+    The counties of each state are dissolved along their shared borders, which
+    are then simplified with tolerance in degrees. Cached like simplify_county_geojson.
+    """
+    def build():
+        topology = county_topology(counties, precision=4)
+        return topology.dissolve([state_of(feature['id']) if 'id' in feature else None
+            for feature, _ in topology.features], tolerance, precision)
+    return _cached_json(cache_dir, 'states_%%s_tol%s_p%d.geojson' % (tolerance, precision),
+        counties, build)
+
+
+class county_polygon_index:
+    """Point in polygon lookup of the counties of a geojson.
+
+    Every polygon edge is stored in a grid of cell_deg sized cells: once for each
+    cell of its row (latitude band) that the bounding box of its ring overlaps.
+    A point is then tested only against the edges of the rings that could
+    contain it, in its row, and lies inside a county when a ray east from it
+    crosses an odd number of that county's edges (so holes are left out).
+    Only the cells holding edges are stored, sorted by cell number.
+    """
+    def __init__(self, ids, names, edges, edge_feature, cells, cell_start, cell_edges,
+                 origin, cell_deg, columns):
+        self.ids = np.asarray(ids, dtype=object)
+        self.names = np.asarray(names, dtype=object)
+        self.edges = edges
+        self.edge_feature = edge_feature
+        self.cells = cells
+        self.cell_start = cell_start
+        self.cell_edges = cell_edges
+        self.origin = np.asarray(origin, dtype=float)
+        self.cell_deg = float(cell_deg)
+        self.columns = int(columns)
+
+    @classmethod
+    def from_geojson(cls, counties, cell_deg=0.05):
+        ids, names, edges, edge_feature, edge_ring = [], [], [], [], []
+        for number, feature in enumerate(counties['features']):
+            ids.append(feature.get('id'))
+            names.append((feature.get('properties') or {}).get('NAME', ''))
+            for polygon in _feature_polygons(feature['geometry']):
+                for ring in polygon:
+                    points = np.asarray(ring, dtype=float)[:, :2]
+                    if len(points) < 3:
+                        continue
+                    ring_edges = np.hstack([points, np.roll(points, -1, axis=0)])
+                    # horizontal edges never cross a ray east
+                    ring_edges = ring_edges[ring_edges[:, 1] != ring_edges[:, 3]]
+                    edges.append(ring_edges)
+                    edge_feature.append(np.full(len(ring_edges), number, dtype=np.int32))
+                    edge_ring.append(np.full(len(ring_edges), len(edge_ring), dtype=np.int64))
+        edges = np.vstack(edges) if edges else np.empty((0, 4))
+        edge_feature = np.concatenate(edge_feature) if edge_feature else np.empty(0, dtype=np.int32)
+        edge_ring = np.concatenate(edge_ring) if edge_ring else np.empty(0, dtype=np.int64)
+
+        # grid cells of the edges, x is longitude and y latitude
+        x, y = edges[:, [0, 2]], edges[:, [1, 3]]
+        origin = np.array([x.min(), y.min()]) if len(edges) else np.zeros(2)
+        columns = int((x.max() - origin[0]) // cell_deg) + 1 if len(edges) else 1
+
+        # the columns each ring's bounding box covers, and the rows each edge spans
+        n_rings = int(edge_ring.max()) + 1 if len(edges) else 0
+        first_col = np.full(n_rings, columns, dtype=np.int64)
+        last_col = np.full(n_rings, -1, dtype=np.int64)
+        np.minimum.at(first_col, edge_ring, ((x.min(axis=1) - origin[0]) // cell_deg).astype(np.int64))
+        np.maximum.at(last_col, edge_ring, ((x.max(axis=1) - origin[0]) // cell_deg).astype(np.int64))
+        first_row = ((y.min(axis=1) - origin[1]) // cell_deg).astype(np.int64)
+        last_row = ((y.max(axis=1) - origin[1]) // cell_deg).astype(np.int64)
+
+        edge, row = _expand(first_row, last_row)
+        ring = edge_ring[edge]
+        pair, col = _expand(first_col[ring], last_col[ring])
+        cell = row[pair] * columns + col
+        order = np.argsort(cell, kind='stable')
+        cell_edges = edge[pair][order].astype(np.int32)
+        cells, counts = np.unique(cell[order], return_counts=True)
+        cell_start = np.concatenate([[0], np.cumsum(counts)])
+        return cls(ids, names, edges, edge_feature, cells, cell_start, cell_edges,
+            origin, cell_deg, columns)
+
+    def locate(self, lats, lngs, chunk_size=20000):
+        """Position in ids of the county containing each point, -1 where there is none"""
+        lats = np.asarray(lats, dtype=float)
+        lngs = np.asarray(lngs, dtype=float)
+        result = np.full(len(lats), -1, dtype=np.int64)
+        for start in range(0, len(lats), chunk_size):
+            result[start:start + chunk_size] = self._locate(
+                lats[start:start + chunk_size], lngs[start:start + chunk_size])
+        return result
+
+    def _locate(self, py, px):
+        result = np.full(len(py), -1, dtype=np.int64)
+        if not len(self.cells):
+            return result
+        col = np.floor((px - self.origin[0]) / self.cell_deg)
+        row = np.floor((py - self.origin[1]) / self.cell_deg)
+        point = np.nonzero((col >= 0) & (col < self.columns) & (row >= 0))[0]
+        cell = (row[point] * self.columns + col[point]).astype(np.int64)
+        found = np.minimum(np.searchsorted(self.cells, cell), len(self.cells) - 1)
+        has_edges = self.cells[found] == cell
+        point, found = point[has_edges], found[has_edges]
+
+        # every (point, candidate edge) pair
+        pair, slot = _expand(self.cell_start[found], self.cell_start[found + 1] - 1)
+        point, edge = point[pair], self.cell_edges[slot]
+        x0, y0, x1, y1 = self.edges[edge].T
+        y = py[point]
+        crosses = (y0 > y) != (y1 > y)
+        crosses[crosses] = px[point[crosses]] < (x0 + (y - y0) * (x1 - x0) / (y1 - y0))[crosses]
+
+        # odd crossings per (point, county) mean the point is inside
+        n_features = len(self.ids)
+        key = point[crosses].astype(np.int64) * n_features + self.edge_feature[edge[crosses]]
+        key, count = np.unique(key, return_counts=True)
+        key = key[count % 2 == 1]
+        result[key // n_features] = key % n_features
+        return result
+
+    def save(self, path):
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path, ids=self.ids.astype(str), names=self.names.astype(str), edges=self.edges,
+            edge_feature=self.edge_feature, cells=self.cells, cell_start=self.cell_start,
+            cell_edges=self.cell_edges, origin=self.origin, cell_deg=self.cell_deg, columns=self.columns)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['ids'], data['names'], data['edges'], data['edge_feature'], data['cells'],
+                data['cell_start'], data['cell_edges'], data['origin'], data['cell_deg'], data['columns'])
+
+
+def _expand(first, last):
+    # (position, value) pairs of every value from first to last, for each position
+    counts = np.maximum(np.asarray(last) - np.asarray(first) + 1, 0)
+    position = np.repeat(np.arange(len(counts)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return position, np.repeat(first, counts) + offsets
+
+
+_polygon_indexes = {}
+
+def county_polygon_index_cached(counties, cell_deg=0.05, cache_dir='.geometry_cache'):
+    """The county_polygon_index of counties, built once per source geometry and kept on disk"""
+    source_hash = hashlib.sha256(json.dumps(counties, sort_keys=True).encode()).hexdigest()[:16]
+    key = (source_hash, cell_deg)
+    if key in _polygon_indexes:
+        return _polygon_indexes[key]
+    cache_path = None
+    if cache_dir:
+        cache_path = os.path.join(cache_dir, 'county_index_%s_%s.npz' % (source_hash, cell_deg))
+    if cache_path and os.path.exists(cache_path):
+        index = county_polygon_index.load(cache_path)
+    else:
+        index = county_polygon_index.from_geojson(counties, cell_deg)
+        if cache_path:
+            os.makedirs(cache_dir, exist_ok=True)
+            index.save(cache_path)
+    _polygon_indexes[key] = index
+    return index
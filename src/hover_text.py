@@ -0,0 +1,132 @@
+from collections import OrderedDict
+from string import Formatter
+import threading
+import pandas as pd
+
+# How a column is turned into text, selected by the format spec in a template
+FIELD_FORMATS = {
+    '': lambda col: col.astype(str),
+    'int': lambda col: col.astype(int).astype(str),
+    'float': lambda col: col.astype(float).astype(str),
+    # float, with missing values shown as NA
+    'float_na': lambda col: col.astype(float).astype(str).replace('nan', 'NA'),
+}
+
+HOVER_TEMPLATES = {}
+
+# Rendered text per (template name, hash of the columns it uses)
+_render_cache = OrderedDict()
+_render_cache_lock = threading.Lock()
+RENDER_CACHE_SIZE = 32
+
+
+def register_template(name, template):
+    """Register a hover text template such as 'Cases: {cases:int}<br>{county}'
+
+    Fields name columns of the county frame, with an optional format from FIELD_FORMATS.
+    """
+    parts = list(Formatter().parse(template))
+    for _, field, spec, _ in parts:
+        if field is not None and spec not in FIELD_FORMATS:
+            raise ValueError('Unknown format {} for {} in template {}'.format(spec, field, name))
+    HOVER_TEMPLATES[name] = parts
+
+
+def template_columns(name):
+    return list(OrderedDict.fromkeys(
+        field for _, field, _, _ in HOVER_TEMPLATES[name] if field is not None))
+
+
+def data_version(df, columns):
+    # Content hash of the columns (and index) a template reads
+    return int(pd.util.hash_pandas_object(df[columns], index=True).sum())
+
+
+def hover_text(df, name, stored=False):
+    """Render the named template over df as a Series of strings, aligned to df.index
+
+    With stored, a frame that already carries a column called name (the texts
+    incremental.update_county_frames keeps for its template) returns that column as is.
+    """
+    if stored and name in df.columns:
+        return df[name]
+    columns = template_columns(name)
+    key = (name, len(df), data_version(df, columns))
+    with _render_cache_lock:
+        if key in _render_cache:
+            _render_cache.move_to_end(key)
+            return _render_cache[key]
+
+    # Render one column at a time, so each field is converted to text once
+    text = pd.Series('', index=df.index)
+    for literal, field, spec, _ in HOVER_TEMPLATES[name]:
+        if literal:
+            text = text + literal
+        if field is not None:
+            text = text + FIELD_FORMATS[spec](df[field])
+
+    with _render_cache_lock:
+        _render_cache[key] = text
+        if len(_render_cache) > RENDER_CACHE_SIZE:
+            _render_cache.popitem(last=False)
+    return text
+
+
+# Hover text for the county maps
+register_template('county_info_for_map', 'PPE Requests: {county}, {STATE}')
+
+register_template('ppe_text', 'PPE Requests: {PPE_requests:int}<br>{county}, {STATE}')
+
+register_template('covid_text',
+    '{county}, {STATE}<br><br>'
+    'Covid19: <br>'
+    'Cases: {cases:int}<br>'
+    'Deaths: {deaths:int}<br><br>'
+    'PPE Requests: {PPE_requests:int}')
+
+register_template('hosp_beds_text',
+    '{county}, {STATE}<br><br>'
+    'Hospital Beds: {BEDS:int}<br>'
+    '<br>'
+    'Covid19: <br>'
+    'Cases: {cases:int}<br>'
+    'Deaths: {deaths:int}<br><br>'
+    'PPE Requests: {PPE_requests:int}')
+
+register_template('hosp_text',
+    '{county}, {STATE}<br><br>'
+    'COVID19 Cases Per Hospital Bed): {Covid_cases_per_bed:float}<br><br>'
+    'Hospital Beds: {BEDS:int}<br>'
+    '<br>'
+    'COVID19: <br>'
+    'Cases: {cases:int}<br>'
+    'Deaths: {deaths:int}<br><br>'
+    'PPE Requests: {PPE_requests:int}')
+
+register_template('covid_ppe_text',
+    '{county}, {STATE}<br><br>'
+    'COVID19 Cases Per PPE Request {Covid_cases_per_PPE_requests:float}<br><br>'
+    '<br>'
+    'Covid19: <br>'
+    'Cases: {cases:int}<br>'
+    'Deaths: {deaths:int}<br><br>'
+    'PPE Requests: {PPE_requests:int}')
+
+register_template('ppe_donors_requests_text',
+    '{county}, {STATE}<br><br>'
+    'PPE Donors:{ppe_donors:int}<br>'
+    'PPE Requests:{PPE_requests:int}<br><br>'
+    'Covid19: <br>'
+    'Cases: {cases:int}<br>'
+    'Deaths: {deaths:int}<br><br>'
+    'HAZARD RATIO (Cases/Bed): {Covid_cases_per_bed:float}')
+
+register_template('ppe_donors_requests_ratio_text',
+    '{county}, {STATE}<br><br>'
+    'GetUsPPE Donors per Requester: {PPE_Donor_Per_Requester:float_na}<br>'
+    'PPE Donors: {ppe_donors:int}<br>'
+    'PPE Requests: {PPE_requests:int}<br><br>'
+    'Covid19: <br>'
+    'Cases: {cases:int}<br>'
+    'Deaths: {deaths:int}<br><br>'
+    'HAZARD RATIO (Cases/Bed): {Covid_cases_per_bed:float}')
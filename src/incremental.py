@@ -0,0 +1,136 @@
+import hashlib
+import os
+import numpy as np
+import pandas as pd
+from data_process import merge_covid_ppe_df, \
+    merge_covid_ppe_hosp_df, \
+    calculate_covid_per_bed_available, \
+    calculate_covid_cases_per_ppe_request
+from hover_text import HOVER_TEMPLATES, hover_text
+from schema import normalize
+
+# Bump when the per-county calculations change, so stored results are not reused
+STATE_VERSION = 3
+
+# Hover texts stored with the county results
+STORED_HOVER_TEXTS = ['covid_text', 'hosp_text', 'covid_ppe_text']
+
+# The columns of each input that the per-county calculations and stored hover texts read
+INPUT_COLUMNS = {
+    'merged_df': ['county', 'STATE', 'PPE_requests'],
+    'covid_df': ['cases', 'deaths'],
+    'hospital_df_counties': ['BEDS'],
+}
+
+
+def templates_hash():
+    # the stored hover texts are only reused while their templates are unchanged
+    return hashlib.sha256(repr([HOVER_TEMPLATES[name] for name in STORED_HOVER_TEXTS])
+        .encode()).hexdigest()
+
+
+def fips_hashes(df, columns):
+    """One content hash per fips, over the columns of all rows of df with that fips"""
+    row_hashes = pd.util.hash_pandas_object(df[columns], index=False).values
+    fips = df['fips'].astype(str).values
+    # order independent combination of the rows of each fips
+    return pd.Series(row_hashes, index=fips).groupby(level=0).sum()
+
+
+class county_state_store:
+    """Per-fips input hashes and results of the previous run, kept in one pickle file.
+
+    changed_fips() compares today's inputs against the stored hashes, so only
+    counties whose requests, covid counts or hospital beds changed need to be
+    recomputed; the rest of the results are reused from the previous run.
+    results holds only the computed columns, indexed by fips, and the occurrence
+    of each row's merged_df row within its fips.
+    """
+    def __init__(self, path='county_state.pkl'):
+        self.path = path
+        self.hashes = pd.Series(dtype=np.uint64)
+        self.results = None
+        if path and os.path.exists(path):
+            state = pd.read_pickle(path)
+            if state.get('version') == STATE_VERSION and state.get('templates') == templates_hash():
+                self.hashes = state['hashes']
+                self.results = state['results']
+
+    def input_hashes(self, inputs):
+        """Combine the per-fips hashes of the INPUT_COLUMNS of every named input frame into one hash per fips"""
+        per_input = pd.DataFrame({name: fips_hashes(df, INPUT_COLUMNS[name]) for name, df in inputs.items()})
+        per_input = per_input.fillna(0).astype(np.uint64)
+        return pd.Series(pd.util.hash_pandas_object(per_input, index=True).values,
+            index=per_input.index)
+
+    def changed_fips(self, hashes):
+        previous = self.hashes.reindex(hashes.index)
+        return set(hashes.index[previous.isna().values | (previous.values != hashes.values)])
+
+    def save(self, hashes, results):
+        self.hashes = hashes
+        self.results = results
+        if self.path:
+            tmp_path = self.path + '.tmp'
+            pd.to_pickle({'version': STATE_VERSION, 'templates': templates_hash(),
+                'hashes': hashes, 'results': results}, tmp_path)
+            os.replace(tmp_path, self.path)
+
+
+def compute_county_frames(merged_df, covid_df, hospital_df_counties):
+    # merge_covid_ppe_df -> merge_covid_ppe_hosp_df -> calculate_* for the given counties
+    merged_covid_ppe_df = merge_covid_ppe_df(covid_df, merged_df)
+    merged_covid_ppe_hosp_df = merge_covid_ppe_hosp_df(hospital_df_counties, merged_covid_ppe_df)
+    merged_covid_ppe_hosp_df = calculate_covid_per_bed_available(merged_covid_ppe_hosp_df)
+    merged_covid_ppe_hosp_df = calculate_covid_cases_per_ppe_request(merged_covid_ppe_hosp_df)
+    for name in STORED_HOVER_TEXTS:
+        merged_covid_ppe_hosp_df[name] = hover_text(merged_covid_ppe_hosp_df, name)
+    return merged_covid_ppe_hosp_df
+
+
+def update_county_frames(merged_df, covid_df, hospital_df_counties, store):
+    """Covid, hospital and ratio columns plus hover text per county, recomputing only changed fips.
+
+    Returns the same frame as running compute_county_frames on every county.
+    """
+    # a fips may repeat in merged_df (e.g. two features of one county), so its rows are
+    # told apart by their occurrence within the fips, as the joins keep each of them
+    merged_df = merged_df.assign(occurrence=merged_df.groupby('fips', observed=True).cumcount())
+    covid_df = covid_df[covid_df['fips'].isin(merged_df['fips'])]
+    hospital_df_counties = hospital_df_counties[hospital_df_counties['fips'].isin(merged_df['fips'])]
+    hashes = store.input_hashes({
+        'merged_df': merged_df,
+        'covid_df': covid_df,
+        'hospital_df_counties': hospital_df_counties,
+    })
+    changed = store.changed_fips(hashes)
+    if store.results is None:
+        changed = set(hashes.index)
+    print ('Recomputing {} of {} counties.'.format(len(changed), len(hashes)))
+
+    recomputed = compute_county_frames(
+        merged_df[merged_df['fips'].isin(changed)].copy(),
+        covid_df[covid_df['fips'].isin(changed)],
+        hospital_df_counties[hospital_df_counties['fips'].isin(changed)])
+    computed = recomputed[['occurrence'] +
+        [c for c in recomputed.columns if c not in merged_df.columns]]
+    computed.index = recomputed['fips'].astype(str).values
+
+    if store.results is not None:
+        reused = store.results[store.results.index.isin(hashes.index)
+            & ~store.results.index.isin(changed)]
+        computed = pd.concat([reused, computed[reused.columns]]) if len(computed) else reused
+
+    # same order as calculate_covid_per_bed_available gives on the full frame
+    computed = computed.sort_values(by='Covid_cases_per_bed', ascending=False)
+    store.save(hashes, computed)
+
+    # today's merged_df rows of the counties kept, so columns that are not inputs
+    # (geometry, all_ppe_requests) are never stale, with the computed columns added
+    rows = pd.Series(np.arange(len(merged_df)), index=pd.MultiIndex.from_arrays(
+        [merged_df['fips'].astype(str).values, merged_df['occurrence'].values]))
+    keys = pd.MultiIndex.from_arrays([computed.index, computed['occurrence'].values])
+    results = merged_df.iloc[rows.reindex(keys).values].drop(columns='occurrence')
+    for column in computed.columns.drop('occurrence'):
+        results[column] = computed[column].values
+    return normalize(results, 'merged_covid_ppe_hosp_df')
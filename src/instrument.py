@@ -0,0 +1,280 @@
+"""Opt-in tracing of the download, processing and mapping functions.
+
+Functions decorated with @traced record their wall and cpu time, memory,
+and the rows going in and out of them once enable() has been called, and
+every DataFrame.dropna/drop_duplicates call inside them records how many
+rows it removed. When tracing is not enabled the decorator only checks
+one flag before calling the function.
+
+Memory is measured with tracemalloc and the drop counters are swapped into
+DataFrame, both process wide, so a traced pipeline runs its stages one at a
+time in the main thread (pipeline(serial=True)). Calls made at the same time
+in other threads or in worker processes are not measured separately.
+"""
+import functools
+import json
+import linecache
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+_enabled = False
+_state = threading.local()
+_lock = threading.Lock()
+
+# One dict per traced call, and one per dropna/drop_duplicates inside a traced call
+calls = []
+drops = []
+
+_options = {'memory': True, 'profile': set(), 'profile_interval': 0.005, 'profile_top': 20}
+_original_methods = {}
+_PANDAS_DIR = os.path.dirname(pd.__file__)
+
+
+def _stack():
+    if not hasattr(_state, 'stack'):
+        _state.stack = []
+    return _state.stack
+
+
+def _rows(value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return len(value)
+    if isinstance(value, tuple):
+        counts = [_rows(v) for v in value]
+        counts = [c for c in counts if c is not None]
+        return sum(counts) if counts else None
+    return None
+
+
+def _max_rss_mb():
+    if resource is None:
+        return None
+    # kilobytes on linux, bytes on mac
+    scale = 1024 ** 2 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+class sampling_profiler:
+    """Samples the stack of one thread every interval seconds from a background thread.
+
+    leaf counts how often each (function, file, line) was the innermost frame,
+    and stack how often it was anywhere on the stack.
+    """
+    def __init__(self, thread_id=None, interval=0.005):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.leaf = Counter()
+        self.stack = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            self.samples += 1
+            self.leaf[self._key(frame)] += 1
+            seen = set()
+            while frame is not None:
+                key = self._key(frame)
+                if key not in seen:
+                    self.stack[key] += 1
+                    seen.add(key)
+                frame = frame.f_back
+
+    @staticmethod
+    def _key(frame):
+        return (frame.f_code.co_name, frame.f_code.co_filename, frame.f_lineno)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def top(self, n=20):
+        """The n most sampled lines, as json friendly dicts"""
+        return [{'function': f, 'file': path, 'line': line, 'samples': count,
+                 'cumulative': self.stack[(f, path, line)],
+                 'code': linecache.getline(path, line).strip()}
+            for (f, path, line), count in self.leaf.most_common(n)]
+
+
+def _drop_wrapper(method_name):
+    method = _original_methods[method_name]
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        stack = _stack()
+        rows_before = len(self)
+        result = method(self, *args, **kwargs)
+        caller = sys._getframe(1)
+        # calls made by pandas itself are counted in the call that made them
+        if stack and _PANDAS_DIR not in caller.f_code.co_filename:
+            rows_after = len(self) if kwargs.get('inplace') else len(result)
+            with _lock:
+                drops.append({
+                    'function': stack[-1]['function'],
+                    'method': method_name,
+                    'file': caller.f_code.co_filename,
+                    'line': caller.f_lineno,
+                    'code': linecache.getline(caller.f_code.co_filename, caller.f_lineno).strip(),
+                    'rows_before': rows_before,
+                    'rows_dropped': rows_before - rows_after,
+                })
+        return result
+    return wrapper
+
+
+def enable(memory=True, profile=(), profile_interval=0.005, profile_top=20):
+    """Start recording traced calls.
+
+    memory turns on tracemalloc peaks per call; profile is a collection of
+    function names to run under the sampling profiler.
+    """
+    global _enabled
+    _options.update(memory=memory, profile=set(profile), profile_interval=profile_interval,
+        profile_top=profile_top)
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    for method_name in ('dropna', 'drop_duplicates'):
+        if method_name not in _original_methods:
+            _original_methods[method_name] = getattr(pd.DataFrame, method_name)
+            setattr(pd.DataFrame, method_name, _drop_wrapper(method_name))
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+    for method_name, method in _original_methods.items():
+        setattr(pd.DataFrame, method_name, method)
+    _original_methods.clear()
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def enable_from_config(instrument_config):
+    """Enable tracing if the [instrument] section of config.ini says so"""
+    if not instrument_config.getboolean('enabled', False):
+        return False
+    profile = [name.strip() for name in instrument_config.get('profile', '').split(',') if name.strip()]
+    enable(memory=instrument_config.getboolean('memory', True), profile=profile,
+        profile_interval=instrument_config.getfloat('profile_interval_ms', 5) / 1000.0)
+    return True
+
+
+def is_enabled():
+    return _enabled
+
+
+def traced(func):
+    """Decorator recording a call of func while tracing is enabled"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _enabled:
+            return func(*args, **kwargs)
+        return _traced_call(func, args, kwargs)
+    return wrapper
+
+
+def _traced_call(func, args, kwargs):
+    stack = _stack()
+    record = {
+        'function': func.__name__,
+        'module': func.__module__,
+        'thread': threading.current_thread().name,
+        'parent': stack[-1]['function'] if stack else None,
+        'rows_in': _rows(tuple(args) + tuple(kwargs.values())),
+    }
+    memory = _options['memory'] and tracemalloc.is_tracing()
+    if memory:
+        current, peak = tracemalloc.get_traced_memory()
+        if stack:
+            stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        record['start_mb'] = current / 1024 ** 2
+    frame = {'function': func.__name__, 'peak': 0}
+    stack.append(frame)
+
+    profiler = None
+    if func.__name__ in _options['profile']:
+        profiler = sampling_profiler(interval=_options['profile_interval'])
+        profiler.__enter__()
+
+    record['start'] = time.time()
+    start_wall, start_cpu = time.perf_counter(), time.thread_time()
+    try:
+        result = func(*args, **kwargs)
+        record['rows_out'] = _rows(result)
+        return result
+    except Exception as e:
+        record['error'] = '%s: %s' % (type(e).__name__, e)
+        raise
+    finally:
+        record['seconds'] = time.perf_counter() - start_wall
+        record['cpu_seconds'] = time.thread_time() - start_cpu
+        if profiler is not None:
+            profiler.__exit__(None, None, None)
+            record['profile'] = {'samples': profiler.samples,
+                'interval': profiler.interval, 'top': profiler.top(_options['profile_top'])}
+        stack.pop()
+        if memory:
+            peak = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+            record['peak_mb'] = peak / 1024 ** 2 - record['start_mb']
+            if stack:
+                stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+        record['max_rss_mb'] = _max_rss_mb()
+        with _lock:
+            calls.append(record)
+
+
+def reset():
+    with _lock:
+        del calls[:]
+        del drops[:]
+
+
+def write_trace(path):
+    """Write the recorded calls and row drops as json"""
+    with _lock:
+        trace = {'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'calls': list(calls), 'drops': list(drops)}
+    with open(path, 'w') as f:
+        json.dump(trace, f, indent=1, default=str)
+    return trace
+
+
+def summary_table():
+    """Table of the traced calls in the order they started, with the rows their drops removed"""
+    with _lock:
+        records = sorted(calls, key=lambda r: r['start'])
+        dropped = Counter()
+        for d in drops:
+            dropped[d['function']] += d['rows_dropped']
+
+    lines = ['{:<44} {:>9} {:>9} {:>9} {:>10} {:>10} {:>9}'.format(
+        'function', 'seconds', 'cpu', 'peak MB', 'rows in', 'rows out', 'dropped')]
+    for r in records:
+        name = ('  ' if r['parent'] else '') + r['function'] + (' (failed)' if 'error' in r else '')
+        lines.append('{:<44} {:>9.2f} {:>9.2f} {:>9} {:>10} {:>10} {:>9}'.format(
+            name, r['seconds'], r['cpu_seconds'],
+            '%.1f' % r['peak_mb'] if 'peak_mb' in r else '',
+            r['rows_in'] if r['rows_in'] is not None else '',
+            r.get('rows_out') if r.get('rows_out') is not None else '',
+            dropped.pop(r['function'], '')))
+    return '\n'.join(lines)
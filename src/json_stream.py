@@ -0,0 +1,122 @@
+import codecs
+import json
+import re
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# Items of a large JSON array read one at a time from a file, so the document is
+# never held as one string or one object tree. ijson is used when installed;
+# otherwise the file is read in chunks and each item decoded with json's C scanner.
+
+# the C scanner behind json.loads, decoding the one value at an index of a string
+_scan = json.JSONDecoder().scan_once
+_whitespace = re.compile(r'[ \t\n\r]*')
+_delimiters = frozenset(' \t\n\r,:]}')
+_separator = re.compile(r'[ \t\n\r]*([,\]])[ \t\n\r]*')
+
+
+class _reader:
+    # Decoded text of a binary file, read chunk by chunk as values are taken from it
+    def __init__(self, f, chunk_size):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.text_decoder = codecs.getincrementaldecoder('utf-8-sig')()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def more(self):
+        chunk = self.f.read(self.chunk_size)
+        self.eof = not chunk
+        self.buffer = self.buffer[self.pos:] + self.text_decoder.decode(chunk, final=self.eof)
+        self.pos = 0
+        return not self.eof
+
+    def peek(self):
+        # next character after whitespace, '' at the end of the file
+        while True:
+            self.pos = _whitespace.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.more():
+                return ''
+
+    def expect(self, characters):
+        character = self.peek()
+        if not character or character not in characters:
+            raise ValueError('Expected one of %r at %r' % (characters, self.buffer[self.pos:self.pos + 20]))
+        self.pos += 1
+        return character
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _scan(self.buffer, self.pos)
+                # a value not yet followed by a delimiter (a number, say) may continue in the next chunk
+                if self.eof or (end < len(self.buffer) and self.buffer[end] in _delimiters):
+                    self.pos = end
+                    return value
+            except StopIteration:
+                if self.eof:
+                    raise ValueError('Invalid JSON at %r' % self.buffer[self.pos:self.pos + 20])
+            except ValueError:
+                if self.eof:
+                    raise
+            self.more()
+
+
+def _array_items(reader):
+    # Items of the array whose '[' the reader has just passed
+    if reader.peek() == ']':
+        reader.pos += 1
+        return
+    while True:
+        yield reader.value()
+        # the items and separators held whole in the buffer are decoded straight from it
+        buffer, pos = reader.buffer, reader.pos
+        while True:
+            separator = _separator.match(buffer, pos)
+            if separator is None or separator.end() == len(buffer):
+                break
+            if separator.group(1) == ']':
+                reader.pos = separator.end()
+                return
+            try:
+                value, end = _scan(buffer, separator.end())
+            except (StopIteration, ValueError):
+                break
+            if end == len(buffer) or buffer[end] not in _delimiters:
+                break
+            pos = end
+            yield value
+        reader.pos = pos
+        if reader.expect(',]') == ']':
+            return
+
+
+def iter_items(f, key, chunk_size=1024 * 1024):
+    """Each item of the array under the top level key of the JSON object in the binary file f.
+
+    Stops after that array, so later members of the document are not read.
+    """
+    if ijson is not None:
+        yield from ijson.items(f, key + '.item', use_float=True)
+        return
+    reader = _reader(f, chunk_size)
+    reader.expect('{')
+    if reader.peek() == '}':
+        return
+    while True:
+        name = reader.value()
+        reader.expect(':')
+        if name == key and reader.peek() == '[':
+            reader.pos += 1
+            yield from _array_items(reader)
+            return
+        reader.value()
+        if reader.expect(',}') == '}':
+            return
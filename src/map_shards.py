@@ -0,0 +1,239 @@
+import html
+import os
+import numpy as np
+import pandas as pd
+from figure_json import PLOTLYJS_URL, dumps
+from geometry import state_geojson, state_of
+from instrument import traced
+
+
+def _json_values(values, decimals=4):
+    # floats rounded for size, null where missing
+    values = np.asarray(values, dtype=float)
+    return [None if not np.isfinite(v) else (int(v) if v == int(v) else round(float(v), decimals))
+        for v in values]
+
+
+def _colorscale(colorscale):
+    # plotly.js wants [[position, color], ...] for a list of colors
+    if isinstance(colorscale, str) or not len(colorscale) or not isinstance(colorscale[0], str):
+        return colorscale
+    return [[i / max(len(colorscale) - 1, 1), color] for i, color in enumerate(colorscale)]
+
+
+def _bounds(geometry):
+    # [west, south, east, north] of a Polygon or MultiPolygon
+    polygons = [geometry['coordinates']] if geometry['type'] == 'Polygon' else geometry['coordinates']
+    points = np.concatenate([np.asarray(ring, dtype=float)[:, :2] for polygon in polygons for ring in polygon])
+    return np.r_[points.min(axis=0), points.max(axis=0)]
+
+
+def _format(value):
+    if value is None:
+        return 'no data'
+    return '{:,}'.format(value) if isinstance(value, int) else '{:,.2f}'.format(value)
+
+
+def _write_json(filename, data):
+    with open(filename, 'w') as f:
+        f.write(dumps(data))
+
+
+@traced
+def choropleth_mapbox_sharded_plot (counties, layers, output_dir, title='GetUsPPE.org',
+                                    state_names=None, shard_zoom=5, overview_tolerance=0.02,
+                                    overview_precision=2):
+    """Write the layers as a national map of states that loads each state's counties on demand.
+
+    layers are dicts as for choropleth_mapbox_layers_plot, optionally with
+    state_z, the state level value by state fips (the sum of the counties
+    otherwise). output_dir gets index.html, the loader page, overview.json
+    with the state outlines and values, and states/<state fips>.json with
+    the geometry, values and hover text of the counties of each state,
+    fetched when the map is zoomed in to shard_zoom or more over that state.
+    """
+    state_names = state_names or {}
+    os.makedirs(os.path.join(output_dir, 'states'), exist_ok=True)
+
+    # counties of each state, and the county values of each layer by fips
+    features = {}
+    for feature in counties['features']:
+        features.setdefault(state_of(feature['id']), []).append(
+            {'type': 'Feature', 'id': feature['id'], 'geometry': feature['geometry']})
+    values = [pd.DataFrame({'z': pd.to_numeric(pd.Series(np.asarray(layer['z'], dtype=object)),
+        errors='coerce').astype(float).values, 'text': np.asarray(layer['text'], dtype=object)},
+        index=pd.Index(np.asarray(layer['locations'], dtype=object).astype(str))).groupby(level=0).first()
+        for layer in layers]
+
+    states = sorted(features)
+    for state in states:
+        ids = [feature['id'] for feature in features[state]]
+        _write_json(os.path.join(output_dir, 'states', '%s.json' % state), {
+            'state': state,
+            'geojson': {'type': 'FeatureCollection', 'features': features[state]},
+            'locations': ids,
+            'layers': [{'z': _json_values(v['z'].reindex(ids)),
+                'text': v['text'].reindex(ids).fillna('').astype(str).tolist()} for v in values]})
+
+    outlines = {f['id']: f for f in state_geojson(counties, overview_tolerance, overview_precision)['features']}
+    states = [state for state in states if state in outlines]
+    overview_layers = []
+    for layer, v in zip(layers, values):
+        if layer.get('state_z') is not None:
+            state_z = pd.Series(layer['state_z'])
+        else:
+            state_z = v['z'].groupby(v.index.map(state_of)).sum()
+        state_z = _json_values(state_z.reindex(states))
+        present = [z for z in state_z if z is not None]
+        overview_layers.append({
+            'label': layer['label'], 'title': layer['title'],
+            'colorscale': _colorscale(layer['colorscale']),
+            'zmin': layer['zmin'], 'zmax': layer['zmax'], 'colorbar_title': layer['colorbar_title'],
+            'state_z': state_z,
+            'state_zmin': min(present, default=0), 'state_zmax': max(present, default=1),
+            'state_text': ['%s<br>%s: %s' % (state_names.get(state, state), layer['label'], _format(z))
+                for state, z in zip(states, state_z)]})
+
+    _write_json(os.path.join(output_dir, 'overview.json'), {
+        'title': title,
+        'shard_zoom': shard_zoom,
+        'states': {
+            'ids': states,
+            'geojson': {'type': 'FeatureCollection', 'features': [outlines[state] for state in states]},
+            'bounds': [np.round(_bounds(outlines[state]['geometry']), 3).tolist() for state in states],
+            'shards': ['states/%s.json' % state for state in states]},
+        'layers': overview_layers})
+
+    with open(os.path.join(output_dir, 'index.html'), 'w') as f:
+        f.write(LOADER_PAGE.replace('__TITLE__', html.escape(title)).replace('__PLOTLYJS__', PLOTLYJS_URL))
+
+
+# The overview is drawn first; zooming in past shard_zoom fetches the county shards
+# of the states in view, drawn over the states with their own color axis
+LOADER_PAGE = '''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>__TITLE__</title>
+<script src="__PLOTLYJS__"></script>
+<style>
+html, body { margin: 0; height: 100%; font-family: sans-serif; }
+#buttons { padding: 6px; }
+#buttons button.active { font-weight: bold; }
+#map { position: absolute; top: 40px; bottom: 0; left: 0; right: 0; }
+</style>
+</head>
+<body>
+<div id="buttons"></div>
+<div id="map"></div>
+<script>
+(function () {
+  var map = document.getElementById('map');
+  var overview, layer = 0, zoomed = false, shards = [], traces = [], requested = {};
+
+  function countyStyle(shard) {
+    var values = shard.layers[layer];
+    return {z: [values.z], text: [values.text]};
+  }
+
+  // [west, south, east, north] in view at a mapbox center and zoom (512 px tiles)
+  function viewBounds(center, zoom) {
+    var degrees = 360 / (512 * Math.pow(2, zoom));
+    var halfWidth = map.clientWidth * degrees / 2;
+    var halfHeight = map.clientHeight * degrees * Math.cos(center.lat * Math.PI / 180) / 2;
+    return [center.lon - halfWidth, center.lat - halfHeight, center.lon + halfWidth, center.lat + halfHeight];
+  }
+
+  function overlaps(a, b) {
+    return a[0] <= b[2] && b[0] <= a[2] && a[1] <= b[3] && b[1] <= a[3];
+  }
+
+  function load(i) {
+    requested[i] = true;
+    fetch(overview.states.shards[i]).then(function (response) { return response.json(); })
+      .then(function (shard) {
+        var style = countyStyle(shard);
+        shards.push(shard);
+        traces.push(map.data.length);
+        Plotly.addTraces(map, {
+          type: 'choroplethmapbox', geojson: shard.geojson, locations: shard.locations,
+          z: style.z[0], text: style.text[0], hoverinfo: 'text', coloraxis: 'coloraxis',
+          marker: {opacity: 0.8, line: {width: 0.5}}, visible: zoomed, name: shard.state});
+      });
+  }
+
+  function update() {
+    var mapbox = map.layout.mapbox, isZoomed = mapbox.zoom >= overview.shard_zoom;
+    if (isZoomed !== zoomed) {
+      zoomed = isZoomed;
+      Plotly.relayout(map, {'coloraxis.showscale': zoomed, 'coloraxis2.showscale': !zoomed});
+      Plotly.restyle(map, {'marker.opacity': zoomed ? 0.2 : 0.8, hoverinfo: zoomed ? 'skip' : 'text'}, [0]);
+      if (traces.length) { Plotly.restyle(map, {visible: zoomed}, traces); }
+    }
+    if (zoomed) {
+      var view = viewBounds(mapbox.center, mapbox.zoom);
+      overview.states.bounds.forEach(function (bounds, i) {
+        if (!requested[i] && overlaps(view, bounds)) { load(i); }
+      });
+    }
+  }
+
+  function showLayer(i) {
+    var l = overview.layers[i];
+    layer = i;
+    Plotly.restyle(map, {z: [l.state_z], text: [l.state_text]}, [0]);
+    shards.forEach(function (shard, j) { Plotly.restyle(map, countyStyle(shard), [traces[j]]); });
+    Plotly.relayout(map, {
+      title: l.title,
+      'coloraxis.colorscale': l.colorscale, 'coloraxis.cmin': l.zmin, 'coloraxis.cmax': l.zmax,
+      'coloraxis.colorbar.title.text': l.colorbar_title,
+      'coloraxis2.colorscale': l.colorscale, 'coloraxis2.cmin': l.state_zmin,
+      'coloraxis2.cmax': l.state_zmax, 'coloraxis2.colorbar.title.text': l.colorbar_title});
+    Array.prototype.forEach.call(document.getElementById('buttons').children, function (button, j) {
+      button.className = j === i ? 'active' : '';
+    });
+  }
+
+  // zoom to fit a state's bounds
+  function zoomTo(bounds) {
+    var center = {lon: (bounds[0] + bounds[2]) / 2, lat: (bounds[1] + bounds[3]) / 2};
+    var zoom = Math.log2(Math.min(
+      map.clientWidth * 360 / (512 * Math.max(bounds[2] - bounds[0], 0.01)),
+      map.clientHeight * 360 * Math.cos(center.lat * Math.PI / 180) / (512 * Math.max(bounds[3] - bounds[1], 0.01))));
+    Plotly.relayout(map, {'mapbox.center': center, 'mapbox.zoom': Math.max(zoom, overview.shard_zoom)});
+  }
+
+  fetch('overview.json').then(function (response) { return response.json(); }).then(function (data) {
+    overview = data;
+    var l = overview.layers[0];
+    overview.layers.forEach(function (layer, i) {
+      var button = document.createElement('button');
+      button.textContent = layer.label;
+      button.onclick = function () { showLayer(i); };
+      document.getElementById('buttons').appendChild(button);
+    });
+    Plotly.newPlot(map, [{
+      type: 'choroplethmapbox', geojson: overview.states.geojson, locations: overview.states.ids,
+      z: l.state_z, text: l.state_text, hoverinfo: 'text', coloraxis: 'coloraxis2',
+      marker: {opacity: 0.8, line: {width: 0.5}}}], {
+      title: l.title,
+      mapbox: {style: 'carto-positron', zoom: 3.5, center: {lat: 37.0902, lon: -95.7129}},
+      coloraxis: {colorscale: l.colorscale, cmin: l.zmin, cmax: l.zmax, showscale: false,
+        colorbar: {title: {text: l.colorbar_title}}},
+      coloraxis2: {colorscale: l.colorscale, cmin: l.state_zmin, cmax: l.state_zmax,
+        colorbar: {title: {text: l.colorbar_title}}},
+      margin: {r: 100, t: 30, l: 30, b: 0}}, {responsive: true}).then(function () {
+      showLayer(0);
+      map.on('plotly_relayout', update);
+      map.on('plotly_click', function (event) {
+        var point = event.points[0];
+        if (point.curveNumber === 0) { zoomTo(overview.states.bounds[point.pointNumber]); }
+      });
+    });
+  });
+})();
+</script>
+</body>
+</html>
+'''
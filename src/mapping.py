@@ -1,17 +1,24 @@
 import plotly.graph_objects as go
 from plotly.offline import plot
 import plotly.express as px
+import json
+import numpy as np
+import os.path as path
+from figure_json import encoded, geojson_loader_script, write_figure_html
+from instrument import traced
 
+@traced
 def choropleth_mapbox_usa_plot (counties, locations, z, text,
                                 colorscale = "RdBu_r", zmin=-1, zmax=10, 
                                 title='choropleth_mapbox_usa_plot',
                                 colorbar_title = 'count',
                                 html_filename='plot.html',
-                                show_fig=True):
+                                show_fig=True, geojson_key='counties'):
     
     # Choropleth graph. For reference: https://plotly.com/python/mapbox-county-choropleth/
+    # The trace refers to the geometry by key, written into the page once (see figure_json)
     fig = go.Figure(go.Choroplethmapbox(
-        geojson=counties,
+        geojson=geojson_key,
         locations=locations, 
         z=z, 
         text=text,
@@ -33,14 +40,15 @@ def choropleth_mapbox_usa_plot (counties, locations, z, text,
         margin={"r":100,"t":30,"l":30,"b":0},
     )
     
-    # Show the figure
+    # Show the figure, which needs the geometry itself
     if show_fig:
-        fig.show()
+        go.Figure(fig).update_traces(geojson=counties).show()
     
     # Download the figure From Sunny Mui
-    go.Figure.write_html(fig, file=html_filename, config={'responsive': True}, include_plotlyjs='cdn')
+    write_figure_html(fig, html_filename, counties, geojson_key)
 
 
+@traced
 def viz_correlation_ppe_request_covid19_cases(merged_covid_ppe_hosp_df):
     # select counties that have had at least 1 ppe request
     counties_with_ppe_requests_and_covid_cases = merged_covid_ppe_hosp_df[
@@ -75,98 +83,48 @@ def viz_correlation_ppe_request_covid19_cases(merged_covid_ppe_hosp_df):
     
     fig.show()
 
-def choropleth_mapbox_layered_plot (counties, html_filename,
-    locations_0, z_0, text_0, colorscale_0, zmin_0, zmax_0, title_0, colorbar_title_0,
-    locations_1, z_1, text_1, colorscale_1, zmin_1, zmax_1, title_1, colorbar_title_1,
-    locations_2, z_2, text_2, colorscale_2, zmin_2, zmax_2, title_2, colorbar_title_2,
-    locations_3, z_3, text_3, colorscale_3, zmin_3, zmax_3, title_3, colorbar_title_3,
-    ):
-    
+@traced
+def choropleth_mapbox_layers_plot (counties, layers, html_filename,
+                                   title='GetUsPPE.org', geojson_key='counties',
+                                   geojson_path=None):
+    """Write a map with one choropleth layer per spec in layers, and a button to show each.
+
+    Each layer is a dict with label, locations, z, text, colorscale, zmin, zmax,
+    title and colorbar_title. The geometry is written into the page once and
+    referenced by every layer, or with geojson_path written to that file and
+    loaded from it, so the page does not grow with the number of layers.
+    """
+    if geojson_path is not None:
+        with open(geojson_path, 'w') as f:
+            f.write(encoded(counties)[1])
+        geojson_key = path.relpath(geojson_path, path.dirname(path.abspath(html_filename)))
+
     fig = go.Figure()
-    
-    # First trace
-    fig = fig.add_trace(go.Choroplethmapbox(
-        geojson=counties,
-        locations=locations_0, 
-        z=z_0, 
-        text=text_0,
-        colorscale=colorscale_0,
-        zmin=zmin_0,
-        zmax=zmax_0,
-        marker_opacity=0.8, 
-        marker_line_width=0.5, 
-        colorbar_title=colorbar_title_0, 
-        hoverinfo='text',
-        visible=True
-        ))
-    
-    # Second trace
-    fig = fig.add_trace(go.Choroplethmapbox(
-        geojson=counties,
-        locations=locations_1, 
-        z=z_1, 
-        text=text_1,
-        colorscale=colorscale_1,
-        zmin=zmin_1,
-        zmax=zmax_1,
-        marker_opacity=0.8, 
-        marker_line_width=0.5, 
-        colorbar_title=colorbar_title_1, 
-        hoverinfo='text',
-        visible=False
-        ))
-    
-    # Third trace
-    fig = fig.add_trace(go.Choroplethmapbox(
-        geojson=counties,
-        locations=locations_2, 
-        z=z_2, 
-        text=text_2,
-        colorscale=colorscale_2,
-        zmin=zmin_2,
-        zmax=zmax_2,
-        marker_opacity=0.8, 
-        marker_line_width=0.5, 
-        colorbar_title=colorbar_title_2, 
-        hoverinfo='text',
-        visible=False
-        ))
-    
-    # Fourth trace
-    fig = fig.add_trace(go.Choroplethmapbox(
-        geojson=counties,
-        locations=locations_3, 
-        z=z_3, 
-        text=text_3,
-        colorscale=colorscale_3,
-        zmin=zmin_3,
-        zmax=zmax_3,
-        marker_opacity=0.8, 
-        marker_line_width=0.5, 
-        colorbar_title=colorbar_title_3, 
-        hoverinfo='text',
-        visible=False
-        ))
-    
 
-    # Create button list
-    buttons_list=list([
-        dict(label='PPE Requests', method="update",
-             args=[{"visible": ([True,False,False,False])},
-                   {"title": title_0}]),
-        dict(label='COVID19 Cases', method="update",
-             args=[{"visible": ([False,True,False,False])},
-                   {"title": title_1}]),
-        dict(label='COVID19 Cases Per PPE Request', method="update",
-             args=[{"visible": ([False,False,True,False])},
-                   {"title": title_2}]),
-        dict(label='COVID19 Cases Per Hospital Bed', method="update",
-             args=[{"visible": ([False,False,False,True])},
-                   {"title": title_3}]),
-        
-    
-        ])
-    
+    # One trace per layer, only the first one visible
+    for i, layer in enumerate(layers):
+        fig = fig.add_trace(go.Choroplethmapbox(
+            geojson=geojson_key,
+            locations=layer['locations'],
+            z=layer['z'],
+            text=layer['text'],
+            colorscale=layer['colorscale'],
+            zmin=layer['zmin'],
+            zmax=layer['zmax'],
+            marker_opacity=0.8,
+            marker_line_width=0.5,
+            colorbar_title=layer['colorbar_title'],
+            hoverinfo='text',
+            visible=(i == 0)
+            ))
+
+    # Create button list, each button shows its own layer
+    buttons_list=[
+        dict(label=layer['label'], method="update",
+             args=[{"visible": [j == i for j in range(len(layers))]},
+                   {"title": layer['title']}])
+        for i, layer in enumerate(layers)]
+
     # Add buttons
     fig.update_layout(
         updatemenus=list([
@@ -181,16 +139,107 @@ def choropleth_mapbox_layered_plot (counties, html_filename,
                 buttons=buttons_list,
             )])
     )
-    
+
     # Center on US
     fig.update_layout(
-        title='GetUsPPE.org',
+        title=title,
         mapbox_style="carto-positron",
-        mapbox_zoom=3.5, 
+        mapbox_zoom=3.5,
         mapbox_center = {"lat": 37.0902, "lon": -95.7129},
         margin={"r":100,"t":100,"l":30,"b":0},
     )
-    
-    # Download the figure From Sunny Mui
-    go.Figure.write_html(fig, file=html_filename, config={'responsive': True}, include_plotlyjs='cdn')
 
+    # Write the figure, with the shared geometry loaded before the plot is drawn
+    write_figure_html(fig, html_filename, counties if geojson_path is None else None, geojson_key)
+
+
+@traced
+def choropleth_mapbox_animated_plot (counties, locations, frame_labels, z, html_filename,
+                                     text=None, customdata=None, hovertemplate=None,
+                                     colorscale='RdBu_r', zmin=-1, zmax=10,
+                                     title='GetUsPPE.org', colorbar_title='count',
+                                     geojson_key='counties', frame_duration=300):
+    """Write a map with one animation frame per label in frame_labels, and a slider to pick one.
+
+    z is an (locations, frames) array, such as a slice of a timeseries.county_cube,
+    and customdata an optional (locations, frames, k) array for hovertemplate.
+    Frames only carry their z and customdata columns; the geometry and text
+    are written into the page once and shared by every frame.
+    """
+    z = np.asarray(z)
+    def frame_data(i):
+        data = dict(type='choroplethmapbox', z=z[:, i])
+        if customdata is not None:
+            data['customdata'] = customdata[:, i]
+        return data
+
+    last = len(frame_labels) - 1
+    trace = frame_data(last)
+    fig = go.Figure(go.Choroplethmapbox(
+        geojson=geojson_key,
+        locations=locations,
+        z=trace['z'],
+        customdata=trace.get('customdata'),
+        text=text,
+        hovertemplate=hovertemplate,
+        colorscale=colorscale,
+        zmin=zmin,
+        zmax=zmax,
+        marker_opacity=0.8,
+        marker_line_width=0.5,
+        colorbar_title=colorbar_title,
+        ),
+        frames=[go.Frame(name=str(label), data=[frame_data(i)])
+            for i, label in enumerate(frame_labels)])
+
+    # Choropleths are redrawn for every frame, so animate without transitions
+    animation = dict(frame=dict(duration=frame_duration, redraw=True),
+        transition=dict(duration=0), mode='immediate')
+    fig.update_layout(
+        updatemenus=[dict(
+            type="buttons",
+            direction="right",
+            pad={"l":75,"t": -40},
+            yanchor="top",
+            xanchor="left",
+            buttons=[
+                dict(label="Play", method="animate", args=[None, dict(animation, fromcurrent=True)]),
+                dict(label="Pause", method="animate",
+                     args=[[None], dict(frame=dict(duration=0, redraw=False), mode='immediate')]),
+            ])],
+        sliders=[dict(
+            active=last,
+            pad={"l":75,"t": 10},
+            steps=[dict(label=str(label), method="animate", args=[[str(label)], animation])
+                for label in frame_labels])],
+    )
+
+    # Center on US
+    fig.update_layout(
+        title=title,
+        mapbox_style="carto-positron",
+        mapbox_zoom=3.5,
+        mapbox_center = {"lat": 37.0902, "lon": -95.7129},
+        margin={"r":100,"t":100,"l":30,"b":0},
+    )
+
+    write_figure_html(fig, html_filename, counties, geojson_key)
+
+
+@traced
+def choropleth_mapbox_layered_plot (counties, html_filename,
+    locations_0, z_0, text_0, colorscale_0, zmin_0, zmax_0, title_0, colorbar_title_0,
+    locations_1, z_1, text_1, colorscale_1, zmin_1, zmax_1, title_1, colorbar_title_1,
+    locations_2, z_2, text_2, colorscale_2, zmin_2, zmax_2, title_2, colorbar_title_2,
+    locations_3, z_3, text_3, colorscale_3, zmin_3, zmax_3, title_3, colorbar_title_3,
+    ):
+    # Four layer version of choropleth_mapbox_layers_plot
+    labels = ['PPE Requests', 'COVID19 Cases',
+        'COVID19 Cases Per PPE Request', 'COVID19 Cases Per Hospital Bed']
+    args = locals()
+    layers = [dict(label=label,
+        locations=args['locations_%d' % i], z=args['z_%d' % i], text=args['text_%d' % i],
+        colorscale=args['colorscale_%d' % i], zmin=args['zmin_%d' % i], zmax=args['zmax_%d' % i],
+        title=args['title_%d' % i], colorbar_title=args['colorbar_title_%d' % i])
+        for i, label in enumerate(labels)]
+    choropleth_mapbox_layers_plot(counties, layers, html_filename)
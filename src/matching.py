@@ -0,0 +1,160 @@
+import numpy as np
+from math_custom import spatial_index
+
+# Requesters matched to one donor each, donors serving up to their capacity.
+#
+# Every requester is connected to its k nearest donors within max_km (the sparse
+# candidate graph, as (n, k) arrays), and each edge is worth
+#     1 + hazard_weight * hazard / max(hazard) - km / max_km
+# so any match within max_km beats none, more urgent requesters win donors in
+# short supply, and closer donors win otherwise. The assignment maximizes the
+# total worth of the matches.
+
+
+def candidate_graph(requester_lat, requester_lon, donor_lat, donor_lon, k=10, max_km=250):
+    """(donor, km) arrays of shape (n requesters, k) of the nearest donors, -1 and inf where none"""
+    queries = np.column_stack([np.asarray(requester_lat, dtype=float),
+        np.asarray(requester_lon, dtype=float)])
+    donor = np.full((len(queries), min(k, len(donor_lat))), -1, dtype=np.int64)
+    km = np.full(donor.shape, np.inf)
+    valid = np.isfinite(queries).all(axis=1)
+    if valid.any() and donor.shape[1]:
+        donor[valid], km[valid] = spatial_index(donor_lat, donor_lon).k_nearest(
+            queries[valid], k, max_km=max_km)
+    return donor, km
+
+
+def _rank_by_donor(donor, score):
+    # Order of the bids grouped by donor, highest score first, and each bid's rank at its donor
+    order = np.lexsort((-score, donor))
+    sorted_donor = donor[order]
+    return order, np.arange(len(order)) - np.searchsorted(sorted_donor, sorted_donor)
+
+
+def _keep_best(donor, score, capacity):
+    # Mask of the bids each donor keeps: its capacity highest scores
+    order, rank = _rank_by_donor(donor, score)
+    keep = np.zeros(len(donor), dtype=bool)
+    keep[order] = rank < capacity[donor[order]]
+    return keep
+
+
+def _greedy(value, donor, capacity):
+    # Each round the unmatched requesters propose to their best donor with room
+    # left, and every donor takes the highest valued proposals it has room for
+    n = len(value)
+    value = value.copy()
+    remaining = capacity.copy()
+    match = np.full(n, -1, dtype=np.int64)
+    rows = np.arange(n)
+    for _ in range(value.shape[1]):
+        full = (donor >= 0) & (remaining[np.maximum(donor, 0)] <= 0)
+        value[full] = -np.inf
+        proposers = rows[(match < 0) & np.isfinite(value).any(axis=1)]
+        if not len(proposers):
+            break
+        slot = value[proposers].argmax(axis=1)
+        to, worth = donor[proposers, slot], value[proposers, slot]
+        keep = _keep_best(to, worth, remaining)
+        match[proposers[keep]] = slot[keep]
+        np.subtract.at(remaining, to[keep], 1)
+        # a rejected requester tries its next donor
+        value[proposers[~keep], slot[~keep]] = -np.inf
+    return match
+
+
+def _auction(value, donor, capacity, eps, max_rounds=1000000):
+    # Jacobi auction (Bertsekas): every round the unmatched requesters bid for
+    # their best donor by how much it beats their second best option (or no
+    # match) plus eps, and donors keep their capacity highest bids, pricing
+    # themselves at the lowest bid they keep once full. Prices only go up, so a
+    # requester that prefers no match at current prices is done. The result is
+    # within eps per requester of the best total worth.
+    n = len(value)
+    candidate = np.isfinite(value)
+    price = np.zeros(len(capacity))
+    match = np.full(n, -1, dtype=np.int64)
+    # the requesters holding each donor and their bids, in capacity slots per donor
+    slot_start = np.concatenate([[0], np.cumsum(capacity)])
+    slot_holder = np.full(slot_start[-1], -1, dtype=np.int64)
+    slot_bid = np.zeros(slot_start[-1])
+
+    bidders = np.nonzero(candidate.any(axis=1))[0]
+    for _ in range(max_rounds):
+        if not len(bidders):
+            break
+        net = np.where(candidate[bidders], value[bidders] - price[np.maximum(donor[bidders], 0)], -np.inf)
+        rows = np.arange(len(bidders))
+        slot = net.argmax(axis=1)
+        first = net[rows, slot]
+        net[rows, slot] = -np.inf
+        second = np.maximum(net.max(axis=1), 0.0)
+        bidding = first > 0
+        bidders, slot = bidders[bidding], slot[bidding]
+        to = donor[bidders, slot]
+        offer = price[to] + first[bidding] - second[bidding] + eps
+
+        # the new bids compete with the current holders of the same donors
+        touched = np.unique(to)
+        sizes = capacity[touched]
+        slots = np.arange(sizes.sum()) + np.repeat(slot_start[touched] - (np.cumsum(sizes) - sizes), sizes)
+        held = slots[slot_holder[slots] >= 0]
+        holders = slot_holder[held]
+        who = np.concatenate([holders, bidders])
+        where = np.concatenate([match[holders], slot])
+        at = np.concatenate([donor[holders, match[holders]], to])
+        amount = np.concatenate([slot_bid[held], offer])
+
+        order, rank = _rank_by_donor(at, amount)
+        who, where, at, amount = who[order], where[order], at[order], amount[order]
+        keep = rank < capacity[at]
+        match[who[~keep]] = -1
+        match[who[keep]] = where[keep]
+        slot_holder[slots] = -1
+        slot_holder[slot_start[at[keep]] + rank[keep]] = who[keep]
+        slot_bid[slot_start[at[keep]] + rank[keep]] = amount[keep]
+
+        # full donors are priced at the lowest bid they keep, the last one in order
+        last = keep & (rank == capacity[at] - 1)
+        price[at[last]] = amount[last]
+        bidders = who[~keep]
+    return match
+
+
+def match_requesters(requester_lat, requester_lon, donor_lat, donor_lon, capacity=1, hazard=None,
+                     k=10, max_km=250, hazard_weight=1.0, method='auction', tolerance_km=0.5):
+    """Assign every requester at most one donor, and every donor at most capacity requesters.
+
+    capacity is a number or one per donor, hazard one urgency per requester
+    (e.g. Hazard_Index_Covid_Cases_Per_Hosp_Bed, missing counts as 0). method is
+    'auction' for an assignment within about tolerance_km per requester of the
+    best total, or 'greedy' for a faster, rougher assignment of very large inputs.
+    Returns (donor, km) arrays with the position of each requester's donor, -1
+    and inf where it has none.
+    """
+    if method not in ('auction', 'greedy'):
+        raise ValueError('Unknown matching method %s' % method)
+    n = len(requester_lat)
+    capacity = np.broadcast_to(np.asarray(capacity, dtype=np.int64), (len(donor_lat),)).copy()
+    donor, km = candidate_graph(requester_lat, requester_lon, donor_lat, donor_lon, k, max_km)
+
+    urgency = np.zeros(n)
+    if hazard is not None:
+        urgency = np.nan_to_num(np.clip(np.asarray(hazard, dtype=float), 0, None))
+        if urgency.max(initial=0) > 0:
+            urgency = urgency / urgency.max()
+    scale = max_km if max_km is not None else max(np.max(km, initial=0, where=np.isfinite(km)), 1.0)
+    value = 1 + hazard_weight * urgency[:, None] - km / scale
+    value[(donor < 0) | (capacity[np.maximum(donor, 0)] <= 0)] = -np.inf
+
+    if method == 'greedy':
+        slot = _greedy(value, donor, capacity)
+    else:
+        slot = _auction(value, donor, capacity, eps=tolerance_km / scale)
+    matched = slot >= 0
+    rows = np.nonzero(matched)[0]
+    match = np.full(n, -1, dtype=np.int64)
+    match_km = np.full(n, np.inf)
+    match[rows] = donor[rows, slot[rows]]
+    match_km[rows] = km[rows, slot[rows]]
+    return match, match_km
@@ -1,4 +1,9 @@
 from math import cos, asin, sqrt
+import numpy as np
+from scipy.spatial import cKDTree
+
+# Mean earth radius in km (12742 / 2, matching distance below)
+EARTH_RADIUS_KM = 6371.0
 
 # Math for determing closest distance
 def distance(lat1, lon1, lat2, lon2):
@@ -6,14 +11,96 @@ def distance(lat1, lon1, lat2, lon2):
     a = 0.5 - cos((lat2-lat1)*p)/2 + cos(lat1*p)*cos(lat2*p) * (1-cos((lon2-lon1)*p)) / 2
     return 12742 * asin(sqrt(a))
 
-def closest(data, v):
-    return min(data, key=lambda p: distance(v['lat'],v['lon'],p['lat'],p['lon']))
+def haversine(lat1, lon1, lat2, lon2):
+    """Vectorized version of distance, broadcasting over numpy arrays (km)"""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(x, dtype=float))
+        for x in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2-lat1)/2)**2 + np.cos(lat1)*np.cos(lat2)*np.sin((lon2-lon1)/2)**2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+def to_unit_sphere(lats, lons):
+    """Convert lat/lon in degrees to an (n, 3) array of points on the unit sphere"""
+    lats = np.radians(np.asarray(lats, dtype=float))
+    lons = np.radians(np.asarray(lons, dtype=float))
+    cos_lat = np.cos(lats)
+    return np.column_stack([cos_lat*np.cos(lons), cos_lat*np.sin(lons), np.sin(lats)])
+
+
+class spatial_index:
+    """Nearest neighbor index over lat/lon points.
+
+    Points are stored as unit-sphere coordinates in a KD-tree, where the
+    straight line (chord) distance orders points the same way as the
+    great circle distance, so a single tree answers haversine queries.
+    """
+    def __init__(self, lats, lons):
+        self.lats = np.asarray(lats, dtype=float)
+        self.lons = np.asarray(lons, dtype=float)
+        self.tree = cKDTree(to_unit_sphere(self.lats, self.lons))
+
+    def __len__(self):
+        return len(self.lats)
+
+    def k_nearest(self, queries, k, max_km=None):
+        """Find the k nearest points for every query.
+
+        queries is an (n, 2) array-like of (lat, lon) rows, or a single (lat, lon).
+        Returns (index, distance_km) arrays of shape (n, k), sorted by distance.
+        Slots with no neighbor (fewer than k points, or beyond max_km) have
+        index -1 and distance inf.
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=float))
+        k = min(k, len(self))
+        if k == 0 or len(queries) == 0:
+            return (np.empty((len(queries), k), dtype=np.int64),
+                np.empty((len(queries), k), dtype=float))
+
+        # convert km on the surface to the equivalent chord length
+        upper_bound = np.inf
+        if max_km is not None:
+            upper_bound = 2 * np.sin(min(max_km / EARTH_RADIUS_KM, np.pi) / 2) + 1e-12
 
-def k5_closest(data,v):
-    return sorted(data, key=lambda p: distance(v['lat'],v['lon'],p['lat'],p['lon']))[:5]
+        _, index = self.tree.query(
+            to_unit_sphere(queries[:, 0], queries[:, 1]), k=k,
+            distance_upper_bound=upper_bound)
+        index = np.asarray(index, dtype=np.int64).reshape(len(queries), k)
 
-def k10_closest(data,v):
-    return sorted(data, key=lambda p: distance(v['lat'],v['lon'],p['lat'],p['lon']))[:10]
+        # recompute the distances in km with the haversine kernel
+        found = index < len(self)
+        index[~found] = -1
+        distance_km = np.full(index.shape, np.inf)
+        rows = np.nonzero(found)[0]
+        distance_km[found] = haversine(
+            queries[rows, 0], queries[rows, 1],
+            self.lats[index[found]], self.lons[index[found]])
+        return index, distance_km
+
+
+def points_index(data):
+    """Spatial index of a list of dicts with lat and lon, to pass to the helpers below"""
+    return spatial_index([p['lat'] for p in data], [p['lon'] for p in data])
+
+
+def _k_closest(data, v, k, index=None):
+    # Thin wrapper so the list of dict helpers share the spatial index; index, when
+    # given, is points_index(data), kept by callers that query the same list many times
+    if not data:
+        return []
+    if index is None:
+        index = points_index(data)
+    nearest, _ = index.k_nearest((v['lat'], v['lon']), k)
+    return [data[i] for i in nearest[0] if i >= 0]
+
+def closest(data, v, index=None):
+    if not data:
+        raise ValueError('closest() arg is an empty sequence')
+    return _k_closest(data, v, 1, index)[0]
+
+def k5_closest(data, v, index=None):
+    return _k_closest(data, v, 5, index)
+
+def k10_closest(data, v, index=None):
+    return _k_closest(data, v, 10, index)
 
 # EXAMPLE HOW TO USE 
 ''' 
@@ -33,8 +120,15 @@ temp_df=pd.DataFrame(tempDataList)
 temp_array = temp_df[['name','lat','lon']].to_dict('records')
 print(k5_closest(temp_array, v))
 
-# Example for pulling Top 5 closest donors to location
-k5_closest(
-    ppe_donors_with_zip_df[['Name','lat','lon','state']].to_dict('records'),
-    v)
+# Example for pulling Top 5 closest donors to each location (index the donors
+# once, and pass the index to every call)
+donors = ppe_donors_with_zip_df[['Name','lat','lon','state']].to_dict('records')
+donors_index = points_index(donors)
+for v in locations:
+    k5_closest(donors, v, donors_index)
+
+# Example for matching every requester to its 5 closest donors in one batch
+donor_index = spatial_index(ppe_donors_with_zip_df['lat'], ppe_donors_with_zip_df['lon'])
+donor_rows, donor_km = donor_index.k_nearest(
+    requestor_info_df[['lat','lon']].values, k=5, max_km=100)
 '''
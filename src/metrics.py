@@ -0,0 +1,55 @@
+from collections import namedtuple
+import numpy as np
+
+# A ratio column: numerator / denominator, with the value used when either is zero.
+# None for zero_numerator means a zero numerator just divides normally (giving 0).
+ratio_metric = namedtuple('ratio_metric',
+    ['name', 'numerator', 'denominator', 'zero_denominator', 'zero_numerator'])
+
+COUNTY_METRICS = {m.name: m for m in [
+    # Covid19 cases per hospital bed (hazard index), 0 for counties without beds
+    ratio_metric('Covid_cases_per_bed', 'cases', 'BEDS', 0.0, None),
+    # Covid19 cases per PPE request, 0 for counties without requests
+    ratio_metric('Covid_cases_per_PPE_requests', 'cases', 'PPE_requests', 0.0, None),
+    # GetUsPPE donors per requester, missing for counties without donors
+    ratio_metric('PPE_Donor_Per_Requester', 'ppe_donors', 'PPE_requests', 0.0, np.nan),
+]}
+
+
+def masked_divide(numerator, denominator, zero_denominator=0.0, zero_numerator=None):
+    """Elementwise numerator / denominator as float64, without divide by zero warnings.
+
+    Missing inputs give NaN, zero denominators give zero_denominator, and zero
+    numerators give zero_numerator when it is not None.
+    """
+    numerator = np.asarray(numerator, dtype=np.float64)
+    denominator = np.asarray(denominator, dtype=np.float64)
+
+    result = np.full(np.broadcast(numerator, denominator).shape, zero_denominator,
+        dtype=np.float64)
+    np.divide(numerator, denominator, out=result, where=denominator != 0)
+    if zero_numerator is not None:
+        result[numerator == 0] = zero_numerator
+    result[np.isnan(numerator) | np.isnan(denominator)] = np.nan
+    return result
+
+
+def compute_metrics(df, names, metrics=COUNTY_METRICS):
+    """Add (or overwrite) the named ratio columns of df as float64 columns.
+
+    Each input column is converted to a numpy array once and shared between
+    metrics, and results only depend on the input columns, so calling this
+    again on the same frame gives the same result.
+    """
+    arrays = {}
+    def column(name):
+        if name not in arrays:
+            arrays[name] = df[name].to_numpy(dtype=np.float64, na_value=np.nan)
+        return arrays[name]
+
+    for name in names:
+        metric = metrics[name]
+        df[metric.name] = masked_divide(
+            column(metric.numerator), column(metric.denominator),
+            metric.zero_denominator, metric.zero_numerator)
+    return df
@@ -0,0 +1,164 @@
+import multiprocessing
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from schema import SCHEMAS, normalize, validate
+
+# A named step of the pipeline. inputs are the names of the stages whose results it
+# takes, as a list (passed positionally) or a dict of {argument name: stage name}.
+# kind is 'thread' for I/O, 'process' for CPU heavy work on picklable arguments,
+# or 'main' to run in the calling thread. Stages with checkpoint set save their
+# data frame to the pipeline's checkpoint store, and can resume from it. Results
+# of stages with a schema (a name in schema.SCHEMAS) are validated against it.
+# A serial pipeline runs every stage in the calling thread, one at a time, as
+# tracing needs (see instrument.py).
+stage = namedtuple('stage', ['name', 'func', 'inputs', 'kind', 'checkpoint', 'schema', 'kwargs'])
+
+stage_timing = namedtuple('stage_timing', ['name', 'kind', 'start', 'seconds'])
+
+
+class pipeline:
+    """Small dependency graph of named stages.
+
+    run() starts every stage as soon as the stages it depends on have
+    finished, so independent downloads overlap and the wall time is bounded
+    by the slowest chain of stages instead of the sum of all of them.
+    """
+    def __init__(self, max_threads=8, max_processes=None, checkpoints=None, serial=False):
+        self.stages = {}
+        self.max_threads = max_threads
+        self.max_processes = max_processes
+        self.checkpoints = checkpoints
+        self.serial = serial
+        self.results = {}
+        self.timings = []
+
+    def add_stage(self, name, func, inputs=(), kind='thread', checkpoint=False, schema=None,
+                  **kwargs):
+        if name in self.stages:
+            raise ValueError('Stage %s already exists' % name)
+        if kind not in ('thread', 'process', 'main'):
+            raise ValueError('Unknown stage kind %s' % kind)
+        if schema is not None and schema not in SCHEMAS:
+            raise ValueError('Unknown schema %s for stage %s' % (schema, name))
+        self.stages[name] = stage(name, func, inputs, kind, checkpoint, schema, kwargs)
+        return self
+
+    def _dependencies(self, s):
+        return list(s.inputs.values()) if isinstance(s.inputs, dict) else list(s.inputs)
+
+    def _check(self):
+        # every input must be a stage, and the graph must not have cycles
+        for s in self.stages.values():
+            for dep in self._dependencies(s):
+                if dep not in self.stages:
+                    raise ValueError('Stage %s needs unknown stage %s' % (s.name, dep))
+        visiting, done = set(), set()
+        def visit(name):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError('Cycle in pipeline at stage %s' % name)
+            visiting.add(name)
+            for dep in self._dependencies(self.stages[name]):
+                visit(dep)
+            done.add(name)
+        for name in self.stages:
+            visit(name)
+
+    def _call_args(self, s):
+        if isinstance(s.inputs, dict):
+            kwargs = {arg: self.results[dep] for arg, dep in s.inputs.items()}
+            kwargs.update(s.kwargs)
+            return [], kwargs
+        return [self.results[dep] for dep in s.inputs], s.kwargs
+
+    def run(self):
+        """Run all stages and return a dict of results by stage name"""
+        self._check()
+        self.results = {}
+        self.timings = []
+        pending = dict(self.stages)
+        running = {}
+        started = time.perf_counter()
+
+        threads = ThreadPoolExecutor(max_workers=self.max_threads)
+        processes = None
+        if not self.serial and any(s.kind == 'process' for s in self.stages.values()):
+            # spawn, so workers do not inherit locks held by the download threads
+            processes = ProcessPoolExecutor(max_workers=self.max_processes,
+                mp_context=multiprocessing.get_context('spawn'))
+        try:
+            while pending or running:
+                ready = [s for s in pending.values()
+                    if all(dep in self.results for dep in self._dependencies(s))]
+                for s in ready:
+                    del pending[s.name]
+                    start = time.perf_counter()
+                    resumed = self._resume(s)
+                    if resumed is not None:
+                        self._finish(s, start - started, resumed, start, 'resumed')
+                        continue
+                    args, kwargs = self._call_args(s)
+                    if s.kind == 'main' or self.serial:
+                        self._finish(s, start - started, self._run_main(s, args, kwargs), start, 'main')
+                        continue
+                    executor = processes if s.kind == 'process' else threads
+                    running[executor.submit(s.func, *args, **kwargs)] = (s, start)
+
+                # main stages may have unblocked others, so look again before waiting
+                if any(all(dep in self.results for dep in self._dependencies(s))
+                        for s in pending.values()):
+                    continue
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    s, start = running.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        raise RuntimeError('Stage %s failed' % s.name) from e
+                    self._finish(s, start - started, result, start)
+        finally:
+            for future in running:
+                future.cancel()
+            threads.shutdown(wait=True)
+            if processes is not None:
+                processes.shutdown(wait=True)
+
+        self.total_seconds = time.perf_counter() - started
+        return self.results
+
+    def _run_main(self, s, args, kwargs):
+        try:
+            return s.func(*args, **kwargs)
+        except Exception as e:
+            raise RuntimeError('Stage %s failed' % s.name) from e
+
+    def _resume(self, s):
+        # latest valid checkpoint of the stage, when the store is set to resume
+        if s.checkpoint and self.checkpoints is not None and self.checkpoints.resume:
+            return self.checkpoints.latest(s.name)
+        return None
+
+    def _finish(self, s, start_offset, result, start, kind=None):
+        if s.schema is not None:
+            if kind == 'resumed':
+                # checkpoints written before the schema hold plain string and float columns
+                result = normalize(result, s.schema)
+            validate(result, s.schema)
+        if s.checkpoint and self.checkpoints is not None and kind != 'resumed':
+            self.checkpoints.write(s.name, result)
+        self.results[s.name] = result
+        self.timings.append(stage_timing(s.name, kind or s.kind, start_offset,
+            time.perf_counter() - start))
+
+    def timing_report(self):
+        """Table of when each stage started and how long it took, in seconds"""
+        lines = ['{:<32} {:<8} {:>9} {:>9}'.format('stage', 'kind', 'start', 'seconds')]
+        for t in sorted(self.timings, key=lambda t: t.start):
+            lines.append('{:<32} {:<8} {:>9.2f} {:>9.2f}'.format(t.name, t.kind, t.start, t.seconds))
+        lines.append('{:<32} {:<8} {:>9} {:>9.2f}'.format('total (wall)', '', '', self.total_seconds))
+        return '\n'.join(lines)
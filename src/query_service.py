@@ -0,0 +1,298 @@
+"""Local HTTP service answering requester, donor and county queries from memory.
+
+Loads the latest checkpoints of the requesters (requestor_df), the county
+frame (merged_covid_ppe_hosp_df) and the donors (ppe_donors_with_zip_df)
+once, and answers from indexes built over them:
+
+    GET  /requesters/nearest?lat=40.7&lon=-74.0&k=10&need=N95
+    GET  /requesters/nearest?donor=12&k=10          (from the donor with index 12)
+    GET  /requesters/bbox?south=40&west=-75&north=41&east=-73&limit=1000
+    GET  /donors/nearest?lat=40.7&lon=-74.0&k=10
+    GET  /county/36061
+    GET  /status
+    POST /reload
+
+A reload builds a new snapshot next to the current one and then swaps it in,
+so requests in flight finish on the snapshot they started with.
+
+    python query_service.py --port 8050
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import numpy as np
+import pandas as pd
+import checkpoint
+from math_custom import spatial_index
+from schema import to_fips
+
+# Checkpoint names of the frames the service loads
+SNAPSHOT_FRAMES = {
+    'requesters': 'requestor_df',
+    'counties': 'merged_covid_ppe_hosp_df',
+    'donors': 'ppe_donors_with_zip_df',
+}
+
+# County columns returned by /county, when present
+COUNTY_COLUMNS = ['fips', 'county', 'State', 'PPE_requests', 'cases', 'deaths', 'BEDS',
+    'Covid_cases_per_bed', 'Covid_cases_per_PPE_requests', 'ppe_donors', 'PPE_Donor_Per_Requester']
+
+
+class query_error(ValueError):
+    pass
+
+
+class point_table:
+    """Rows of a frame with lat/lon, indexed for k nearest and bounding box queries"""
+    def __init__(self, df):
+        # row is the position in the checkpoint, which /requesters/nearest?donor= refers to
+        df = df.assign(row=np.arange(len(df))) if df is not None else pd.DataFrame()
+        if len(df):
+            df = df[np.isfinite(pd.to_numeric(df['lat'], errors='coerce')) &
+                np.isfinite(pd.to_numeric(df['lon'], errors='coerce'))].reset_index(drop=True)
+        self.df = df
+        self.lats = df['lat'].to_numpy(dtype=float) if len(df) else np.empty(0)
+        self.lons = df['lon'].to_numpy(dtype=float) if len(df) else np.empty(0)
+        self.index = spatial_index(self.lats, self.lons) if len(df) else None
+        # rows sorted by latitude, so a bounding box is a slice then a longitude filter
+        self.by_lat = np.argsort(self.lats, kind='stable')
+        self.sorted_lats = self.lats[self.by_lat]
+        self.needs = df['need'].astype(str).str.lower().to_numpy() if 'need' in df.columns else None
+
+    def __len__(self):
+        return len(self.df)
+
+    def nearest(self, lat, lon, k, need=None, max_km=None):
+        """Positions and distances of the k nearest rows, only those whose need contains need"""
+        if self.index is None or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        if need is not None and self.needs is None:
+            raise query_error('These rows have no need column')
+        # ask for more neighbors until k of them match the need filter
+        wanted = k
+        while True:
+            rows, km = self.index.k_nearest((lat, lon), wanted, max_km=max_km)
+            rows, km = rows[0], km[0]
+            found = rows >= 0
+            rows, km = rows[found], km[found]
+            if need is not None:
+                match = np.char.find(self.needs[rows].astype(str), need.lower()) >= 0
+                rows, km = rows[match], km[match]
+            if len(rows) >= k or wanted >= len(self) or not found.all():
+                return rows[:k], km[:k]
+            wanted = min(wanted * 4, len(self))
+
+    def in_bbox(self, south, west, north, east, limit):
+        first = np.searchsorted(self.sorted_lats, south, side='left')
+        last = np.searchsorted(self.sorted_lats, north, side='right')
+        rows = self.by_lat[first:last]
+        lons = self.lons[rows]
+        # a box crossing the antimeridian has west > east
+        inside = (lons >= west) & (lons <= east) if west <= east else (lons >= west) | (lons <= east)
+        return np.sort(rows[inside])[:limit]
+
+    def records(self, rows, km=None):
+        df = self.df.iloc[rows]
+        if km is not None:
+            df = df.assign(distance_km=np.round(km, 3))
+        return json.loads(df.to_json(orient='records', date_format='iso'))
+
+
+class snapshot:
+    """The frames and indexes one version of the service answers from; never modified"""
+    def __init__(self, requesters=None, counties=None, donors=None, sources=None):
+        self.requesters = point_table(requesters)
+        self.donors = point_table(donors)
+        self.counties = counties if counties is not None else pd.DataFrame(columns=['fips'])
+        self.county_rows = {fips: i for i, fips in enumerate(self.counties['fips'].astype(str))}
+        self.requester_fips = requesters['fips'].astype(str).value_counts().to_dict() \
+            if requesters is not None and 'fips' in requesters.columns else {}
+        self.sources = sources or {}
+        self.loaded = time.time()
+
+    @classmethod
+    def from_checkpoints(cls, store):
+        """Snapshot of the newest readable checkpoint of each frame, however old"""
+        frames, sources = {}, {}
+        for key, name in SNAPSHOT_FRAMES.items():
+            frames[key] = sources[key] = None
+            for path in store.checkpoints(name):
+                try:
+                    frames[key], sources[key] = store.read(path), os.path.basename(path)
+                    break
+                except (IOError, ValueError, KeyError) as e:
+                    print('Skipping checkpoint {}: {}'.format(path, e))
+        return cls(sources=sources, **frames)
+
+    def county(self, fips):
+        fips = to_fips(pd.Series([fips])).astype(str)[0]
+        if fips not in self.county_rows:
+            return None
+        row = self.counties.iloc[self.county_rows[fips]]
+        record = json.loads(row[[c for c in COUNTY_COLUMNS if c in row.index]].to_json())
+        record['requesters'] = self.requester_fips.get(fips, 0)
+        return record
+
+    def status(self):
+        return {'loaded': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.loaded)),
+            'requesters': len(self.requesters), 'donors': len(self.donors),
+            'counties': len(self.counties), 'sources': self.sources}
+
+
+class query_service:
+    """Holds the current snapshot and answers queries on it; reload() swaps in a new one"""
+    def __init__(self, store, watch_seconds=None):
+        self.store = store
+        self._reload_lock = threading.Lock()
+        self.snapshot = snapshot.from_checkpoints(self.store)
+        self._watched = self._newest_checkpoints()
+        self.watch_seconds = watch_seconds
+        if watch_seconds:
+            threading.Thread(target=self._watch, daemon=True).start()
+
+    def _newest_checkpoints(self):
+        newest = {}
+        for name in SNAPSHOT_FRAMES.values():
+            paths = self.store.checkpoints(name)
+            newest[name] = (paths[0], os.path.getmtime(paths[0])) if paths else None
+        return newest
+
+    def _watch(self):
+        while True:
+            time.sleep(self.watch_seconds)
+            try:
+                if self._newest_checkpoints() != self._watched:
+                    self.reload()
+            except Exception as e:
+                print('Reload failed: {}'.format(e))
+
+    def reload(self):
+        """Build a snapshot of the latest checkpoints, then swap it in for new requests"""
+        with self._reload_lock:
+            watched = self._newest_checkpoints()
+            self.snapshot = snapshot.from_checkpoints(self.store)
+            self._watched = watched
+        return self.snapshot.status()
+
+    def query(self, path, params):
+        """Answer of a GET path with params {name: value}, as a json friendly object"""
+        # one snapshot per request, even if a reload swaps another in meanwhile
+        snap = self.snapshot
+        parts = [p for p in path.split('/') if p]
+        if parts == ['status']:
+            return snap.status()
+        if len(parts) == 2 and parts[0] == 'county':
+            record = snap.county(parts[1])
+            if record is None:
+                raise KeyError('No county with fips %s' % parts[1])
+            return record
+        if parts in (['requesters', 'nearest'], ['donors', 'nearest']):
+            table = snap.requesters if parts[0] == 'requesters' else snap.donors
+            lat, lon = self._location(snap, params)
+            rows, km = table.nearest(lat, lon, _int(params, 'k', 10), params.get('need'),
+                _float(params, 'max_km', None))
+            return table.records(rows, km)
+        if parts == ['requesters', 'bbox']:
+            rows = snap.requesters.in_bbox(_float(params, 'south'), _float(params, 'west'),
+                _float(params, 'north'), _float(params, 'east'), _int(params, 'limit', 1000))
+            return snap.requesters.records(rows)
+        raise KeyError('Unknown query %s' % path)
+
+    def _location(self, snap, params):
+        if 'donor' in params:
+            donors = snap.donors.df
+            match = np.nonzero(donors['row'].astype(str).to_numpy() == params['donor'])[0] \
+                if len(donors) else []
+            if not len(match):
+                raise KeyError('No donor %s' % params['donor'])
+            return snap.donors.lats[match[0]], snap.donors.lons[match[0]]
+        return _float(params, 'lat'), _float(params, 'lon')
+
+
+def _float(params, name, default=ValueError):
+    if name not in params:
+        if default is ValueError:
+            raise query_error('Missing parameter %s' % name)
+        return default
+    try:
+        value = float(params[name])
+    except ValueError:
+        raise query_error('Parameter %s is not a number' % name)
+    if not np.isfinite(value):
+        raise query_error('Parameter %s is not a finite number' % name)
+    return value
+
+
+def _int(params, name, default, minimum=1):
+    value = _float(params, name, default)
+    if value is None:
+        return None
+    if value < minimum:
+        raise query_error('Parameter %s must be at least %d' % (name, minimum))
+    return int(value)
+
+
+def handler_for(service):
+    class handler(BaseHTTPRequestHandler):
+        def _send(self, status, body):
+            data = json.dumps(body, separators=(',', ':')).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            try:
+                self._send(200, service.query(url.path, params))
+            except query_error as e:
+                self._send(400, {'error': str(e)})
+            except KeyError as e:
+                self._send(404, {'error': e.args[0]})
+            except Exception as e:
+                self._send(500, {'error': '%s: %s' % (type(e).__name__, e)})
+
+        def do_POST(self):
+            if urlparse(self.path).path.strip('/') != 'reload':
+                self._send(404, {'error': 'Unknown command %s' % self.path})
+                return
+            try:
+                self._send(200, service.reload())
+            except Exception as e:
+                self._send(500, {'error': '%s: %s' % (type(e).__name__, e)})
+
+        def log_message(self, format, *args):
+            pass
+    return handler
+
+
+def serve(host='127.0.0.1', port=8050, store=None, watch_seconds=None):
+    service = query_service(store or checkpoint.default_store, watch_seconds)
+    server = ThreadingHTTPServer((host, port), handler_for(service))
+    print('Serving {} requesters, {} donors and {} counties on http://{}:{}'.format(
+        len(service.snapshot.requesters), len(service.snapshot.donors),
+        len(service.snapshot.counties), host, server.server_port))
+    return service, server
+
+
+if __name__ == '__main__':
+    from create_figures import create_configs
+    config = create_configs(os.path.abspath('config.ini'))
+    checkpoint.configure_from_config(config['checkpoint'])
+    service_config = config['service'] if config.has_section('service') else {}
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--host', default=service_config.get('host', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(service_config.get('port', 8050)))
+    parser.add_argument('--watch-seconds', type=float, default=float(service_config.get('watch_seconds', 60)),
+        help='check for newer checkpoints this often and reload them (0 to only reload on POST /reload)')
+    args = parser.parse_args()
+
+    service, server = serve(args.host, args.port, watch_seconds=args.watch_seconds or None)
+    server.serve_forever()
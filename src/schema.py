@@ -0,0 +1,109 @@
+import numpy as np
+import pandas as pd
+from pandas.api.types import CategoricalDtype
+
+# Fips and zip codes are categoricals: an integer code per row and the zero padded
+# five digit labels of the codes present, sorted. Group by these columns with
+# observed=True so only the codes present become groups.
+CODE_PATTERN = r'^\d{5}$'
+
+# Counts that may be missing before a fillna
+COUNT_DTYPE = 'Int32'
+
+
+class schema_error(ValueError):
+    pass
+
+
+def five_digit_numbers(values):
+    """Integer value of each code as int32, -1 where it is missing or not a 5 digit number"""
+    values = pd.Series(values)
+    if isinstance(values.dtype, CategoricalDtype):
+        values = values.astype(object)
+    numbers = pd.to_numeric(values, errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+    valid = (numbers >= 0) & (numbers < 100000) & (numbers == np.floor(numbers))
+    return np.where(valid, numbers, -1).astype(np.int32)
+
+
+def _is_code_dtype(dtype):
+    return dtype.name == 'category' and dtype.categories.dtype == object and \
+        bool(dtype.categories.str.match(CODE_PATTERN).all())
+
+
+def to_codes(values):
+    """Five digit codes as a categorical from ints, floats or (unpadded) strings, NaN where invalid"""
+    if isinstance(values, pd.Series) and _is_code_dtype(values.dtype):
+        return values
+    index = values.index if isinstance(values, pd.Series) else None
+    numbers = five_digit_numbers(values)
+    present = np.unique(numbers[numbers >= 0])
+    codes = np.where(numbers >= 0, np.searchsorted(present, numbers), -1)
+    return pd.Series(pd.Categorical.from_codes(codes,
+        categories=pd.Index(['%05d' % n for n in present], dtype=object)), index=index)
+
+
+to_fips = to_codes
+to_zip = to_codes
+
+
+def to_count(values):
+    return pd.to_numeric(values, errors='coerce').round().astype(COUNT_DTYPE)
+
+
+def to_category(values):
+    return values if values.dtype.name == 'category' else values.astype('category')
+
+
+def to_float(values):
+    return pd.to_numeric(values, errors='coerce').astype(np.float64)
+
+
+# Converter and expected dtype of each kind of column
+KINDS = {
+    'fips': (to_fips, _is_code_dtype),
+    'zip': (to_zip, _is_code_dtype),
+    'count': (to_count, lambda dtype: dtype == COUNT_DTYPE),
+    'category': (to_category, lambda dtype: dtype.name == 'category'),
+    'float': (to_float, lambda dtype: dtype == np.float64),
+}
+
+_COUNTY_COLUMNS = {'fips': 'fips', 'PPE_requests': 'count'}
+
+# The columns of each frame passed between pipeline stages, and their kinds
+SCHEMAS = {
+    'covid_df': {'fips': 'fips', 'county': 'category', 'state': 'category', 'date': 'category',
+        'cases': 'count', 'deaths': 'count'},
+    'hospital_df': {'fips': 'fips', 'COUNTY': 'category', 'STATE': 'category', 'BEDS': 'count'},
+    'hospital_df_counties': {'fips': 'fips', 'COUNTY': 'category', 'BEDS': 'count'},
+    'zip_fips_df': {'zip': 'zip', 'fips': 'fips', 'county': 'category', 'state': 'category'},
+    'ppe_donors_df': {'zip': 'zip'},
+    'mask_df': {'fips': 'fips', 'county': 'category', 'State': 'category'},
+    'mask_df_counties': {'fips': 'fips', 'county': 'category', 'State': 'category', 'counts': 'count'},
+    'merged_df': dict(_COUNTY_COLUMNS),
+    'merged_covid_ppe_df': dict(_COUNTY_COLUMNS, cases='count', deaths='count'),
+    'merged_covid_ppe_hosp_df': dict(_COUNTY_COLUMNS, cases='count', deaths='count', BEDS='count',
+        Covid_cases_per_bed='float', Covid_cases_per_PPE_requests='float'),
+}
+
+
+def normalize(df, name):
+    """Convert the columns of df listed in SCHEMAS[name] to their dtypes, in place"""
+    for column, kind in SCHEMAS[name].items():
+        if column in df.columns:
+            convert, is_valid = KINDS[kind]
+            if not is_valid(df[column].dtype):
+                df[column] = convert(df[column])
+    return df
+
+
+def validate(df, name):
+    """Raise schema_error if df lacks a column of SCHEMAS[name] or has it with another dtype"""
+    problems = []
+    for column, kind in SCHEMAS[name].items():
+        if column not in df.columns:
+            problems.append('missing column %s' % column)
+        elif not KINDS[kind][1](df[column].dtype):
+            problems.append('%s is %s, not %s' % (column, df[column].dtype, kind))
+    if problems:
+        raise schema_error('%s: %s' % (name, ', '.join(problems)))
+    return df
@@ -0,0 +1,239 @@
+import copy
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from geometry import _feature_polygons, state_of
+from instrument import traced
+
+# Static PNG/SVG county choropleths drawn with matplotlib.
+#
+# The counties are projected once into the vertices and codes of one matplotlib
+# path per county, saved as .npy files. Each worker process memory maps them,
+# builds its figure once, and then only recolors the counties and retitles the
+# figure for every (metric, date) frame it saves.
+
+# Albers equal area conic of the lower 48 states, in degrees
+ALBERS_CENTER = (-96.0, 23.0)
+ALBERS_PARALLELS = (29.5, 45.5)
+
+# Alaska is shrunk to this scale; Alaska, Hawaii and Puerto Rico are moved to the
+# empty corners under the lower 48, as on most national maps
+ALASKA_SCALE = 0.35
+
+# matplotlib path codes
+MOVETO, LINETO, CLOSEPOLY = 1, 2, 79
+
+MISSING_COLOR = '#d9d9d9'
+
+
+def albers(lon, lat, center=ALBERS_CENTER, parallels=ALBERS_PARALLELS):
+    """Albers equal area x, y (in earth radii) of lon, lat arrays in degrees"""
+    lon0, lat0 = np.radians(center)
+    phi1, phi2 = np.radians(parallels)
+    n = (np.sin(phi1) + np.sin(phi2)) / 2
+    c = np.cos(phi1) ** 2 + 2 * n * np.sin(phi1)
+    rho0 = np.sqrt(c - 2 * n * np.sin(lat0)) / n
+    # longitudes relative to the center, so the Aleutians past 180 stay next to Alaska
+    dlon = (np.radians(lon) - lon0 + np.pi) % (2 * np.pi) - np.pi
+    rho = np.sqrt(c - 2 * n * np.sin(np.radians(lat))) / n
+    theta = n * dlon
+    return rho * np.sin(theta), rho0 - rho * np.cos(theta)
+
+
+def _place_insets(vertices, path_state):
+    # Move Alaska (scaled), Hawaii and Puerto Rico under the lower 48, in place
+    insets = {'02', '15', '72'}
+    mainland = ~np.isin(path_state, list(insets))
+    if not mainland.any():
+        return
+    low, high = vertices[mainland].min(axis=0), vertices[mainland].max(axis=0)
+    left = low[0]
+    for state in ['02', '15']:
+        rows = path_state == state
+        if rows.any():
+            points = vertices[rows]
+            if state == '02':
+                points = (points - points.min(axis=0)) * ALASKA_SCALE + points.min(axis=0)
+            vertices[rows] = points - points.min(axis=0) + [left, low[1]]
+            left = vertices[rows][:, 0].max() + 0.02 * (high[0] - low[0])
+    rows = path_state == '72'
+    if rows.any():
+        points = vertices[rows]
+        vertices[rows] = points - [points.max(axis=0)[0], points.min(axis=0)[1]] + [high[0], low[1]]
+
+
+class projected_counties:
+    """County outlines in the map projection, one compound path per county.
+
+    vertices and codes hold every ring of every county in order, each ring
+    a MOVETO, LINETO ... and CLOSEPOLY, and the path of county i is rows
+    path_start[i] to path_start[i + 1].
+    """
+    def __init__(self, ids, vertices, codes, path_start):
+        self.ids = ids
+        self.vertices = vertices
+        self.codes = codes
+        self.path_start = path_start
+
+    @classmethod
+    def from_geojson(cls, counties):
+        ids, rings, path_start = [], [], [0]
+        for feature in counties['features']:
+            feature_rings = [np.asarray(ring, dtype=float)[:, :2] for polygon in
+                _feature_polygons(feature['geometry']) for ring in polygon if len(ring) >= 3]
+            ids.append(str(feature.get('id', '')))
+            rings.extend(feature_rings)
+            path_start.append(path_start[-1] + sum(len(ring) + 1 for ring in feature_rings))
+
+        # each ring is its points and a closing vertex, which CLOSEPOLY ignores
+        sizes = np.array([len(ring) + 1 for ring in rings], dtype=np.int64)
+        points = np.concatenate([np.vstack([ring, ring[:1]]) for ring in rings]) if rings \
+            else np.empty((0, 2))
+        codes = np.full(len(points), LINETO, dtype=np.uint8)
+        ends = np.cumsum(sizes)
+        codes[ends - sizes] = MOVETO
+        codes[ends - 1] = CLOSEPOLY
+
+        vertices = np.column_stack(albers(points[:, 0], points[:, 1]))
+        path_start = np.asarray(path_start, dtype=np.int64)
+        path_state = np.repeat([state_of(i) for i in ids], np.diff(path_start))
+        _place_insets(vertices, path_state)
+        return cls(np.array(ids), vertices.astype(np.float32), codes, path_start)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def paths(self):
+        from matplotlib.path import Path
+        return [Path(self.vertices[start:end], self.codes[start:end])
+            for start, end in zip(self.path_start[:-1], self.path_start[1:])]
+
+    def align(self, locations, z):
+        """z of each county in the order of ids, NaN where the county is not in locations"""
+        z = pd.to_numeric(pd.Series(np.asarray(z, dtype=object)), errors='coerce').to_numpy(dtype=float)
+        # a location may repeat (e.g. a fips joined to two covid rows), its first value is used
+        z = pd.Series(z, index=np.asarray(locations, dtype=object).astype(str)).groupby(level=0).first()
+        return z.reindex(self.ids).to_numpy(dtype=np.float32)
+
+    def save(self, path):
+        tmp_path = path + '.tmp'
+        os.makedirs(tmp_path, exist_ok=True)
+        for name in ['ids', 'vertices', 'codes', 'path_start']:
+            np.save(os.path.join(tmp_path, name + '.npy'), getattr(self, name))
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        # memory mapped, so the workers share the page cache instead of copies
+        return cls(*[np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode)
+            for name in ['ids', 'vertices', 'codes', 'path_start']])
+
+
+def projected_counties_path(counties, cache_dir='.geometry_cache'):
+    """Directory of the projected counties of the geojson, projecting them the first time"""
+    source_hash = hashlib.sha256(json.dumps(counties, sort_keys=True).encode()).hexdigest()[:16]
+    path = os.path.join(cache_dir, 'projected_%s' % source_hash)
+    if not os.path.exists(path):
+        os.makedirs(cache_dir, exist_ok=True)
+        projected_counties.from_geojson(counties).save(path)
+    return path
+
+
+# The figure of this worker process, built once by _start_worker
+_worker = {}
+
+
+def _colormap(colorscale):
+    # matplotlib colormap of a plotly colorscale: a list of colors, or a name
+    from matplotlib.colors import LinearSegmentedColormap
+    import matplotlib.pyplot as plt
+    key = json.dumps(colorscale)
+    if key not in _worker.setdefault('colormaps', {}):
+        if isinstance(colorscale, str):
+            cmap = plt.get_cmap(colorscale if colorscale in plt.colormaps() else colorscale.lower())
+        elif len(colorscale) and not isinstance(colorscale[0], str):
+            cmap = LinearSegmentedColormap.from_list('layer', [tuple(c) for c in colorscale])
+        else:
+            cmap = LinearSegmentedColormap.from_list('layer', list(colorscale))
+        cmap = copy.copy(cmap)
+        cmap.set_bad(MISSING_COLOR)
+        _worker['colormaps'][key] = cmap
+    return _worker['colormaps'][key]
+
+
+def _start_worker(geometry_path, width, height, dpi):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from matplotlib.cm import ScalarMappable
+    from matplotlib.collections import PathCollection
+    from matplotlib.colors import Normalize
+
+    geometry = projected_counties.load(geometry_path)
+    fig, ax = plt.subplots(figsize=(width, height), dpi=dpi)
+    counties = PathCollection(geometry.paths(), edgecolors='white', linewidths=0.1)
+    ax.add_collection(counties)
+    low, high = np.min(geometry.vertices, axis=0), np.max(geometry.vertices, axis=0)
+    ax.set_xlim(low[0], high[0])
+    ax.set_ylim(low[1], high[1])
+    ax.set_aspect('equal')
+    ax.set_axis_off()
+    mappable = ScalarMappable(Normalize(0, 1), _colormap('Viridis'))
+    colorbar = fig.colorbar(mappable, ax=ax, shrink=0.6)
+    title = ax.set_title('', fontsize=10)
+    fig.tight_layout()
+    _worker.update(fig=fig, counties=counties, mappable=mappable, colorbar=colorbar, title=title)
+
+
+def _render(frames):
+    counties, mappable = _worker['counties'], _worker['mappable']
+    for frame in frames:
+        mappable.set_cmap(_colormap(frame['colorscale']))
+        mappable.set_clim(frame['zmin'], frame['zmax'])
+        counties.set_facecolor(mappable.to_rgba(np.ma.masked_invalid(frame['z'])))
+        _worker['colorbar'].set_label(frame['colorbar_title'])
+        _worker['title'].set_text(frame['title'])
+        _worker['fig'].savefig(frame['filename'])
+    return [frame['filename'] for frame in frames]
+
+
+@traced
+def render_static_maps(counties, frames, output_dir, processes=None, frames_per_task=4,
+                       width=10, height=6.5, dpi=120, cache_dir='.geometry_cache'):
+    """Save one image of the county geojson per frame, in a pool of processes.
+
+    frames are dicts with filename (its extension picks png, svg or pdf),
+    locations, z, colorscale, zmin, zmax, title and colorbar_title, as the
+    layers of choropleth_mapbox_layers_plot. Counties not in locations are
+    drawn gray. Returns the paths of the images.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    tmp_dir = None if cache_dir else tempfile.mkdtemp()
+    try:
+        geometry_path = projected_counties_path(counties, cache_dir or tmp_dir)
+        geometry = projected_counties.load(geometry_path)
+        tasks = [dict(filename=os.path.join(output_dir, frame['filename']),
+            z=geometry.align(frame['locations'], frame['z']), colorscale=frame['colorscale'],
+            zmin=frame['zmin'], zmax=frame['zmax'], title=frame['title'],
+            colorbar_title=frame['colorbar_title']) for frame in frames]
+        chunks = [tasks[i:i + frames_per_task] for i in range(0, len(tasks), frames_per_task)]
+        worker_args = (geometry_path, width, height, dpi)
+
+        if processes == 1 or len(chunks) <= 1:
+            _start_worker(*worker_args)
+            return [path for chunk in chunks for path in _render(chunk)]
+        # spawn, as the pipeline does, so workers do not inherit locks of other threads
+        with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_start_worker, initargs=worker_args) as pool:
+            return [path for chunk in pool.map(_render, chunks) for path in chunk]
+    finally:
+        if tmp_dir:
+            shutil.rmtree(tmp_dir)
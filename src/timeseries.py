@@ -0,0 +1,175 @@
+import os
+import numpy as np
+import pandas as pd
+from data_download import NYTIMES_DTYPES, fix_nytimes_fips
+
+# Cumulative counts fit in 32 bits, and halve the size of the cube
+COUNT_DTYPE = np.int32
+
+
+def _forward_fill(values, reported):
+    # Carry each county's last reported cumulative count over the days it is missing
+    days = np.arange(values.shape[1])
+    last = np.maximum.accumulate(np.where(reported, days, -1), axis=1)
+    filled = np.take_along_axis(values, np.maximum(last, 0), axis=1)
+    filled[last < 0] = 0
+    return filled
+
+
+class county_cube:
+    """Cumulative covid cases and deaths as dense (fips, date) arrays.
+
+    Rows follow the fips index and columns one day each from start to end, so
+    a day, a date range, daily deltas or rolling windows are plain numpy
+    slices of the cube instead of a new data frame per date.
+    """
+    def __init__(self, fips, dates, cases, deaths):
+        # plain strings, so categorical fips columns can be passed in
+        self.fips = pd.Index(np.asarray(fips, dtype=object), name='fips')
+        self.dates = pd.DatetimeIndex(dates, name='date')
+        self.cases = np.asarray(cases, dtype=COUNT_DTYPE)
+        self.deaths = np.asarray(deaths, dtype=COUNT_DTYPE)
+
+    @property
+    def start(self):
+        return self.dates[0] if len(self.dates) else None
+
+    @property
+    def end(self):
+        return self.dates[-1] if len(self.dates) else None
+
+    def __len__(self):
+        return len(self.dates)
+
+    def on(self, date):
+        """Cases and deaths of every county on date, like download_nytimes_data's frame"""
+        day = self.dates.get_loc(pd.Timestamp(date))
+        return pd.DataFrame({'fips': self.fips, 'date': self.dates[day].strftime('%Y-%m-%d'),
+            'cases': self.cases[:, day], 'deaths': self.deaths[:, day]})
+
+    def window(self, start=None, end=None):
+        """The cube for the days from start to end, both included"""
+        first = 0 if start is None else self.dates.searchsorted(pd.Timestamp(start))
+        last = len(self.dates) if end is None else self.dates.searchsorted(pd.Timestamp(end), 'right')
+        return county_cube(self.fips, self.dates[first:last],
+            self.cases[:, first:last], self.deaths[:, first:last])
+
+    def reindex(self, fips):
+        """The cube with rows in the order of fips (e.g. merged_df['fips']), zeros where missing"""
+        rows = self.fips.get_indexer(pd.Index(fips))
+        cases = np.zeros((len(rows), len(self.dates)), dtype=COUNT_DTYPE)
+        deaths = np.zeros_like(cases)
+        found = rows >= 0
+        cases[found] = self.cases[rows[found]]
+        deaths[found] = self.deaths[rows[found]]
+        return county_cube(fips, self.dates, cases, deaths)
+
+    def daily(self, values='cases'):
+        """New counts per day; the first day counts everything reported up to it"""
+        cumulative = getattr(self, values)
+        return np.diff(cumulative, axis=1, prepend=np.zeros((len(self.fips), 1), dtype=COUNT_DTYPE))
+
+    def rolling_mean(self, values='cases', window=7):
+        """Mean of the daily new counts over the last window days (fewer at the start)"""
+        totals = np.cumsum(self.daily(values), axis=1, dtype=np.int64)
+        shifted = np.zeros_like(totals)
+        shifted[:, window:] = totals[:, :-window]
+        counts = np.minimum(np.arange(1, len(self.dates) + 1), window)
+        return ((totals - shifted) / counts).astype(np.float32)
+
+    def append(self, rows):
+        """Add the days after end from NYTimes style rows (date, fips, cases, deaths).
+
+        Counties not in the fips index are added as new rows.
+        """
+        rows = rows[pd.to_datetime(rows['date']).values > np.datetime64(self.end)] \
+            if len(self.dates) else rows
+        if len(rows) == 0:
+            return self
+        fips = self.fips.append(pd.Index(rows['fips'].astype(str).unique()).difference(self.fips))
+        grown = self.reindex(fips)
+        new = _cube_from_rows(rows, fips, start=None if self.end is None
+            else self.end + pd.Timedelta(days=1), previous=(grown.cases, grown.deaths))
+        self.fips = fips
+        self.dates = self.dates.append(new.dates)
+        self.cases = np.concatenate([grown.cases, new.cases], axis=1)
+        self.deaths = np.concatenate([grown.deaths, new.deaths], axis=1)
+        return self
+
+    def save(self, path):
+        tmp_path = path + '.tmp.npz'
+        np.savez_compressed(tmp_path, fips=self.fips.values.astype(str),
+            dates=self.dates.values.astype('datetime64[D]'), cases=self.cases, deaths=self.deaths)
+        os.replace(tmp_path, path)
+
+
+def _cube_from_rows(rows, fips, start=None, previous=None):
+    # Dense cube of the rows' days, summing duplicate (fips, date) rows
+    dates = pd.to_datetime(rows['date'])
+    start = dates.min() if start is None else start
+    days = pd.date_range(start, dates.max(), freq='D')
+    row = fips.get_indexer(rows['fips'].astype(str))
+    col = days.get_indexer(dates)
+    keep = (row >= 0) & (col >= 0)
+    row, col = row[keep], col[keep]
+
+    shape = (len(fips), len(days))
+    cases = np.zeros(shape, dtype=np.int64)
+    deaths = np.zeros(shape, dtype=np.int64)
+    np.add.at(cases, (row, col), rows['cases'].values[keep].astype(np.int64))
+    np.add.at(deaths, (row, col), rows['deaths'].values[keep].astype(np.int64))
+    reported = np.zeros(shape, dtype=bool)
+    reported[row, col] = True
+
+    if previous is not None and previous[0].shape[1]:
+        # start from the last day of the existing cube
+        cases = np.concatenate([previous[0][:, -1:], cases], axis=1)
+        deaths = np.concatenate([previous[1][:, -1:], deaths], axis=1)
+        reported = np.concatenate([np.ones((len(fips), 1), dtype=bool), reported], axis=1)
+        return county_cube(fips, days,
+            _forward_fill(cases, reported)[:, 1:], _forward_fill(deaths, reported)[:, 1:])
+    return county_cube(fips, days, _forward_fill(cases, reported), _forward_fill(deaths, reported))
+
+
+def read_nytimes_rows(filepath_or_buffer, after=None, chunksize=200000):
+    """The NYTimes county history rows with fixed fips, only those after the date after if given"""
+    chunks = []
+    for chunk in pd.read_csv(filepath_or_buffer, usecols=list(NYTIMES_DTYPES),
+                             dtype=NYTIMES_DTYPES, chunksize=chunksize):
+        # The history is sorted by date, so skip the chunks we already have
+        if after is not None:
+            if chunk['date'].iloc[-1] <= after:
+                continue
+            chunk = chunk.loc[chunk['date'].values > after]
+        chunks.append(fix_nytimes_fips(chunk.copy()))
+    if not chunks:
+        return pd.DataFrame(columns=list(NYTIMES_DTYPES))
+    return pd.concat(chunks, ignore_index=True)
+
+
+def build_county_cube(filepath_or_buffer, fips=None, chunksize=200000):
+    """Cube of the full NYTimes county history, rows in the order of fips if given"""
+    rows = read_nytimes_rows(filepath_or_buffer, chunksize=chunksize)
+    if fips is None:
+        fips = pd.Index(np.sort(rows['fips'].astype(str).unique()))
+    return _cube_from_rows(rows, pd.Index(fips))
+
+
+def load_county_cube(path):
+    with np.load(path) as data:
+        return county_cube(data['fips'], data['dates'], data['cases'], data['deaths'])
+
+
+def update_county_cube(filepath_or_buffer, cube_path='covid_cube.npz', chunksize=200000):
+    """Load the cube saved at cube_path and append the days it is missing, or build it"""
+    if cube_path and os.path.exists(cube_path):
+        cube = load_county_cube(cube_path)
+        rows = read_nytimes_rows(filepath_or_buffer,
+            after=cube.end.strftime('%Y-%m-%d'), chunksize=chunksize)
+        print ('Adding {} days to the covid cube.'.format(rows['date'].nunique()))
+        cube.append(rows)
+    else:
+        cube = build_county_cube(filepath_or_buffer, chunksize=chunksize)
+    if cube_path:
+        cube.save(cube_path)
+    return cube
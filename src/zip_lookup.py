@@ -0,0 +1,158 @@
+"""Offline zip code lookup: fips, state, county, lat and lon per 5 digit zip code.
+
+The table is compiled from the zip to fips sheet and the GeoNames US postal
+codes into zip_table.npz (about 1 MB). Rebuild it with:
+
+    python zip_lookup.py --output zip_table.npz
+"""
+import argparse
+import io
+import os
+import zipfile
+import numpy as np
+import pandas as pd
+from download_cache import cached_get
+from schema import five_digit_numbers, to_fips
+
+# Every 5 digit zip code is a position in the arrays of a zip_lookup_table
+ZIP_CODES = 100000
+
+# Where the table is saved, and the GeoNames US postal codes it takes the coordinates from
+ZIP_TABLE_PATH = 'zip_table.npz'
+ZIP_LAT_LON_URL = 'https://download.geonames.org/export/zip/US.zip'
+
+# Tab separated GeoNames postal code columns
+GEONAMES_COLUMNS = ['country', 'zip', 'place', 'state_name', 'state', 'county_name', 'county_code',
+    'community_name', 'community_code', 'lat', 'lon', 'accuracy']
+
+
+class zip_lookup_table:
+    """zip code -> fips, state, county, lat and lon as dense arrays indexed by the zip code.
+
+    States and counties are stored as codes into the states and counties name
+    lists, so looking up a whole column is one array gather per field, without
+    a join. Zip codes that are not in the table give -1 / NaN.
+    """
+    def __init__(self, fips, state, county, lat, lon, states, counties):
+        self.fips = np.asarray(fips, dtype=np.int32)
+        self.state = np.asarray(state, dtype=np.int16)
+        self.county = np.asarray(county, dtype=np.int32)
+        self.lat = np.asarray(lat, dtype=np.float32)
+        self.lon = np.asarray(lon, dtype=np.float32)
+        self.states = pd.Index(states, dtype=object)
+        self.counties = pd.Index(counties, dtype=object)
+
+    @classmethod
+    def from_frames(cls, zip_fips_df, zip_lat_lon_df=None):
+        """Table of the zip to fips sheet, with the coordinates of zip_lat_lon_df (zip, lat, lon).
+
+        Zip codes in several counties keep the first county of the sheet.
+        """
+        zips = five_digit_numbers(zip_fips_df['zip'])
+        first = pd.Series(zips).drop_duplicates().index.values
+        first = first[zips[first] >= 0]
+        zips = zips[first]
+
+        fips = np.full(ZIP_CODES, -1, dtype=np.int32)
+        fips[zips] = five_digit_numbers(zip_fips_df['fips'])[first]
+        state_codes, states = pd.factorize(pd.Series(zip_fips_df['state'], dtype=object).values[first])
+        state = np.full(ZIP_CODES, -1, dtype=np.int16)
+        state[zips] = state_codes
+        county_codes, counties = pd.factorize(pd.Series(zip_fips_df['county'], dtype=object).values[first])
+        county = np.full(ZIP_CODES, -1, dtype=np.int32)
+        county[zips] = county_codes
+
+        lat = np.full(ZIP_CODES, np.nan, dtype=np.float32)
+        lon = np.full(ZIP_CODES, np.nan, dtype=np.float32)
+        if zip_lat_lon_df is not None:
+            located = five_digit_numbers(zip_lat_lon_df['zip'])
+            found = located >= 0
+            lat[located[found]] = pd.to_numeric(zip_lat_lon_df['lat'], errors='coerce').values[found]
+            lon[located[found]] = pd.to_numeric(zip_lat_lon_df['lon'], errors='coerce').values[found]
+        return cls(fips, state, county, lat, lon, states, counties)
+
+    def lookup(self, zips):
+        """fips, state, county, lat and lon of a column of zip codes, indexed like it"""
+        index = zips.index if isinstance(zips, pd.Series) else None
+        position = five_digit_numbers(zips)
+        known = position >= 0
+        position = np.where(known, position, 0)
+
+        def gather(values, missing):
+            return np.where(known, values[position], missing)
+        fips = gather(self.fips, -1)
+        return pd.DataFrame({
+            'fips': to_fips(pd.Series(np.where(fips >= 0, fips, np.nan), index=index)),
+            'state': pd.Categorical.from_codes(gather(self.state, -1), categories=self.states),
+            'county': pd.Categorical.from_codes(gather(self.county, -1), categories=self.counties),
+            # stored as float32, 5 decimals are about a meter
+            'lat': gather(self.lat, np.nan).astype(np.float64).round(5),
+            'lon': gather(self.lon, np.nan).astype(np.float64).round(5),
+        }, index=index)
+
+    def save(self, path):
+        tmp_path = path + '.tmp.npz'
+        np.savez_compressed(tmp_path, fips=self.fips, state=self.state, county=self.county,
+            lat=self.lat, lon=self.lon, states=self.states.values.astype(str),
+            counties=self.counties.values.astype(str))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['fips'], data['state'], data['county'], data['lat'], data['lon'],
+                data['states'], data['counties'])
+
+
+def read_geonames_zips(data):
+    """zip, lat and lon of a GeoNames postal code download (a zip archive or its text file)"""
+    if data[:2] == b'PK':
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            name = [n for n in archive.namelist() if n.endswith('.txt') and 'readme' not in n.lower()][0]
+            data = archive.read(name)
+    return pd.read_csv(io.BytesIO(data), sep='\t', header=None, names=GEONAMES_COLUMNS,
+        usecols=['zip', 'lat', 'lon'], dtype={'zip': str})
+
+
+def build_zip_lookup_table(zip_fips_df, zip_lat_lon_url, path=None):
+    """Compile the zip to fips sheet and the GeoNames coordinates into a table, saved to path if given"""
+    zip_lat_lon_df = read_geonames_zips(cached_get(zip_lat_lon_url, source='zip_lat_lon')) \
+        if zip_lat_lon_url else None
+    table = zip_lookup_table.from_frames(zip_fips_df, zip_lat_lon_df)
+    if path:
+        table.save(path)
+    return table
+
+
+def load_zip_lookup_table(path, zip_fips_df=None, zip_lat_lon_url=None, rebuild=False):
+    """The table saved at path, or built from the sheet (zip_fips_df or a function returning it)"""
+    if path and os.path.exists(path) and not rebuild:
+        return zip_lookup_table.load(path)
+    if zip_fips_df is None:
+        raise ValueError('No zip lookup table at %s, and no zip to fips data to build it from' % path)
+    print ('Building the zip lookup table {}'.format(path))
+    try:
+        if callable(zip_fips_df):
+            zip_fips_df = zip_fips_df()
+        return build_zip_lookup_table(zip_fips_df, zip_lat_lon_url, path)
+    except IOError as e:
+        # requests and urllib errors are IOErrors too
+        raise IOError('No zip lookup table at %s, and the zip to fips sheet or the GeoNames postal codes '
+            'to build it could not be downloaded (%s). Build it once with network access: '
+            'python zip_lookup.py --output %s' % (path, e, path)) from e
+
+
+if __name__ == '__main__':
+    from data_download import download_zip_to_fips_data
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--output', default=ZIP_TABLE_PATH)
+    parser.add_argument('--zip-to-fips-url', help='zip to fips sheet, as csv (default: the GetUsPPE sheet)')
+    parser.add_argument('--lat-lon-url', default=ZIP_LAT_LON_URL,
+        help='GeoNames postal codes of the US, zipped or as text')
+    args = parser.parse_args()
+
+    zip_fips_df = download_zip_to_fips_data(args.zip_to_fips_url) if args.zip_to_fips_url \
+        else download_zip_to_fips_data()
+    table = build_zip_lookup_table(zip_fips_df, args.lat_lon_url, args.output)
+    print ('{} zip codes, {} with coordinates, written to {}'.format(
+        (table.fips >= 0).sum(), np.isfinite(table.lat[table.fips >= 0]).sum(), args.output))
@@ -0,0 +1,77 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from checkpoint import checkpoint_store, frame_hash
+from schema import to_fips
+
+
+def county_frame():
+    df = pd.DataFrame({
+        'geometry': [{'type': 'Polygon', 'coordinates': [[[i, 0], [i, 1], [i + 1, 0], [i, 0]]]} for i in range(4)],
+        'fips': ['01001', '06037', '36061', '72001'],
+        'county': ['Autauga', 'Los Angeles', 'New York', 'Adjuntas'],
+        'PPE_requests': [1, 0, 12, 3],
+        'ratio': [0.5, np.nan, 2.0, 1.25],
+    })
+    df['fips'] = to_fips(df['fips'])
+    df['PPE_requests'] = df['PPE_requests'].astype('Int32')
+    df['county'] = df['county'].astype('category')
+    return df
+
+
+def test_round_trip_keeps_dtypes_and_serializes_geometry(tmp_path):
+    store = checkpoint_store(str(tmp_path))
+    df = county_frame()
+    path = store.write('merged_covid_ppe_hosp_df', df)
+
+    read = store.read(path, verify=True)
+    assert list(read.columns) == list(df.columns)
+    assert read['fips'].dtype.name == 'category'
+    assert read['fips'].tolist() == ['01001', '06037', '36061', '72001']
+    assert str(read['PPE_requests'].dtype) == 'Int32'
+    assert read['county'].tolist() == df['county'].tolist()
+    np.testing.assert_array_equal(read['ratio'].to_numpy(), df['ratio'].to_numpy())
+    # the geometry comes back as its json text
+    assert [json.loads(g) for g in read['geometry']] == df['geometry'].tolist()
+
+
+def test_frame_hash_handles_geometry_and_detects_changes():
+    df = county_frame()
+    assert frame_hash(df) == frame_hash(df.copy())
+    changed = df.copy()
+    changed.loc[2, 'PPE_requests'] = 13
+    assert frame_hash(changed) != frame_hash(df)
+
+
+def test_latest_skips_a_corrupt_checkpoint(tmp_path):
+    store = checkpoint_store(str(tmp_path))
+    store.write('merged_df', county_frame())
+    assert len(store.latest('merged_df')) == 4
+
+    with open(store.checkpoints('merged_df')[0], 'wb') as f:
+        f.write(b'not a feather file')
+    assert store.latest('merged_df') is None
+
+
+def test_keep_prunes_older_checkpoints(tmp_path):
+    store = checkpoint_store(str(tmp_path), keep=2)
+    for day in ['20200420', '20200421', '20200422']:
+        os.replace(store.write('covid_df', county_frame()), store.path('covid_df', day))
+    store._prune('covid_df')
+    assert store.checkpoints('covid_df') == [store.path('covid_df', '20200422'),
+        store.path('covid_df', '20200421')]
+
+
+def test_write_out_csv_is_write_out_checkpoint(tmp_path, monkeypatch):
+    import checkpoint
+    from data_process import requests_per_county
+    store = checkpoint_store(str(tmp_path))
+    monkeypatch.setattr(checkpoint, 'default_store', store)
+    mask_df = county_frame().assign(State='CA')
+
+    requests_per_county(mask_df, write_out_csv=False)
+    assert store.checkpoints('findthemasks_data_processed') == []
+    requests_per_county(mask_df, write_out_csv=True)
+    assert len(store.checkpoints('findthemasks_data_processed')) == 1
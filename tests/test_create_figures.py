@@ -0,0 +1,19 @@
+import numpy as np
+import pandas as pd
+from create_figures import animation_window
+from timeseries import county_cube
+
+
+def test_animation_window_averages_over_the_days_before_it():
+    # 10 new cases a day on top of 1200 reported before the cube starts
+    dates = pd.date_range('2020-04-01', '2020-04-22')
+    cases = 1200 + 10 * np.arange(1, len(dates) + 1)
+    cube = county_cube(['36061'], dates, cases[None, :], np.zeros((1, len(dates))))
+
+    window, new_cases = animation_window(cube, pd.Series(['36061', '01001']), '2020-04-22', 5)
+    assert list(window.dates) == list(pd.date_range('2020-04-18', '2020-04-22'))
+    assert window.cases[0].tolist() == cases[-5:].tolist()
+    np.testing.assert_allclose(new_cases[0], 10)
+    # counties without data are zeros
+    assert window.cases[1].tolist() == [0] * 5
+    np.testing.assert_allclose(new_cases[1], 0)
@@ -0,0 +1,37 @@
+import pandas as pd
+import pytest
+import data_download
+from zip_lookup import zip_lookup_table
+
+ZIP_FIPS_DF = pd.DataFrame({
+    'zip': ['10001', '90012', '00501'],
+    'fips': ['36061', '06037', '36103'],
+    'county': ['New York', 'Los Angeles', 'Suffolk'],
+    'state': ['NY', 'CA', 'NY'],
+})
+IDEO_CSV = b'zip,institution,need\n10001,Clinic A,N95\n00501,Clinic B,Gowns\n99999,Clinic C,Gloves\n'
+
+
+@pytest.fixture
+def ideo_download(monkeypatch):
+    monkeypatch.setattr(data_download, 'cached_get', lambda url, source=None: IDEO_CSV)
+
+
+def check_ideo_df(ideo_df):
+    # the zip code missing from the table has no fips and is dropped
+    assert ideo_df['institution'].tolist() == ['Clinic A', 'Clinic B']
+    assert ideo_df['fips'].astype(str).tolist() == ['36061', '36103']
+    assert ideo_df['zip'].astype(str).tolist() == ['10001', '00501']
+
+
+def test_download_ideo_merged_data_loads_the_saved_zip_table(ideo_download, tmp_path, monkeypatch):
+    path = str(tmp_path / 'zip_table.npz')
+    zip_lookup_table.from_frames(ZIP_FIPS_DF).save(path)
+    monkeypatch.setattr(data_download, 'ZIP_TABLE_PATH', path)
+    check_ideo_df(data_download.download_ideo_merged_data('http://ideo.local/ideo.csv',
+        write_out_checkpoint=False))
+
+
+def test_download_ideo_merged_data_takes_a_zip_to_fips_frame(ideo_download):
+    check_ideo_df(data_download.download_ideo_merged_data('http://ideo.local/ideo.csv', ZIP_FIPS_DF,
+        write_out_csv=False))
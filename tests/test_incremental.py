@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+import pytest
+import us
+from incremental import county_state_store, compute_county_frames, update_county_frames
+from schema import to_fips, normalize, validate
+
+FIPS = ['01001', '06037', '29095', '36061', '48201', '72001']
+
+
+def merged(requests, fips=FIPS):
+    df = pd.DataFrame({
+        'geometry': [{'type': 'Polygon', 'coordinates': [[[i, 0], [i, 1], [i + 1, 0], [i, 0]]]}
+            for i in range(len(fips))],
+        'fips': fips,
+        'GEO_ID': 'x',
+        'STATE': [us.states.lookup(f[:2]) for f in fips],
+        'county': ['county %d' % i for i in range(len(fips))],
+        'CENSUSAREA': 1.0,
+        'PPE_requests': requests,
+        'all_ppe_requests': '',
+    })
+    df['fips'] = to_fips(df['fips'])
+    return normalize(df, 'merged_df')
+
+
+def covid(cases, fips=FIPS):
+    df = pd.DataFrame({'fips': fips, 'cases': cases, 'deaths': [c // 10 for c in cases], 'date': '2020-04-22'})
+    df['fips'] = to_fips(df['fips'])
+    return df
+
+
+def hospital(beds, fips=FIPS):
+    df = pd.DataFrame({'fips': fips, 'COUNTY': 'C', 'BEDS': beds})
+    df['fips'] = to_fips(df['fips'])
+    return df
+
+
+def canonical(df):
+    # the rows in a fixed order, as ties in Covid_cases_per_bed may come in any order
+    df = df.assign(geometry=df['geometry'].map(repr)).reset_index()
+    return df.sort_values(['index', 'cases', 'geometry'], kind='mergesort').reset_index(drop=True)
+
+
+def check(store, merged_df, covid_df, hospital_df):
+    full = compute_county_frames(merged_df.copy(), covid_df, hospital_df)
+    results = update_county_frames(merged_df, covid_df, hospital_df, store)
+    validate(results, 'merged_covid_ppe_hosp_df')
+    pd.testing.assert_frame_equal(canonical(full), canonical(results))
+    return results
+
+
+def recomputed(capsys):
+    return capsys.readouterr().out.strip().splitlines()[-1]
+
+
+def test_recomputes_only_changed_counties(tmp_path, capsys):
+    path = str(tmp_path / 'county_state.pkl')
+    requests = [1.0, 0.0, 3.0, 12.0, 2.0, 0.0]
+    cases = [10, 500, 40, 2000, 300, 5]
+    beds = [20, 900, 30, 1500, 700, 10]
+
+    check(county_state_store(path), merged(requests), covid(cases), hospital(beds))
+    assert recomputed(capsys) == 'Recomputing 6 of 6 counties.'
+
+    # unchanged inputs reuse every county from the stored state
+    check(county_state_store(path), merged(requests), covid(cases), hospital(beds))
+    assert recomputed(capsys) == 'Recomputing 0 of 6 counties.'
+
+    # new cases in one county and new requests in another
+    cases[1] += 25
+    requests[4] = 5.0
+    results = check(county_state_store(path), merged(requests), covid(cases), hospital(beds))
+    assert recomputed(capsys) == 'Recomputing 2 of 6 counties.'
+    row = results[results['fips'] == '06037'].iloc[0]
+    assert row['cases'] == 525
+    assert row['Covid_cases_per_bed'] == pytest.approx(525 / 900)
+
+
+def test_counties_without_covid_or_hospital_rows(tmp_path):
+    path = str(tmp_path / 'county_state.pkl')
+    merged_df = merged([1.0, 0.0, 3.0, 12.0, 2.0, 0.0])
+    # the left joins keep every county, with no cases or beds
+    results = check(county_state_store(path), merged_df,
+        covid([10, 500, 40], FIPS[:3]), hospital([900, 30, 1500], FIPS[1:4]))
+    assert len(results) == len(FIPS)
+    assert results.loc[results['fips'] == '36061', 'cases'].tolist() == [0]
+    # a county gaining its covid row is recomputed on the next run
+    results = check(county_state_store(path), merged_df,
+        covid([10, 500, 40, 2000], FIPS[:4]), hospital([900, 30, 1500], FIPS[1:4]))
+    assert results.loc[results['fips'] == '36061', 'cases'].tolist() == [2000]
+
+
+def test_repeated_fips(tmp_path, capsys):
+    # the county geojson and the NYTimes Kansas City fixup can both repeat a fips (29095)
+    path = str(tmp_path / 'county_state.pkl')
+    fips = FIPS + ['29095']
+    merged_df = merged([1.0, 0.0, 3.0, 12.0, 2.0, 0.0, 4.0], fips)
+    covid_df = covid([10, 500, 40, 2000, 300, 5, 60], fips)
+    hospital_df = hospital([20, 900, 30, 1500, 700, 10])
+
+    results = check(county_state_store(path), merged_df, covid_df, hospital_df)
+    # each of the two merged rows of 29095 joins each of its two covid rows
+    assert (results['fips'] == '29095').sum() == 4
+    results = check(county_state_store(path), merged_df, covid_df, hospital_df)
+    assert recomputed(capsys) == 'Recomputing 0 of 6 counties.'
+    assert (results['fips'] == '29095').sum() == 4
@@ -0,0 +1,60 @@
+import io
+import json
+import pytest
+import json_stream
+from json_stream import iter_items
+
+DOCUMENTS = [
+    {'values': [['Timestamp', 'Lat', 'Lng'], ['2020-04-01', '39.76', '-86.15'], [], ['short']]},
+    {'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature', 'id': '01001', 'properties': {'NAME': 'Autauga', 'CENSUSAREA': 594.436},
+            'geometry': {'type': 'Polygon', 'coordinates': [[[-86.49, 32.48], [-86.71, 32.40], [-86.49, 32.48]]]}},
+        {'type': 'Feature', 'id': '72001', 'properties': {'NAME': 'Adjuntas á 中 \U0001f600', 'LSAD': None},
+            'geometry': None}]},
+    {'values': [1, -2.5e-3, 123456789012345678, True, False, None, 'a "quoted" \\ \n string', {}, []]},
+    {'values': []},
+    {'before': {'values': [1, 2]}, 'values': [[1, [2, [3]]]], 'after': [4]},
+]
+
+
+@pytest.fixture(params=['ijson', 'scanner'])
+def parser(request, monkeypatch):
+    if request.param == 'ijson':
+        pytest.importorskip('ijson')
+    else:
+        monkeypatch.setattr(json_stream, 'ijson', None)
+
+
+def key_of(document):
+    return 'features' if 'features' in document else 'values'
+
+
+@pytest.mark.parametrize('document', DOCUMENTS)
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 1024 * 1024])
+def test_items_match_json_load(parser, document, chunk_size):
+    for text in [json.dumps(document), json.dumps(document, indent=2, ensure_ascii=False)]:
+        data = text.encode()
+        key = key_of(document)
+        items = list(iter_items(io.BytesIO(data), key, chunk_size=chunk_size))
+        assert items == json.load(io.BytesIO(data))[key]
+
+
+def test_byte_order_mark_and_missing_key(parser):
+    data = b'\xef\xbb\xbf' + json.dumps({'other': [1], 'values': [[1, 2]]}).encode()
+    assert list(iter_items(io.BytesIO(data), 'values', chunk_size=3)) == [[1, 2]]
+    assert list(iter_items(io.BytesIO(b'{"other": [1]}'), 'values')) == []
+    assert list(iter_items(io.BytesIO(b'{}'), 'values')) == []
+
+
+def test_stops_after_the_array(monkeypatch):
+    monkeypatch.setattr(json_stream, 'ijson', None)
+    # what follows the array is not read, so it may be anything
+    data = b'{"values": [1, 2, 3], "rest": not json'
+    assert list(iter_items(io.BytesIO(data), 'values', chunk_size=4)) == [1, 2, 3]
+
+
+@pytest.mark.parametrize('data', [b'{"values": [1, 2', b'{"values": [1 2]}', b'{"values": [1, tru]}', b'[1]'])
+def test_invalid_json(monkeypatch, data):
+    monkeypatch.setattr(json_stream, 'ijson', None)
+    with pytest.raises(ValueError):
+        list(iter_items(io.BytesIO(data), 'values', chunk_size=3))
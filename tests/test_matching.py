@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+from scipy.optimize import linear_sum_assignment
+from math_custom import haversine
+from matching import candidate_graph, match_requesters
+
+MAX_KM = 300
+
+
+def positions(n, seed):
+    rng = np.random.RandomState(seed)
+    return rng.uniform(38, 42, n), rng.uniform(-78, -72, n)
+
+
+def best_total(requester_lat, requester_lon, donor_lat, donor_lon, capacity, hazard):
+    # the optimal assignment over every donor within MAX_KM, each donor as capacity slots
+    km = haversine(requester_lat[:, None], requester_lon[:, None], donor_lat[None, :], donor_lon[None, :])
+    value = 1 + hazard[:, None] / hazard.max() - km / MAX_KM
+    value[km > MAX_KM] = -1e9
+    slots = np.repeat(value, capacity, axis=1)
+    # a column per requester for going unmatched, worth 0
+    unmatched = np.full((len(value), len(value)), -1e9)
+    np.fill_diagonal(unmatched, 0)
+    rows, columns = linear_sum_assignment(np.hstack([slots, unmatched]), maximize=True)
+    return np.hstack([slots, unmatched])[rows, columns].sum()
+
+
+def total(match, km, hazard):
+    matched = match >= 0
+    return (1 + hazard[matched] / hazard.max() - km[matched] / MAX_KM).sum()
+
+
+def check_valid(match, km, requester_lat, requester_lon, donor_lat, donor_lon, capacity):
+    matched = match >= 0
+    assert (np.bincount(match[matched], minlength=len(donor_lat)) <= capacity).all()
+    np.testing.assert_allclose(km[matched], haversine(requester_lat[matched], requester_lon[matched],
+        donor_lat[match[matched]], donor_lon[match[matched]]))
+    assert (km[matched] <= MAX_KM).all()
+    assert np.isinf(km[~matched]).all()
+
+
+def test_candidate_graph_matches_brute_force():
+    requester_lat, requester_lon = positions(40, 0)
+    donor_lat, donor_lon = positions(25, 1)
+    donor, km = candidate_graph(requester_lat, requester_lon, donor_lat, donor_lon, k=5, max_km=MAX_KM)
+    all_km = haversine(requester_lat[:, None], requester_lon[:, None], donor_lat[None, :], donor_lon[None, :])
+    for i in range(len(requester_lat)):
+        nearest = np.argsort(all_km[i])[:5]
+        nearest = nearest[all_km[i, nearest] <= MAX_KM]
+        assert donor[i, :len(nearest)].tolist() == nearest.tolist()
+        assert (donor[i, len(nearest):] == -1).all()
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_auction_is_within_its_tolerance_of_the_best_assignment(seed):
+    requester_lat, requester_lon = positions(30, seed)
+    donor_lat, donor_lon = positions(8, seed + 10)
+    capacity = np.random.RandomState(seed).randint(1, 4, len(donor_lat))
+    hazard = np.random.RandomState(seed + 20).uniform(0, 5, len(requester_lat))
+
+    match, km = match_requesters(requester_lat, requester_lon, donor_lat, donor_lon, capacity, hazard,
+        k=len(donor_lat), max_km=MAX_KM, tolerance_km=0.5)
+    check_valid(match, km, requester_lat, requester_lon, donor_lat, donor_lon, capacity)
+    best = best_total(requester_lat, requester_lon, donor_lat, donor_lon, capacity, hazard)
+    assert total(match, km, hazard) >= best - len(requester_lat) * 0.5 / MAX_KM - 1e-9
+
+    # greedy gives a valid, if rougher, assignment
+    match, km = match_requesters(requester_lat, requester_lon, donor_lat, donor_lon, capacity, hazard,
+        k=len(donor_lat), max_km=MAX_KM, method='greedy')
+    check_valid(match, km, requester_lat, requester_lon, donor_lat, donor_lon, capacity)
+    assert total(match, km, hazard) <= best + 1e-9
+
+
+def test_requesters_without_a_position_or_donor_in_reach():
+    match, km = match_requesters(np.array([40.0, np.nan, 10.0]), np.array([-74.0, -74.0, -74.0]),
+        np.array([40.1]), np.array([-74.1]), capacity=5, max_km=MAX_KM)
+    assert match.tolist() == [0, -1, -1]
+    assert np.isinf(km[1:]).all()
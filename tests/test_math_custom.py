@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+from math_custom import distance, haversine, points_index, closest, k5_closest, k10_closest
+
+
+def points(n, seed=0):
+    rng = np.random.RandomState(seed)
+    return [{'name': str(i), 'lat': lat, 'lon': lon}
+        for i, (lat, lon) in enumerate(zip(rng.uniform(25, 49, n), rng.uniform(-124, -67, n)))]
+
+
+def brute_force(data, v, k):
+    return sorted(data, key=lambda p: distance(v['lat'], v['lon'], p['lat'], p['lon']))[:k]
+
+
+def test_haversine_matches_distance():
+    data = points(50)
+    km = haversine(40.71, -74.01, [p['lat'] for p in data], [p['lon'] for p in data])
+    np.testing.assert_allclose(km, [distance(40.71, -74.01, p['lat'], p['lon']) for p in data], rtol=1e-9)
+
+
+@pytest.mark.parametrize('n', [3, 200])
+def test_k_closest_matches_brute_force(n):
+    data = points(n)
+    index = points_index(data)
+    for v in points(20, seed=1):
+        assert closest(data, v) == brute_force(data, v, 1)[0]
+        assert k5_closest(data, v) == brute_force(data, v, 5)
+        # an index held by the caller gives the same answers
+        assert k5_closest(data, v, index) == brute_force(data, v, 5)
+        assert k10_closest(data, v, index) == brute_force(data, v, 10)
+
+
+def test_closest_of_no_points():
+    assert k5_closest([], {'lat': 40.0, 'lon': -74.0}) == []
+    with pytest.raises(ValueError):
+        closest([], {'lat': 40.0, 'lon': -74.0})
@@ -0,0 +1,50 @@
+import os
+import pytest
+import benchmark
+import checkpoint
+import download_cache
+import zip_lookup
+from create_figures import create_configs, build_pipeline
+from data_download import download_zip_to_fips_data
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+
+
+@pytest.mark.parametrize('repeated_fips', [False, True])
+def test_create_figures_runs_offline_on_the_benchmark_fixtures(repeated_fips, tmp_path, monkeypatch, capsys):
+    # create_figures runs in src and writes the maps to ../img
+    os.makedirs(str(tmp_path / 'src'))
+    os.makedirs(str(tmp_path / 'img'))
+    fixtures = benchmark.synthetic_fixtures(1000, repeated_fips=repeated_fips)
+    monkeypatch.setattr(download_cache, 'default_cache', download_cache.default_cache)
+    benchmark.serve_fixtures(fixtures, str(tmp_path / 'cache'))
+    monkeypatch.setattr(checkpoint, 'default_store', checkpoint.default_store)
+    checkpoint.configure(checkpoint_dir=str(tmp_path / 'checkpoints'))
+
+    config = create_configs(os.path.join(SRC, 'config.ini'))
+    urls = benchmark.FIXTURE_URLS
+    config['viz'].update({
+        'ideo_url': urls['ideo'],
+        'ny_times_county_data_url': urls['nytimes'],
+        'hospital_download_url': urls['hospital'],
+        'geojson_url': urls['county_geojson'],
+        'county_fips_download_url': urls['county_fips'],
+        'zip_lat_lon_url': urls['zip_lat_lon'],
+        'ny_times_covid_date': fixtures['nytimes_date'],
+        'animation_days': '5',
+    })
+    # the zip to fips sheet has no url in config.ini, so the table is built beforehand
+    zip_lookup.build_zip_lookup_table(download_zip_to_fips_data(urls['zip_to_fips']),
+        urls['zip_lat_lon'], str(tmp_path / 'src' / 'zip_table.npz'))
+    monkeypatch.chdir(str(tmp_path / 'src'))
+
+    build_pipeline(config).run()
+    maps = sorted(os.listdir(str(tmp_path / 'img')))
+    assert 'PPE_Requests_By_County.html' in maps
+    assert 'COVID19_Cases_Per_County_Animated_%s.html' % fixtures['nytimes_date'] in maps
+    assert checkpoint.default_store.latest('merged_covid_ppe_hosp_df') is not None
+    assert 'Recomputing 3234 of 3234 counties.' in capsys.readouterr().out
+
+    # the second run reuses the results of every county
+    build_pipeline(config).run()
+    assert 'Recomputing 0 of 3234 counties.' in capsys.readouterr().out
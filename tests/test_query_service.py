@@ -0,0 +1,86 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+import pandas as pd
+import pytest
+from checkpoint import checkpoint_store
+from query_service import serve
+from schema import to_fips
+
+
+@pytest.fixture(scope='module')
+def service(tmp_path_factory):
+    store = checkpoint_store(str(tmp_path_factory.mktemp('checkpoints')))
+    requesters = pd.DataFrame({
+        'institution': ['Clinic A', 'Clinic B', 'Clinic C'],
+        'need': ['N95 masks', 'Gowns', 'N95 masks, gloves'],
+        'lat': [40.71, 40.75, 34.05],
+        'lon': [-74.01, -73.99, -118.24],
+        'fips': ['36061', '36061', '06037'],
+    })
+    requesters['fips'] = to_fips(requesters['fips'])
+    counties = pd.DataFrame({'fips': ['36061', '06037'], 'county': ['New York', 'Los Angeles'],
+        'cases': [2000, 500], 'BEDS': [1500, 900]})
+    counties['fips'] = to_fips(counties['fips'])
+    donors = pd.DataFrame({'Name': ['Donor 0'], 'lat': [40.72], 'lon': [-74.0]})
+    store.write('requestor_df', requesters)
+    store.write('merged_covid_ppe_hosp_df', counties)
+    store.write('ppe_donors_with_zip_df', donors)
+
+    service, server = serve(port=0, store=store)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield 'http://127.0.0.1:%d' % server.server_port
+    server.shutdown()
+    server.server_close()
+
+
+def request(url, method='GET'):
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, method=method)) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_queries(service):
+    status, body = request(service + '/status')
+    assert status == 200
+    assert (body['requesters'], body['donors'], body['counties']) == (3, 1, 2)
+
+    status, body = request(service + '/requesters/nearest?lat=40.71&lon=-74.01&k=2&need=n95')
+    assert status == 200
+    assert [r['institution'] for r in body] == ['Clinic A', 'Clinic C']
+    assert body[0]['distance_km'] == 0
+
+    status, body = request(service + '/requesters/nearest?donor=0&k=1')
+    assert (status, body[0]['institution']) == (200, 'Clinic A')
+
+    status, body = request(service + '/requesters/bbox?south=40&west=-75&north=41&east=-73')
+    assert (status, len(body)) == (200, 2)
+
+    status, body = request(service + '/county/6037')
+    assert (status, body['county'], body['requesters']) == (200, 'Los Angeles', 1)
+
+    status, body = request(service + '/reload', method='POST')
+    assert (status, body['counties']) == (200, 2)
+
+
+@pytest.mark.parametrize('path, status', [
+    ('/requesters/nearest?lon=-74', 400),
+    ('/requesters/nearest?lat=north&lon=-74', 400),
+    ('/requesters/nearest?lat=nan&lon=-74', 400),
+    ('/requesters/nearest?lat=40&lon=-74&k=0', 400),
+    ('/donors/nearest?lat=40&lon=-74&need=N95', 400),
+    ('/requesters/nearest?donor=7', 404),
+    ('/county/99999', 404),
+    ('/unknown', 404),
+])
+def test_status_codes(service, path, status):
+    code, body = request(service + path)
+    assert code == status
+    assert 'error' in body
+
+
+def test_unknown_command(service):
+    assert request(service + '/restart', method='POST')[0] == 404
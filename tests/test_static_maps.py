@@ -0,0 +1,19 @@
+import numpy as np
+from static_maps import projected_counties
+
+
+def counties(ids):
+    # outlines are not needed to align values
+    return projected_counties(np.array(ids), np.empty((0, 2), dtype=np.float32),
+        np.empty(0, dtype=np.uint8), np.zeros(len(ids) + 1, dtype=np.int64))
+
+
+def test_align_orders_values_by_county():
+    z = counties(['01001', '06037', '36061']).align(['36061', '01001', '99999'], [3, 1, 9])
+    np.testing.assert_array_equal(z, np.array([1, np.nan, 3], dtype=np.float32))
+
+
+def test_align_with_repeated_locations():
+    # a fips joined to two covid rows comes twice, and the county geojson repeats 29095
+    z = counties(['29095', '01001', '29095']).align(['29095', '01001', '29095'], [5, 'x', 7])
+    np.testing.assert_array_equal(z, np.array([5, np.nan, 5], dtype=np.float32))
@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+import pytest
+from timeseries import county_cube
+
+
+def cube(n_days=20, seed=0):
+    rng = np.random.RandomState(seed)
+    cases = np.cumsum(rng.poisson(5, size=(3, n_days)), axis=1)
+    return county_cube(['01001', '06037', '36061'], pd.date_range('2020-04-01', periods=n_days),
+        cases, cases // 10)
+
+
+@pytest.mark.parametrize('window', [1, 3, 7, 30])
+def test_rolling_mean_matches_pandas(window):
+    c = cube()
+    daily = pd.DataFrame(c.cases.T).diff().fillna(pd.DataFrame(c.cases.T))
+    expected = daily.rolling(window, min_periods=1).mean().to_numpy().T
+    np.testing.assert_allclose(c.rolling_mean('cases', window), expected, rtol=1e-6)
+    assert c.rolling_mean('cases', window).shape == c.cases.shape
+
+
+def test_window_counts_earlier_cases_on_its_first_day():
+    # the first day of a window counts everything reported up to it as new
+    c = cube()
+    window = c.window('2020-04-10', '2020-04-14')
+    assert list(window.dates) == list(pd.date_range('2020-04-10', '2020-04-14'))
+    np.testing.assert_array_equal(window.daily()[:, 0], c.cases[:, 9])
+    np.testing.assert_allclose(window.rolling_mean('cases', 3)[:, 2], c.daily()[:, 9:12].mean(axis=1)
+        + (c.cases[:, 8] / 3), rtol=1e-6)
+
+
+def test_reindex_and_on():
+    c = cube().reindex(['36061', '72001', '01001'])
+    day = c.on('2020-04-05')
+    assert day['fips'].tolist() == ['36061', '72001', '01001']
+    assert day['cases'].tolist()[1] == 0
+    np.testing.assert_array_equal(c.cases[0], cube().cases[2])
@@ -0,0 +1,61 @@
+import io
+import zipfile
+import numpy as np
+import pandas as pd
+import pytest
+from zip_lookup import zip_lookup_table, read_geonames_zips, load_zip_lookup_table
+
+ZIP_FIPS_DF = pd.DataFrame({
+    'zip': [501, 10001, 10001, 90012],
+    'fips': [36103, 36061, 36047, 6037],
+    'county': ['Suffolk', 'New York', 'Kings', 'Los Angeles'],
+    'state': ['NY', 'NY', 'NY', 'CA'],
+})
+GEONAMES = ('US\t00501\tHoltsville\tNew York\tNY\tSuffolk\t103\t\t\t40.8154\t-73.0451\t4\n'
+    'US\t90012\tLos Angeles\tCalifornia\tCA\tLos Angeles\t037\t\t\t34.0614\t-118.2385\t4\n')
+
+
+def table():
+    return zip_lookup_table.from_frames(ZIP_FIPS_DF, read_geonames_zips(GEONAMES.encode()))
+
+
+def test_lookup():
+    info = table().lookup(pd.Series(['00501', '10001', '90012', '99999', None, 'abc'], index=list('abcdef')))
+    assert list(info.index) == list('abcdef')
+    assert info['fips'].astype(str).tolist()[:3] == ['36103', '36061', '06037']
+    assert info['fips'].isna().tolist() == [False, False, False, True, True, True]
+    # zip codes in several counties keep the first county of the sheet
+    assert info['county'].tolist()[:3] == ['Suffolk', 'New York', 'Los Angeles']
+    assert info['state'].tolist()[:3] == ['NY', 'NY', 'CA']
+    assert info['lat'].tolist()[0] == pytest.approx(40.8154)
+    # no coordinates for 10001
+    assert np.isnan(info['lat'].tolist()[1])
+
+
+def test_numbers_and_zipped_geonames():
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w') as f:
+        f.writestr('readme.txt', 'about')
+        f.writestr('US.txt', GEONAMES)
+    coordinates = read_geonames_zips(archive.getvalue())
+    assert coordinates['zip'].tolist() == ['00501', '90012']
+    info = zip_lookup_table.from_frames(ZIP_FIPS_DF, coordinates).lookup(pd.Series([501, 90012.0]))
+    assert info['fips'].astype(str).tolist() == ['36103', '06037']
+    assert info['lon'].tolist()[1] == pytest.approx(-118.2385)
+
+
+def test_save_and_load(tmp_path):
+    path = str(tmp_path / 'zip_table.npz')
+    table().save(path)
+    zips = pd.Series(['00501', '10001', '90012', '99999'])
+    pd.testing.assert_frame_equal(load_zip_lookup_table(path).lookup(zips), table().lookup(zips))
+
+
+def test_load_without_a_table_or_data_to_build_it(tmp_path):
+    with pytest.raises(ValueError):
+        load_zip_lookup_table(str(tmp_path / 'zip_table.npz'))
+    # built from the sheet, returned by a function, the first time
+    path = str(tmp_path / 'zip_table.npz')
+    built = load_zip_lookup_table(path, lambda: ZIP_FIPS_DF)
+    assert built.lookup(pd.Series(['10001']))['fips'].astype(str).tolist() == ['36061']
+    assert load_zip_lookup_table(path).lookup(pd.Series(['10001']))['county'].tolist() == ['New York']